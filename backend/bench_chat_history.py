@@ -0,0 +1,52 @@
+"""
+Benchmark: chat prompt size and windowing cost vs. conversation length.
+
+Builds synthetic multimodal conversations (mixed Chinese/English turns, an image every
+few user turns) and reports estimated prompt tokens before/after apply_token_budget,
+plus the time spent in the budgeting stage itself.
+
+Usage: python bench_chat_history.py
+"""
+import time
+
+from services.chat_history import apply_token_budget, estimate_messages_tokens, DEFAULT_TOKEN_BUDGET
+
+SYSTEM_PROMPT = "You are a Fashion Design Copilot. Always answer the user in Chinese (Simplified Chinese)."
+
+USER_TEXT = "Design a relaxed linen summer dress with a sage green palette and natural light. 请给出面料建议。"
+ASSISTANT_TEXT = "好的，这里是一个亚麻夏季连衣裙的设计方案：采用鼠尾草绿色调，宽松廓形，搭配自然光拍摄。" * 3
+
+
+def build_conversation(turns: int):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for i in range(turns):
+        if i % 4 == 0:
+            messages.append({"role": "user", "content": [
+                {"type": "text", "text": USER_TEXT},
+                {"type": "image_url", "image_url": {"url": f"https://cdn.example.com/chat/{i}.png"}},
+            ]})
+        else:
+            messages.append({"role": "user", "content": USER_TEXT})
+        messages.append({"role": "assistant", "content": ASSISTANT_TEXT})
+    messages.append({"role": "user", "content": USER_TEXT})
+    return messages
+
+
+def run(turns: int, iterations: int = 50):
+    messages = build_conversation(turns)
+    before = estimate_messages_tokens(messages)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = apply_token_budget(list(messages))
+    elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    after = estimate_messages_tokens(result)
+    print(f"{turns:>6} turns | {len(messages):>6} msgs | tokens {before:>9} -> {after:>6} "
+          f"| kept {len(result):>4} msgs | {elapsed_ms:8.3f} ms/call")
+
+
+if __name__ == "__main__":
+    print(f"Token budget: {DEFAULT_TOKEN_BUDGET}")
+    for turns in (5, 20, 50, 100, 250, 500, 1000, 2500):
+        run(turns)
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark: chat message normalization on large multimodal histories.
+
+Compares the previous chat_endpoint flow (parse into processed_messages, re-parse into
+temp_messages, merge in place, json.dumps the payload for a debug print) with the
+single-pass services.chat_messages pipeline, and times the Gemini formatting pass.
+
+Usage: python bench_chat_messages.py
+"""
+import asyncio
+import base64
+import json
+import time
+from types import SimpleNamespace
+
+from services.chat_messages import normalize_messages, to_openai_messages, to_gemini_contents
+
+SYSTEM_PROMPT = "You are a Fashion Design Copilot."
+# ~200 KB image payload, typical of a canvas screenshot after R2 offload is skipped
+DATA_URI = "data:image/png;base64," + base64.b64encode(b"\x89PNG" + b"\x00" * 150_000).decode()
+
+
+def build_history(turns: int, image_every: int = 3):
+    messages = []
+    for i in range(turns):
+        text = f"Turn {i}: design a linen jacket with sage green tones and soft natural light."
+        if i % image_every == 0:
+            text += f"\n[IMAGE]{DATA_URI}[/IMAGE]"
+        messages.append(SimpleNamespace(role="user", content=text))
+        messages.append(SimpleNamespace(role="assistant", content=f"Here is design {i}: " + "details " * 40))
+    return messages
+
+
+def _legacy_parse(raw_messages):
+    out = []
+    for m in raw_messages:
+        content = m.content if isinstance(m.content, str) else str(m.content or "")
+        if "[IMAGE]" in content and "[/IMAGE]" in content:
+            parts = content.split("[IMAGE]")
+            text_part = parts[0].strip()
+            image_part = parts[1].split("[/IMAGE]")[0].strip()
+            new_content = [{"type": "text", "text": str(text_part) if text_part else " "}]
+            if image_part:
+                new_content.append({"type": "image_url", "image_url": {"url": str(image_part)}})
+            out.append({"role": m.role, "content": new_content})
+        elif content and content.strip():
+            out.append({"role": m.role, "content": str(content).strip()})
+    return out
+
+
+def legacy_pipeline(raw_messages):
+    processed = [{"role": "system", "content": SYSTEM_PROMPT}] + _legacy_parse(raw_messages)
+    temp = _legacy_parse(raw_messages)
+    merged = []
+    first = temp[0]
+    first["content"][0]["text"] = SYSTEM_PROMPT + "\n\n" + first["content"][0]["text"]
+    for msg in temp:
+        if not merged:
+            merged.append(msg)
+            continue
+        last = merged[-1]
+        if last["role"] == msg["role"]:
+            last["content"] += "\n\n" + msg["content"]
+        else:
+            merged.append(msg)
+    json.dumps(merged, default=str)
+    return processed, merged
+
+
+def new_pipeline(raw_messages):
+    messages = normalize_messages(raw_messages)
+    return to_openai_messages(messages, SYSTEM_PROMPT)
+
+
+def timeit(fn, *args, iterations=20):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(*args)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+async def gemini_pass(messages):
+    return await to_gemini_contents(messages, SYSTEM_PROMPT)
+
+
+if __name__ == "__main__":
+    print(f"{'turns':>6} | {'legacy ms':>10} | {'single-pass ms':>14} | {'speedup':>7} | {'gemini ms':>9}")
+    for turns in (10, 50, 100, 250):
+        raw = build_history(turns)
+        legacy_ms = timeit(legacy_pipeline, raw)
+        new_ms = timeit(new_pipeline, raw)
+        canonical = normalize_messages(raw)
+        start = time.perf_counter()
+        asyncio.run(gemini_pass(canonical))
+        gemini_ms = (time.perf_counter() - start) * 1000
+        print(f"{turns:>6} | {legacy_ms:>10.2f} | {new_ms:>14.2f} | {legacy_ms / new_ms:>6.1f}x | {gemini_ms:>9.2f}")
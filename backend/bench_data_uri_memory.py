@@ -0,0 +1,101 @@
+"""
+Benchmark: peak memory per generation for base64 data-URI outputs (OpenRouter image models).
+
+Starting from the data URI string the provider returned, each path is measured with
+tracemalloc (peak Python allocations above the string itself) and wall time:
+- before: split the URI, base64.b64decode the payload, put_object the bytes
+- after:  GeneratedAsset.from_url (chunked decode into a spooled temp file) and
+          storage.upload_asset_to_r2 (upload_fileobj)
+R2 is replaced by a local stand-in that consumes the body the way boto3 does (put_object
+takes the bytes, upload_fileobj streams a seekable file in blocks), so nothing leaves the machine.
+
+Usage: python bench_data_uri_memory.py [--mb 2 8 16] [--runs 3]
+"""
+import argparse
+import base64
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("R2_BUCKET_NAME", "bench")
+os.environ.setdefault("R2_PUBLIC_DOMAIN", "https://r2.bench")
+os.environ.setdefault("LOG_FILE", "")
+
+from providers.base import GeneratedAsset
+from services import storage
+from services.clients import clients
+from utils.data_uri import DATA_URI_SPOOL_MAX_BYTES
+
+READ_SIZE = 1024 * 1024
+
+
+class LocalS3:
+    """Stands in for the boto3 S3 client; only counts what it receives."""
+
+    def __init__(self):
+        self.received = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.received = len(Body)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.received = 0
+        while True:
+            part = Fileobj.read(READ_SIZE)
+            if not part:
+                return
+            self.received += len(part)
+
+
+def before(uri: str, s3: LocalS3):
+    header, encoded = uri.split(",", 1)
+    content_type = header.split(":")[1].split(";")[0]
+    s3.put_object(Bucket="bench", Key="before.png", Body=base64.b64decode(encoded), ContentType=content_type)
+
+
+def after(uri: str, s3: LocalS3):
+    storage.upload_asset_to_r2(GeneratedAsset.from_url(uri), "bench")
+
+
+def measure(path, uri: str, s3: LocalS3, expected: int) -> tuple:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    path(uri, s3)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    if s3.received != expected:
+        raise RuntimeError(f"{path.__name__}: uploaded {s3.received} bytes, expected {expected}")
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, nargs="+", default=[2, 8, 16], help="decoded image sizes")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    s3 = LocalS3()
+    clients.override("s3", s3)
+    print(f"spooled in memory up to {DATA_URI_SPOOL_MAX_BYTES / 2**20:.1f} MB (DATA_URI_SPOOL_MAX_BYTES)")
+    print(f"{'image':>8} {'data URI':>9}   {'before peak':>11} {'after peak':>11}   {'before':>9} {'after':>9}")
+    for mb in args.mb:
+        size = int(mb * 2**20)
+        uri = "data:image/png;base64," + base64.b64encode(os.urandom(size)).decode("ascii")
+        results = {"before": [], "after": []}
+        for _ in range(args.runs):
+            for name, path in (("before", before), ("after", after)):
+                results[name].append(measure(path, uri, s3, size))
+        peak = {name: max(p for p, _ in runs) / 2**20 for name, runs in results.items()}
+        ms = {name: statistics.median(t for _, t in runs) * 1000 for name, runs in results.items()}
+        print(
+            f"{mb:>6.1f}MB {len(uri) / 2**20:>7.1f}MB   {peak['before']:>9.1f}MB {peak['after']:>9.1f}MB   "
+            f"{ms['before']:>7.1f}ms {ms['after']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: per-request logging overhead on the calling (event loop) thread.
+
+Replays the debug output of one image request - /generate (4 appends to debug_gen.log),
+openrouter_service.generate_image (4 appends + 6 prints) and chat_endpoint (12 prints) -
+the old way (open/append/close + print per line) and through the queue-based logger
+with DEBUG disabled (the default) and enabled. With DEBUG on, the formatting and writing
+done by the listener thread is reported separately.
+
+Usage: python bench_logging.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+LOG_DIR = tempfile.mkdtemp()
+os.environ.setdefault("LOG_FILE", os.path.join(LOG_DIR, "backend.log"))
+os.environ.setdefault("LOG_QUEUE_SIZE", "1000000")
+
+# Both variants write their console output to /dev/null
+_stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+from utils.logger import get_logger, queue_handler, queue_listener
+sys.stdout = _stdout
+
+DEBUG_LOG = os.path.join(LOG_DIR, "debug_gen.log")
+RAW_RESPONSE = "ChatCompletion(id='gen-123', choices=[Choice(message=ChatCompletionMessage(content='...'))])" * 12
+FILE_LINES = [
+    "API: Received /generate request\nUser: 7f3c, Prompt: linen summer dress with sage green palette..., Model ID: flux-pro\n",
+    "credits reserved: 4\n",
+    "DB Insert Response: [{'id': '5d1e', 'status': 'PENDING', 'slug': 'linen-summer-dress-1a2b3c'}]\n",
+    "Service: generate_image called with model=black-forest-labs/flux, n=1\n",
+    "DEBUG: Standard Image API failed: 404, trying chat\n",
+    f"DEBUG: RAW CHAT RESPONSE (Truncated): {RAW_RESPONSE[:1000]}... [TRUNCATED]\n",
+    "DEBUG: Found images in response: Len: 1\n",
+]
+PRINT_LINES = [f"DEBUG: chat/openrouter debug line {i}: model=z-ai/glm-4.5-air messages=14" for i in range(18)]
+
+
+def legacy_request(stdout):
+    for line in FILE_LINES:
+        with open(DEBUG_LOG, "a") as f:
+            f.write(line)
+    for line in PRINT_LINES:
+        print(line, file=stdout)
+
+
+def structured_request(log):
+    for line in FILE_LINES:
+        log.debug(line.rstrip("\n"), extra={"user_id": "7f3c", "model": "black-forest-labs/flux"})
+    for line in PRINT_LINES:
+        log.debug(line)
+
+
+def run(label, fn, *args, requests=5000):
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn(*args)
+    per_request_us = (time.perf_counter() - start) * 1e6 / requests
+    print(f"{label:<32} {per_request_us:9.1f} us/request on the calling thread")
+    return per_request_us
+
+
+if __name__ == "__main__":
+    log = get_logger("routers.generate")
+    with open(os.devnull, "w") as devnull:
+        legacy = run("legacy open/append + print", legacy_request, devnull)
+
+    log.setLevel(logging.INFO)
+    disabled = run("queue logger, DEBUG off", structured_request, log)
+
+    # DEBUG on: pause the listener so the calling-thread cost and the off-thread
+    # formatting/writing cost are measured separately (they share the GIL)
+    log.setLevel(logging.DEBUG)
+    queue_listener.stop()
+    enabled = run("queue logger, DEBUG on", structured_request, log)
+    drain_start = time.perf_counter()
+    queue_listener.start()
+    queue_handler.queue.join()
+    listener_us = (time.perf_counter() - drain_start) * 1e6 / 5000
+    print(f"{'  + listener thread (off-loop)':<32} {listener_us:9.1f} us/request, dropped {queue_handler.dropped}")
+
+    print(f"event loop time saved per request: {legacy - disabled:.1f} us (DEBUG off), {legacy - enabled:.1f} us (DEBUG on)")
@@ -0,0 +1,100 @@
+"""
+Benchmark: search index build time, memory footprint and query latency vs. corpus size.
+
+Builds synthetic prompt corpora (Zipf-Mandelbrot distributed vocabulary, 8-40 words per
+document, some Chinese) and reports index build time, memory (peak RSS growth), and p50/p99
+latency for full-word queries, search-as-you-type prefix queries and incremental updates.
+
+Usage: python bench_search_index.py [max_docs]   (default 1000000)
+"""
+import itertools
+import random
+import resource
+import statistics
+import sys
+import time
+import uuid
+
+from services.search_index import InvertedIndex, KIND_GENERATION, KIND_PROMPT
+
+SEED_WORDS = (
+    "linen silk cotton denim wool leather velvet satin chiffon tweed dress jacket coat skirt blouse trousers "
+    "gown shirt hoodie cardigan vintage minimalist oversized tailored pleated floral striped plaid embroidered "
+    "sage green ivory black crimson navy pastel neon beige editorial runway studio street natural light "
+    "soft shadow golden hour portrait model pose fabric texture pattern seamless print summer winter autumn"
+).split()
+CJK_PHRASES = ["亚麻连衣裙", "丝绸衬衫", "复古风格", "自然光拍摄", "面料纹理"]
+
+
+def build_vocabulary(size: int, rng: random.Random):
+    words = list(SEED_WORDS)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    while len(words) < size:
+        words.append("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    # Zipf-Mandelbrot weights (stopwords are already removed): the most common term
+    # appears in roughly a quarter of the documents, with a long tail of rare ones
+    cum_weights = list(itertools.accumulate(1 / (rank + 10) for rank in range(len(words))))
+    return words, cum_weights
+
+
+def make_documents(count: int, rng: random.Random):
+    words, cum_weights = build_vocabulary(50_000, rng)
+    docs = []
+    for i in range(count):
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(8, 40)))
+        if i % 10 == 0:
+            text += " " + rng.choice(CJK_PHRASES)
+        docs.append((KIND_PROMPT if i % 20 == 0 else KIND_GENERATION, str(uuid.UUID(int=rng.getrandbits(128))), text))
+    return docs, words
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), percentile(samples, 99)
+
+
+def run(count: int, rng: random.Random):
+    docs, words = make_documents(count, rng)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index = InvertedIndex()
+    for kind, doc_id, text in docs:
+        index.add(kind, doc_id, text)
+    index._sorted_vocab()
+    build_s = time.perf_counter() - start
+    # Peak RSS growth (KB on Linux); runs go smallest first so each one raises the peak
+    memory_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    head, tail = words[:200], words[200:20_000]
+    word_queries = [
+        (" ".join(rng.sample(head, 1) + rng.sample(tail, rng.randint(0, 2))), 20, (KIND_PROMPT, KIND_GENERATION), False)
+        for _ in range(200)
+    ]
+    prefix_queries = [(rng.choice(head) + " " + rng.choice(tail)[:3], 20) for _ in range(200)]
+    updates = [(KIND_GENERATION, doc_id, text + " restyled") for kind, doc_id, text in rng.sample(docs, 200)]
+
+    query_p50, query_p99 = timed(index.search, word_queries)
+    prefix_p50, prefix_p99 = timed(index.search, prefix_queries)
+    update_p50, update_p99 = timed(index.add, updates)
+
+    stats = index.stats()
+    print(f"{count:>8} docs | {stats['terms']:>6} terms | {stats['postings']:>9} postings | build {build_s:6.1f}s "
+          f"| mem {memory_mb:7.1f} MB | query p50 {query_p50:6.2f} p99 {query_p99:7.2f} ms "
+          f"| prefix p50 {prefix_p50:6.2f} p99 {prefix_p99:7.2f} ms | update p99 {update_p99:5.3f} ms")
+
+
+if __name__ == "__main__":
+    max_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for count in (10_000, 100_000, 1_000_000):
+        if count <= max_docs:
+            run(count, random.Random(42))
@@ -0,0 +1,514 @@
+"""
+Fake Upstreams
+One local server standing in for every service the backend calls, so load tests never touch
+live APIs or spend credits:
+- /rest/v1/...        PostgREST (in-memory tables, eq/neq/gt/lt/in/is/or filters, order,
+                      limit/offset, count, single-object responses, upserts, the credit RPCs)
+- /s3/<bucket>/...    S3/R2 (PutObject and multipart uploads; bodies are discarded)
+- /media/<name>       generated files handed out by the fake providers (size via ?bytes=)
+- /openai/v1, /openrouter/v1   OpenAI-compatible chat completions (streamed or not)
+- /fal, /replicate, /gemini    endpoints behind the SDK shims in loadtest.app_server
+Every service has a configurable latency (mean seconds, log-normal jitter) and error rate,
+e.g. --latency fal=2.0,postgrest=0.02 --errors fal=0.05. GET /__fake/stats reports
+per-service counts and the end-to-end latency of generations (insert -> COMPLETED/FAILED).
+
+    python -m loadtest.fakes --port 9100 --latency fal=1.5 --errors replicate=0.1
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+DEFAULT_LATENCY = {
+    "postgrest": 0.015,
+    "s3": 0.04,
+    "media": 0.03,
+    "openai": 0.4,        # time to first token
+    "openrouter": 0.6,
+    "gemini": 0.4,
+    "token": 0.015,       # delay between streamed tokens
+    "fal": 2.0,           # submit -> result ready
+    "replicate": 4.0,
+}
+JITTER = 0.3  # sigma of the log-normal latency multiplier (mean stays at the configured value)
+STREAM_TOKENS = 40
+
+BENCH_USERS = 500
+BENCH_CREDITS = 10 ** 9
+
+# Seeded models; ids are stable so scenario drivers can reference them
+SEED_MODELS = [
+    {"id": "00000000-0000-4000-8000-000000000001", "name": "Bench Flux", "type": "IMAGE", "provider": "FAL",
+     "api_path": "fal-ai/flux/dev", "cost_per_gen": 4},
+    {"id": "00000000-0000-4000-8000-000000000002", "name": "Bench SDXL", "type": "IMAGE", "provider": "REPLICATE",
+     "api_path": "stability-ai/sdxl", "cost_per_gen": 4},
+    {"id": "00000000-0000-4000-8000-000000000003", "name": "Bench Gemini Image", "type": "IMAGE", "provider": "OPENROUTER",
+     "api_path": "google/gemini-2.5-flash-image", "cost_per_gen": 4},
+    {"id": "00000000-0000-4000-8000-000000000004", "name": "Bench Video", "type": "VIDEO", "provider": "FAL",
+     "api_path": "fal-ai/kling-video", "cost_per_gen": 160},
+    {"id": "00000000-0000-4000-8000-000000000011", "name": "Bench GPT", "type": "CHAT", "provider": "OPENAI",
+     "api_path": "gpt-4o-mini", "cost_per_gen": 0},
+    {"id": "00000000-0000-4000-8000-000000000012", "name": "Bench OpenRouter", "type": "CHAT", "provider": "OPENROUTER",
+     "api_path": "openai/gpt-4o-mini", "cost_per_gen": 0},
+    {"id": "00000000-0000-4000-8000-000000000013", "name": "Bench Gemini", "type": "CHAT", "provider": "GOOGLE",
+     "api_path": "models/gemini-2.0-flash", "cost_per_gen": 0},
+]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_pairs(value: str, cast=float) -> Dict[str, float]:
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            pairs[name.strip()] = cast(setting)
+    return pairs
+
+
+class FakeConfig:
+    def __init__(self, latency: Dict[str, float], errors: Dict[str, float]):
+        self.latency = {**DEFAULT_LATENCY, **latency}
+        self.errors = errors
+
+    def delay(self, service: str) -> float:
+        mean = self.latency.get(service, 0.0)
+        if mean <= 0:
+            return 0.0
+        return mean * random.lognormvariate(0, JITTER) / math.exp(JITTER ** 2 / 2)
+
+    def fails(self, service: str) -> bool:
+        return random.random() < self.errors.get(service, 0.0)
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes_uploaded = 0
+        self.generation_started: Dict[str, float] = {}
+        self.generation_done: List[tuple] = []  # (seconds, status)
+
+    def as_dict(self) -> dict:
+        done = sorted(d for d, _ in self.generation_done)
+
+        def pct(p):
+            return round(done[min(len(done) - 1, int(p * len(done)))] * 1000, 1) if done else None
+
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "bytes_uploaded": self.bytes_uploaded,
+            "generations": {
+                "pending": len(self.generation_started),
+                "completed": sum(1 for _, s in self.generation_done if s == "COMPLETED"),
+                "failed": sum(1 for _, s in self.generation_done if s == "FAILED"),
+                "e2e_p50_ms": pct(0.50),
+                "e2e_p95_ms": pct(0.95),
+                "e2e_p99_ms": pct(0.99),
+            },
+        }
+
+
+# ============================================
+# PostgREST
+# ============================================
+
+def _split_top_level(value: str) -> List[str]:
+    parts, depth, current, quoted = [], 0, "", False
+    for ch in value:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _as_text(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _match(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, operand = expression.partition(".")
+    operand = operand.strip('"')
+    value = row.get(column)
+    text = _as_text(value)
+    if op == "eq":
+        result = text == operand
+    elif op == "neq":
+        result = text != operand
+    elif op == "is":
+        result = text == operand
+    elif op == "in":
+        result = text in [v.strip().strip('"') for v in operand.strip("()").split(",")]
+    elif op in ("gt", "gte", "lt", "lte"):
+        if value is None:
+            result = False
+        else:
+            try:
+                left, right = float(value), float(operand)
+            except (TypeError, ValueError):
+                left, right = text, operand
+            result = {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+    elif op in ("like", "ilike"):
+        pattern = re.escape(operand).replace(r"\*", ".*").replace("%", ".*")
+        result = re.fullmatch(pattern, text, re.IGNORECASE if op == "ilike" else 0) is not None
+    else:
+        result = True  # unsupported operators don't filter
+    return not result if negate else result
+
+
+def _match_logic(row: dict, op: str, body: str) -> bool:
+    results = []
+    for term in _split_top_level(body.strip()[1:-1]):
+        if term.startswith(("and(", "or(")):
+            inner_op, inner = term.split("(", 1)
+            results.append(_match_logic(row, inner_op, "(" + inner))
+        else:
+            column, _, expression = term.partition(".")
+            results.append(_match(row, column, expression))
+    return all(results) if op == "and" else any(results)
+
+
+class FakePostgrest:
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+        self.reservations: Dict[str, dict] = {}
+        self._seed()
+
+    def _seed(self):
+        now = _now_iso()
+        for model in SEED_MODELS:
+            self.tables["ai_models"].append({**model, "is_active": True, "created_at": now, "parameters_schema": None})
+        for i in range(BENCH_USERS):
+            self.tables["profiles"].append({
+                "id": f"bench-user-{i}", "username": f"bench{i}", "avatar_url": None,
+                "credits": BENCH_CREDITS, "tier_level": 0, "created_at": now,
+            })
+        # Load tests must not trip the per-user rate limits
+        self.tables["system_settings"].append({"key": "rate_limits", "value": {"enabled": False}})
+
+    def query(self, table: str, params) -> List[dict]:
+        rows = self.tables.get(table, [])
+        filters = [(k, v) for k, v in params.multi_items() if k not in ("select", "order", "limit", "offset", "on_conflict", "columns")]
+        for key, value in filters:
+            if key in ("or", "and"):
+                rows = [r for r in rows if _match_logic(r, key, value)]
+            else:
+                rows = [r for r in rows if _match(r, key, value)]
+        order = params.get("order")
+        if order:
+            for term in reversed(order.split(",")):
+                column, *flags = term.split(".")
+                rows = sorted(rows, key=lambda r: (r.get(column) is None, _as_text(r.get(column))), reverse="desc" in flags)
+        offset = int(params.get("offset") or 0)
+        limit = params.get("limit")
+        return rows[offset:offset + int(limit)] if limit else rows[offset:]
+
+    @staticmethod
+    def project(rows: List[dict], select: Optional[str]) -> List[dict]:
+        if not select or select.strip() == "*" or "*" in _split_top_level(select.replace(" ", "")):
+            return rows
+        columns = [c for c in _split_top_level(select.replace(" ", "")) if "(" not in c]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    def rpc(self, name: str, args: dict):
+        if name == "reserve_user_credits":
+            reservation_id = str(uuid.uuid4())
+            self.reservations[reservation_id] = args
+            return reservation_id
+        if name == "release_credit_reservation":
+            return self.reservations.pop(args.get("p_reservation_id"), None) is not None
+        if name == "commit_credit_reservations":
+            for commit in args.get("p_commits") or []:
+                self.reservations.pop(commit.get("reservation_id"), None)
+            return None
+        if name == "release_expired_credit_reservations":
+            return []
+        return None
+
+
+# ============================================
+# App
+# ============================================
+
+def build_app(config: FakeConfig) -> Starlette:
+    stats = Stats()
+    db = FakePostgrest()
+    media_cache: Dict[int, bytes] = {}
+    fal_jobs: Dict[str, tuple] = {}  # request_id -> (ready_at, failed, endpoint)
+    uploads: Dict[str, int] = {}
+
+    async def hit(service: str) -> Optional[Response]:
+        """Count, wait the configured latency and maybe inject an error."""
+        stats.requests[service] += 1
+        delay = config.delay(service)
+        if delay:
+            await asyncio.sleep(delay)
+        if config.fails(service):
+            stats.errors[service] += 1
+            return JSONResponse({"error": f"injected {service} failure", "message": "injected failure"}, status_code=503)
+        return None
+
+    def media_url(request: Request, kind: str, size: int) -> str:
+        extension = "mp4" if kind == "video" else "png"
+        return f"{request.base_url}media/{uuid.uuid4().hex}.{extension}?bytes={size}"
+
+    # --- PostgREST ---
+
+    async def postgrest(request: Request):
+        table = request.path_params["table"]
+        error = await hit("postgrest")
+        if error:
+            return error
+        params = request.query_params
+        prefer = request.headers.get("prefer", "")
+        headers = {}
+
+        if table.startswith("rpc/"):
+            body = await request.json() if await request.body() else {}
+            return JSONResponse(db.rpc(table[4:], body))
+
+        if request.method in ("GET", "HEAD"):
+            rows = db.query(table, params)
+            if "count=" in prefer:
+                total = len(db.query(table, params.__class__([(k, v) for k, v in params.multi_items() if k not in ("limit", "offset")])))
+                headers["content-range"] = f"0-{max(0, len(rows) - 1)}/{total}"
+            rows = db.project(rows, params.get("select"))
+        elif request.method == "POST":
+            payload = await request.json()
+            rows = []
+            conflict = (params.get("on_conflict") or "id").split(",")
+            for item in payload if isinstance(payload, list) else [payload]:
+                row = {"id": str(uuid.uuid4()), "created_at": _now_iso(), **item}
+                existing = None
+                if "merge-duplicates" in prefer:
+                    existing = next((r for r in db.tables[table] if all(r.get(c) == row.get(c) for c in conflict)), None)
+                if existing is not None:
+                    existing.update(item)
+                    row = existing
+                else:
+                    db.tables[table].append(row)
+                if table == "generations":
+                    stats.generation_started[row["id"]] = time.perf_counter()
+                rows.append(row)
+        elif request.method == "PATCH":
+            changes = await request.json()
+            rows = db.query(table, params)
+            for row in rows:
+                row.update(changes)
+                if table == "generations" and changes.get("status") in ("COMPLETED", "FAILED"):
+                    started = stats.generation_started.pop(row["id"], None)
+                    if started is not None:
+                        stats.generation_done.append((time.perf_counter() - started, changes["status"]))
+        elif request.method == "DELETE":
+            rows = db.query(table, params)
+            db.tables[table] = [r for r in db.tables[table] if r not in rows]
+        else:
+            return JSONResponse({"message": "method not allowed"}, status_code=405)
+
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"}, status_code=406)
+            return JSONResponse(rows[0], headers=headers)
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers)
+        return JSONResponse(rows, status_code=201 if request.method == "POST" else 200, headers=headers)
+
+    # --- S3 / R2 ---
+
+    async def s3_object(request: Request):
+        key = request.path_params["key"]
+        params = request.query_params
+        if request.method == "POST" and "uploads" in params:
+            upload_id = uuid.uuid4().hex
+            uploads[upload_id] = 0
+            return Response(
+                "<?xml version=\"1.0\" encoding=\"UTF-8\"?><InitiateMultipartUploadResult>"
+                f"<Bucket>{request.path_params['bucket']}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>",
+                media_type="application/xml",
+            )
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        error = await hit("s3")
+        if error:
+            return Response("<Error><Code>ServiceUnavailable</Code></Error>", status_code=503, media_type="application/xml")
+        stats.bytes_uploaded += size
+        if request.method == "POST" and "uploadId" in params:
+            uploads.pop(params["uploadId"], None)
+            return Response(
+                "<?xml version=\"1.0\" encoding=\"UTF-8\"?><CompleteMultipartUploadResult>"
+                f"<Key>{key}</Key><ETag>\"{uuid.uuid4().hex}\"</ETag></CompleteMultipartUploadResult>",
+                media_type="application/xml",
+            )
+        return Response(status_code=200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+
+    # --- Media ---
+
+    async def media(request: Request):
+        error = await hit("media")
+        if error:
+            return error
+        size = int(request.query_params.get("bytes", "200000"))
+        if size not in media_cache:
+            media_cache[size] = random.randbytes(size)
+        kind = "video/mp4" if request.path_params["name"].endswith(".mp4") else "image/png"
+        return Response(media_cache[size], media_type=kind)
+
+    # --- OpenAI-compatible chat ---
+
+    async def chat_completions(request: Request):
+        service = request.path_params["service"]
+        body = await request.json()
+        error = await hit(service)
+        if error:
+            return error
+        model = body.get("model", "bench")
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not body.get("stream"):
+            # Image models answer with a media URL in the content (see OpenRouterProvider)
+            content = f"![image]({media_url(request, 'image', 200000)})"
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            })
+
+        async def stream():
+            def chunk(delta, finish=None):
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                return f"data: {json.dumps(payload)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            for i in range(STREAM_TOKENS):
+                yield chunk({"content": f"token{i} "})
+                await asyncio.sleep(config.delay("token"))
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    # --- Gemini (newline-delimited JSON chunks, read by the genai shim) ---
+
+    async def gemini_stream(request: Request):
+        error = await hit("gemini")
+        if error:
+            return error
+
+        async def stream():
+            for i in range(STREAM_TOKENS):
+                yield json.dumps({"text": f"token{i} "}) + "\n"
+                await asyncio.sleep(config.delay("token"))
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # --- Fal queue API ---
+
+    async def fal_submit(request: Request):
+        stats.requests["fal_submit"] += 1
+        await request.body()
+        request_id = uuid.uuid4().hex
+        fal_jobs[request_id] = (time.perf_counter() + config.delay("fal"), config.fails("fal"), request.path_params["endpoint"])
+        return JSONResponse({"request_id": request_id})
+
+    async def fal_result(request: Request):
+        job = fal_jobs.pop(request.path_params["request_id"], None)
+        if job is None:
+            return JSONResponse({"detail": "unknown request"}, status_code=404)
+        ready_at, failed, endpoint = job
+        stats.requests["fal"] += 1
+        await asyncio.sleep(max(0.0, ready_at - time.perf_counter()))
+        if failed:
+            stats.errors["fal"] += 1
+            return JSONResponse({"detail": "injected fal failure"}, status_code=500)
+        if "video" in endpoint:
+            return JSONResponse({"video": {"url": media_url(request, "video", 2000000)}})
+        return JSONResponse({"images": [{"url": media_url(request, "image", 200000)}]})
+
+    # --- Replicate ---
+
+    async def replicate_run(request: Request):
+        body = await request.json()
+        error = await hit("replicate")
+        if error:
+            return error
+        kind = "video" if "duration" in (body.get("input") or {}) else "image"
+        return JSONResponse({"output": [media_url(request, kind, 2000000 if kind == "video" else 200000)]})
+
+    # --- Control ---
+
+    async def fake_stats(request: Request):
+        result = stats.as_dict()
+        if request.query_params.get("reset"):
+            pending = stats.generation_started
+            stats.reset()
+            stats.generation_started = pending  # keep in-flight generations measurable
+        return JSONResponse(result)
+
+    return Starlette(routes=[
+        Route("/rest/v1/{table:path}", postgrest, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+        Route("/s3/{bucket}/{key:path}", s3_object, methods=["PUT", "POST"]),
+        Route("/media/{name}", media),
+        Route("/{service:str}/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/gemini/stream", gemini_stream, methods=["POST"]),
+        Route("/fal/submit/{endpoint:path}", fal_submit, methods=["POST"]),
+        Route("/fal/result/{request_id}", fal_result),
+        Route("/replicate/run", replicate_run, methods=["POST"]),
+        Route("/__fake/stats", fake_stats),
+    ])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-ins for PostgREST, S3 and the AI providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="", help="service=seconds,... (postgrest, s3, media, openai, openrouter, gemini, token, fal, replicate)")
+    parser.add_argument("--errors", default="", help="service=rate,... injected error probability per call")
+    args = parser.parse_args()
+
+    config = FakeConfig(_parse_pairs(args.latency), _parse_pairs(args.errors))
+    uvicorn.run(build_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Load Test Runner
+Starts loadtest.fakes and loadtest.app_server as subprocesses, runs the selected scenarios one
+after another and reports RPS, p50/p95/p99 latency and the app's event-loop lag for each.
+Results are written as JSON; pass --baseline with an earlier result file to flag regressions
+(exit code 1 when RPS drops or p95 grows by more than --tolerance).
+
+    cd backend
+    python -m loadtest.run --scenarios generate,chat,upload,websocket --concurrency 20 --duration 20
+    python -m loadtest.run --latency fal=0.5,replicate=1 --errors fal=0.05 --baseline loadtest/results/base.json
+
+Fakes and app share the machine with the driver, so compare runs from the same host only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from loadtest.scenarios import SCENARIOS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "loadtest", "results")
+
+
+def _start(module: str, *args: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=BACKEND_DIR)
+
+
+async def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def _drain_generations(upstream: str, timeout: float) -> dict:
+    """Wait for background generations to finish so their end-to-end latency is measured."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=upstream, timeout=5) as client:
+        while True:
+            stats = (await client.get("/__fake/stats")).json()
+            if stats["generations"]["pending"] == 0 or time.monotonic() > deadline:
+                return stats["generations"]
+            await asyncio.sleep(0.5)
+
+
+async def run_all(args) -> dict:
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    upstream = f"http://127.0.0.1:{args.fake_port}"
+    options = {"upload_kb": args.upload_kb, "room_size": args.room_size, "video_share": args.video_share}
+    results = {}
+
+    async with httpx.AsyncClient(timeout=10) as control:
+        for name in args.scenarios.split(","):
+            scenario = SCENARIOS[name.strip()](app_url, args.concurrency, args.duration, args.warmup, options)
+            await control.get(f"{upstream}/__fake/stats", params={"reset": 1})
+            await control.get(f"{app_url}/__bench/lag", params={"reset": 1})
+
+            result = await scenario.run()
+            result["event_loop_lag"] = (await control.get(f"{app_url}/__bench/lag", params={"reset": 1})).json()
+            if name == "generate":
+                result["generation_e2e"] = await _drain_generations(upstream, args.drain_timeout)
+            result["upstream"] = (await control.get(f"{upstream}/__fake/stats")).json()["requests"]
+            results[name] = result
+            _print_row(name, result)
+    return results
+
+
+def _print_row(name: str, r: dict):
+    lag = r.get("event_loop_lag", {})
+    print(
+        f"{name:<10} {r['requests']:>7} req {r['errors']:>5} err {r['rps']:>9.1f} rps   "
+        f"p50 {r['p50_ms'] or 0:>8.1f}  p95 {r['p95_ms'] or 0:>8.1f}  p99 {r['p99_ms'] or 0:>8.1f} ms   "
+        f"loop lag p99 {lag.get('p99_ms', 0):>6.1f} max {lag.get('max_ms', 0):>7.1f} ms",
+        flush=True,
+    )
+    if "ttft" in r:
+        print(f"{'':<10} time to first chunk p50 {r['ttft']['p50_ms']} p95 {r['ttft']['p95_ms']} p99 {r['ttft']['p99_ms']} ms")
+    if "generation_e2e" in r:
+        g = r["generation_e2e"]
+        print(
+            f"{'':<10} generations completed {g['completed']} failed {g['failed']} still pending {g['pending']}; "
+            f"end-to-end p50 {g['e2e_p50_ms']} p95 {g['e2e_p95_ms']} p99 {g['e2e_p99_ms']} ms"
+        )
+    if r["error_kinds"]:
+        print(f"{'':<10} errors: {r['error_kinds']}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        if previous.get("rps") and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+        if previous.get("p95_ms") and current.get("p95_ms") and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against local fake upstreams")
+    parser.add_argument("--scenarios", default="generate,chat,upload,websocket", help=f"comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users (rooms for websocket)")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--latency", default="", help="fake latencies, e.g. fal=2,postgrest=0.02 (see loadtest.fakes)")
+    parser.add_argument("--errors", default="", help="injected error rates, e.g. fal=0.05,s3=0.01")
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--room-size", type=int, default=4, help="websocket clients per room")
+    parser.add_argument("--video-share", type=float, default=0.1, help="share of /generate requests for video models")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="seconds to wait for background generations")
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--out", help="result file (default: loadtest/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    fakes = _start("loadtest.fakes", "--port", str(args.fake_port), "--latency", args.latency, "--errors", args.errors)
+    app = _start("loadtest.app_server", "--port", str(args.app_port), "--upstream", f"http://127.0.0.1:{args.fake_port}")
+    try:
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.fake_port}/__fake/stats"))
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.app_port}/health"))
+        results = asyncio.run(run_all(args))
+    finally:
+        app.terminate()
+        fakes.terminate()
+        app.wait(10)
+        fakes.wait(10)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "args": vars(args),
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Load Test Scenarios
+Closed-loop drivers: `concurrency` virtual users issue requests back to back for `duration`
+seconds (after a warmup whose results are discarded). Each scenario returns the request
+latencies plus its own extra numbers (time to first token, fan-out latency...).
+"""
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadtest.fakes import BENCH_USERS, SEED_MODELS
+
+IMAGE_MODEL_IDS = [m["id"] for m in SEED_MODELS if m["type"] == "IMAGE"]
+VIDEO_MODEL_IDS = [m["id"] for m in SEED_MODELS if m["type"] == "VIDEO"]
+CHAT_MODELS = [m["api_path"] for m in SEED_MODELS if m["type"] == "CHAT"]
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))], 2)
+
+
+def summarize(latencies_ms: List[float]) -> dict:
+    values = sorted(latencies_ms)
+    return {"p50_ms": percentile(values, 0.50), "p95_ms": percentile(values, 0.95), "p99_ms": percentile(values, 0.99)}
+
+
+class Scenario:
+    name = ""
+
+    def __init__(self, base_url: str, concurrency: int, duration: float, warmup: float, options: dict):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.warmup = warmup
+        self.options = options
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.extra: Dict[str, List[float]] = {}
+        self.measuring = False
+
+    def record(self, started: float, error: Optional[str] = None, **extra_ms):
+        if not self.measuring:
+            return
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            return
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        for key, value in extra_ms.items():
+            self.extra.setdefault(key, []).append(value)
+
+    async def request(self, client: httpx.AsyncClient, user: int):
+        raise NotImplementedError
+
+    async def _user(self, client: httpx.AsyncClient, user: int, stop_at: float):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                await self.request(client, user)
+            except Exception as e:
+                self.record(started, type(e).__name__)
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency * 2, max_keepalive_connections=self.concurrency * 2)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120, limits=limits) as client:
+            start = time.perf_counter()
+            stop_at = start + self.warmup + self.duration
+            users = [asyncio.create_task(self._user(client, i, stop_at)) for i in range(self.concurrency)]
+            await asyncio.sleep(self.warmup)
+            self.measuring = True
+            measured_from = time.perf_counter()
+            await asyncio.gather(*users)
+            elapsed = time.perf_counter() - measured_from
+        result = {
+            "requests": len(self.latencies),
+            "errors": sum(self.errors.values()),
+            "error_kinds": self.errors,
+            "rps": round(len(self.latencies) / elapsed, 2),
+            **summarize(self.latencies),
+        }
+        for key, values in self.extra.items():
+            result[key] = summarize(values)
+        return result
+
+
+class GenerateScenario(Scenario):
+    """POST /api/generate (credit reservation, model lookups, insert); the provider work runs after the response."""
+    name = "generate"
+
+    async def request(self, client: httpx.AsyncClient, user: int):
+        video = random.random() < self.options.get("video_share", 0.1)
+        payload = {
+            "prompt": f"bench prompt {uuid.uuid4().hex[:8]} a red fox in the snow, cinematic lighting",
+            "user_id": f"bench-user-{user % BENCH_USERS}",
+            "node_id": f"node-{user}",
+            "model_id": random.choice(VIDEO_MODEL_IDS if video else IMAGE_MODEL_IDS),
+            "type": "video" if video else "image",
+        }
+        started = time.perf_counter()
+        res = await client.post("/api/generate", json=payload)
+        self.record(started, None if res.status_code == 200 else f"http_{res.status_code}")
+
+
+class ChatScenario(Scenario):
+    """Streaming POST /api/chat across the OpenAI, OpenRouter and Gemini paths."""
+    name = "chat"
+
+    async def request(self, client: httpx.AsyncClient, user: int):
+        payload = {
+            "model": random.choice(CHAT_MODELS),
+            "messages": [
+                {"role": "user", "content": "Describe a linen fabric texture for a summer dress."},
+                {"role": "assistant", "content": "A lightweight, breathable linen with a soft slub."},
+                {"role": "user", "content": f"Make it warmer, variant {random.randint(0, 10 ** 6)}"},
+            ],
+        }
+        started = time.perf_counter()
+        first_chunk = None
+        async with client.stream("POST", "/api/chat", json=payload) as res:
+            if res.status_code != 200:
+                await res.aread()
+                self.record(started, f"http_{res.status_code}")
+                return
+            async for _ in res.aiter_bytes():
+                if first_chunk is None:
+                    first_chunk = (time.perf_counter() - started) * 1000
+        self.record(started, ttft=first_chunk if first_chunk is not None else 0.0)
+
+
+class UploadScenario(Scenario):
+    """Multipart POST /api/upload/image to (fake) R2."""
+    name = "upload"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.payload = random.randbytes(int(self.options.get("upload_kb", 512)) * 1024)
+
+    async def request(self, client: httpx.AsyncClient, user: int):
+        started = time.perf_counter()
+        res = await client.post("/api/upload/image", files={"file": ("bench.png", self.payload, "image/png")})
+        self.record(started, None if res.status_code == 200 else f"http_{res.status_code}")
+
+
+# --- Yjs websocket rooms ---
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+class WebsocketScenario(Scenario):
+    """
+    `concurrency` rooms; in each, one writer sends Yjs updates and `room_size - 1` readers
+    receive the broadcasts. The k-th update broadcast a reader sees is the writer's k-th
+    update, so latency = receive time - send time. RPS counts delivered messages.
+    """
+    name = "websocket"
+
+    async def _room(self, room: str, stop_at: float):
+        import websockets
+        import y_py as Y
+
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/api/ws/{room}"
+        readers = [await websockets.connect(ws_url, max_size=None) for _ in range(int(self.options.get("room_size", 4)) - 1)]
+        writer = await websockets.connect(ws_url, max_size=None)
+        sent_at: List[float] = []
+
+        async def read(ws):
+            received = 0
+            try:
+                async for message in ws:
+                    # Only update broadcasts (messageSync=0, syncUpdate=2); skip sync steps/awareness
+                    if isinstance(message, bytes) and message[:2] == b"\x00\x02":
+                        if received < len(sent_at):
+                            self.record(sent_at[received])
+                        received += 1
+            except Exception:
+                pass
+
+        reader_tasks = [asyncio.create_task(read(ws)) for ws in readers]
+        doc = Y.YDoc()
+        text = doc.get_text("content")
+        interval = float(self.options.get("ws_interval", 0.05))
+        try:
+            while time.perf_counter() < stop_at:
+                state = Y.encode_state_vector(doc)
+                with doc.begin_transaction() as txn:
+                    text.extend(txn, "x")
+                update = Y.encode_state_as_update(doc, state)
+                sent_at.append(time.perf_counter())
+                await writer.send(b"\x00\x02" + _varint(len(update)) + update)
+                await asyncio.sleep(interval)
+            await asyncio.sleep(0.5)  # let the last broadcasts arrive
+        finally:
+            for ws in readers + [writer]:
+                await ws.close()
+            for task in reader_tasks:
+                task.cancel()
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        stop_at = start + self.warmup + self.duration
+        room_prefix = uuid.uuid4().hex[:8]
+        rooms = [asyncio.create_task(self._room(f"bench-{room_prefix}-{i}", stop_at)) for i in range(self.concurrency)]
+        await asyncio.sleep(self.warmup)
+        self.measuring = True
+        measured_from = time.perf_counter()
+        results = await asyncio.gather(*rooms, return_exceptions=True)
+        elapsed = time.perf_counter() - measured_from
+        for result in results:
+            if isinstance(result, Exception):
+                kind = type(result).__name__
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+        return {
+            "requests": len(self.latencies),
+            "errors": sum(self.errors.values()),
+            "error_kinds": self.errors,
+            "rps": round(len(self.latencies) / elapsed, 2),
+            **summarize(self.latencies),
+        }
+
+
+SCENARIOS = {s.name: s for s in (GenerateScenario, ChatScenario, UploadScenario, WebsocketScenario)}
@@ -11,26 +11,45 @@ from routers import generate, payments, chat, admin, projects, plans
 
 from contextlib import asynccontextmanager
 from routers.websocket import websocket_server
+from services.fabric_cache import fabric_cache
+from services.credit_ledger import credit_ledger
+from services.stripe_events import stripe_event_queue
+from services.search_index import search_service
+from services.clients import clients
+from services.profiler import loop_watchdog, PROFILING_ENABLED
 import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start the Yjs WebSocket Server background task
-    ws_task = asyncio.create_task(websocket_server.start())
+    # The Yjs WebSocket server is started by the first /ws connection (routers/websocket.py)
+    # Pre-warm popular fabric textures (loads R2 manifests, generates only what's missing)
+    prewarm_task = asyncio.create_task(fabric_cache.prewarm()) if os.getenv("FAL_KEY") else None
+    # Batched credit commits + expiry sweep for unsettled reservations
+    credit_ledger.start()
+    # Applies queued Stripe webhook events
+    stripe_event_queue.start()
+    # Loads the search index in the background, then keeps it in sync
+    search_service.start()
+    # Heavy SDKs (openai, genai, stripe, boto3...) are imported lazily; load them off the request path now
+    clients.prewarm()
+    # Records what blocks the event loop (see GET /api/admin/profiling/loop)
+    if PROFILING_ENABLED:
+        loop_watchdog.start()
     yield
-    # Shutdown logic
-    # websocket_server.stop() or cancel task if needed.
-    # usually auto_clean_rooms handles things, but we can explicit stop if API supports it.
-    # ypy-websocket <=0.12 might not have graceful stop method widely used, 
-    # but cancelling the task is standard.
-    ws_task.cancel()
-    try:
-        await ws_task
-    except asyncio.CancelledError:
-        pass
+    loop_watchdog.stop()
+    search_service.stop()
+    if prewarm_task:
+        prewarm_task.cancel()
+    stripe_event_queue.stop()
+    await credit_ledger.stop()
+    await websocket_server.stop()
 
 app = FastAPI(title="Lovart-Flow API", lifespan=lifespan)
 
+# Rate limiting (added before CORS so 429 responses still carry CORS headers)
+from services.rate_limiter import RateLimitMiddleware
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +59,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Slow request capture (inside tracing, so entries link to their trace)
+from services.profiler import ProfilingMiddleware
+app.add_middleware(ProfilingMiddleware)
+
+# Request tracing (root span per request; see GET /api/admin/traces)
+from services.tracing import TracingMiddleware
+app.add_middleware(TracingMiddleware)
+
+# Request latency histograms (outermost, so rate-limited and CORS responses are timed too)
+from services.metrics import MetricsMiddleware
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(generate.router, prefix="/api")
 app.include_router(payments.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
@@ -53,6 +84,15 @@ app.include_router(settings.router, prefix="/api")
 from routers import prompts
 app.include_router(prompts.router, prefix="/api")
 
+from routers import search
+app.include_router(search.router, prefix="/api")
+
+from routers import sitemap
+app.include_router(sitemap.router, prefix="/api")
+
+from routers import metrics
+app.include_router(metrics.router)
+
 from routers import websocket
 app.include_router(websocket.router, prefix="/api")
 
@@ -1,5 +1,88 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, BinaryIO
+
+from utils.data_uri import decode_data_uri
+from services.model_adapters import ModelAdapter
+
+
+@dataclass
+class GeneratedAsset:
+    """
+    One output of a provider call: a (temporary) URL, the raw bytes or a file holding them,
+    plus whatever the provider reported about it. Unknown fields stay None.
+    """
+    url: Optional[str] = None
+    data: Optional[bytes] = None
+    file: Optional[BinaryIO] = None  # e.g. a decoded data URI; storage closes it after the upload
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    seed: Optional[int] = None
+    nsfw: Optional[bool] = None
+    duration: Optional[float] = None  # seconds, videos only
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_url(cls, url: str, **fields) -> "GeneratedAsset":
+        """Build an asset from a URL; data URIs are decoded into a spooled file."""
+        if url.startswith("data:"):
+            return cls.from_data_uri(url, **fields)
+        return cls(url=url, **fields)
+
+    @classmethod
+    def from_data_uri(cls, text: str, start: int = 0, end: Optional[int] = None, **fields) -> "GeneratedAsset":
+        """Decode the base64 data URI at text[start:end] in chunks, without copying the string."""
+        content_type, fileobj, size = decode_data_uri(text, start, end)
+        fields["content_type"] = fields.get("content_type") or content_type
+        return cls(file=fileobj, size=size, **fields)
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-safe summary (no bytes) for logs and the generations.outputs column."""
+        summary = {
+            "content_type": self.content_type,
+            "width": self.width,
+            "height": self.height,
+            "seed": self.seed,
+            "nsfw": self.nsfw,
+            "duration": self.duration,
+            "bytes": len(self.data) if self.data is not None else self.size,
+        }
+        return {k: v for k, v in summary.items() if v is not None}
+
+
+@dataclass
+class GenerationResult:
+    """
+    Everything a provider returned for one generate_image/generate_video call.
+    `timings` holds seconds: "total" is measured around the provider call, other keys
+    (e.g. "inference") are reported by the provider.
+    """
+    assets: List[GeneratedAsset]
+    provider: str
+    model: str
+    seed: Optional[int] = None
+    request_id: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def url(self) -> Optional[str]:
+        """URL of the first asset (what the single-URL interface used to return)."""
+        return self.assets[0].url if self.assets else None
+
+    def describe(self) -> Dict[str, Any]:
+        summary = {
+            "provider": self.provider,
+            "model": self.model,
+            "seed": self.seed,
+            "request_id": self.request_id,
+            "timings": {k: round(v, 3) for k, v in self.timings.items()},
+            **self.metadata,
+        }
+        return {k: v for k, v in summary.items() if v is not None}
+
 
 class AIProvider(ABC):
     """
@@ -17,11 +100,13 @@ class AIProvider(ABC):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         """
         Generates an image asynchronously.
-        Returns the URL of the generated image.
+        Returns every generated image (up to num_images) with its metadata.
+        `adapter` is the model's compiled ModelAdapter (defaults to the one for model_path).
         """
         pass
 
@@ -33,11 +118,12 @@ class AIProvider(ABC):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         """
         Generates a video asynchronously.
-        Returns the URL of the generated video.
+        Returns the generated video(s) with their metadata.
         """
         pass
 
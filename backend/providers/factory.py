@@ -1,7 +1,18 @@
+import importlib
+
 from .base import AIProvider
-from .fal import FalProvider
-from .replicate import ReplicateProvider
-from .openrouter import OpenRouterProvider
+
+# Provider modules are imported on first use (each pulls in its SDK)
+_PROVIDER_CLASSES = {
+    "FAL": ("providers.fal", "FalProvider"),
+    "REPLICATE": ("providers.replicate", "ReplicateProvider"),
+    "OPENROUTER": ("providers.openrouter", "OpenRouterProvider"),
+    "GOOGLE": ("providers.openrouter", "OpenRouterProvider"),
+}
+
+def _provider_class(provider_name: str):
+    module_name, class_name = _PROVIDER_CLASSES[provider_name]
+    return getattr(importlib.import_module(module_name), class_name)
 
 class ProviderFactory:
     _providers = {}
@@ -13,16 +24,12 @@ class ProviderFactory:
         if provider_name in cls._providers:
             return cls._providers[provider_name]
             
-        if provider_name == "FAL":
-            instance = FalProvider()
-        elif provider_name == "REPLICATE":
-            instance = ReplicateProvider()
-        elif provider_name == "OPENROUTER" or provider_name == "GOOGLE":
-            instance = OpenRouterProvider()
+        if provider_name in _PROVIDER_CLASSES:
+            instance = _provider_class(provider_name)()
         else:
             # Default to FAL if unknown, or raise error
             print(f"Unknown provider {provider_name}, defaulting to FAL")
-            instance = FalProvider()
+            instance = _provider_class("FAL")()
             
         cls._providers[provider_name] = instance
         return instance
@@ -1,9 +1,14 @@
 import os
-import fal_client
-from .base import AIProvider
+import time
+from .base import AIProvider, GeneratedAsset, GenerationResult
 from typing import Dict, Any, Optional, List
 from utils.logger import logger
 from fastapi.concurrency import run_in_threadpool
+from services.tracing import tracer
+from services.model_adapters import ModelAdapter, model_adapters
+from services.clients import lazy_module
+
+fal_client = lazy_module("fal_client")
 
 class FalProvider(AIProvider):
     def __init__(self):
@@ -18,8 +23,9 @@ class FalProvider(AIProvider):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         return await run_in_threadpool(
             self._generate_image_sync,
             prompt,
@@ -28,7 +34,8 @@ class FalProvider(AIProvider):
             references,
             parameters,
             resolution,
-            num_images
+            num_images,
+            adapter
         )
 
     def _generate_image_sync(
@@ -39,55 +46,29 @@ class FalProvider(AIProvider):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
-        # 1. Determine endpoint
-        endpoint = model_path
-        if "/" not in model_path:
-            # Legacy mapping
-            if model_path == "flux-dev":
-                endpoint = "fal-ai/flux/dev"
-            else:
-                endpoint = "fal-ai/flux-pro/v1.1"
-
-        logger.info(f"[FAL] Generating with endpoint: {endpoint}")
-
-        # 2. Use parameters directly without "smart mapping" if present
-        arguments = {
-            "prompt": prompt,
-            "num_images": num_images,
-            "safety_tolerance": "2",
-        }
-        
-        # If the user defines 'image_size' or 'aspect_ratio' in the parameters schema, use that.
-        if aspect_ratio and "image_size" not in (parameters or {}) and "aspect_ratio" not in (parameters or {}):
-             arguments["image_size"] = self._map_aspect_ratio(aspect_ratio)
-
-        # 3. Merge user/system parameters (Prioritize these!)
-        if parameters:
-            arguments.update(parameters)
-
-        # Override with explicit resolution if provided (format "WxH")
-        if resolution and "x" in resolution and "image_size" not in arguments:
-             try:
-                 w, h = map(int, resolution.split("x"))
-                 arguments["image_size"] = { "width": w, "height": h }
-             except:
-                 pass
-
-        # 5. Handle References
-        if references and len(references) > 0:
-            if "nano-banana" in model_path: # Specific model requirement example
-               arguments["image_urls"] = references[:3]
-            else:
-                arguments["image_url"] = references[0]
-
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
+        # 1. Endpoint + arguments from the model's compiled adapter
+        adapter = adapter or model_adapters.for_path("FAL", model_path, "IMAGE")
+        endpoint, arguments = adapter.build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            references=references,
+            parameters=parameters,
+            resolution=resolution,
+            num_images=num_images,
+        )
+        logger.info(f"[FAL] Generating with endpoint: {endpoint} (adapter: {adapter.preset})")
         logger.info(f"[FAL] Arguments keys: {list(arguments.keys())}")
 
-        # 6. Submit
+        # 2. Submit
+        started_at = time.perf_counter()
         try:
-            handler = fal_client.submit(endpoint, arguments=arguments)
-            result = handler.get()
+            with tracer.span("fal.submit", endpoint=endpoint):
+                handler = fal_client.submit(endpoint, arguments=arguments)
+            with tracer.span("fal.result", endpoint=endpoint, request_id=getattr(handler, "request_id", "")):
+                result = handler.get()
             logger.info(f"[FAL] Result received for {endpoint}")
         except Exception as e:
             logger.error(f"[FAL] CRITICAL ERROR: {str(e)}", exc_info=True)
@@ -96,8 +77,22 @@ class FalProvider(AIProvider):
         if not result or "images" not in result or not result["images"]:
             logger.error(f"[FAL] Unexpected result: {result}")
             raise Exception("No images returned from Fal.ai")
-            
-        return result["images"][0]["url"]
+
+        # One seed per request; it only identifies an image when a single one was generated
+        seed = result.get("seed")
+        nsfw_flags = result.get("has_nsfw_concepts") or []
+        assets = [
+            GeneratedAsset.from_url(
+                image["url"],
+                content_type=image.get("content_type"),
+                width=image.get("width"),
+                height=image.get("height"),
+                seed=seed if len(result["images"]) == 1 else None,
+                nsfw=nsfw_flags[i] if i < len(nsfw_flags) else None,
+            )
+            for i, image in enumerate(result["images"])
+        ]
+        return self._result(assets, endpoint, handler, result, started_at)
 
     async def generate_video(
         self,
@@ -106,8 +101,9 @@ class FalProvider(AIProvider):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         return await run_in_threadpool(
             self._generate_video_sync,
             prompt,
@@ -115,7 +111,8 @@ class FalProvider(AIProvider):
             duration,
             aspect_ratio,
             references,
-            parameters
+            parameters,
+            adapter
         )
 
     def _generate_video_sync(
@@ -125,51 +122,59 @@ class FalProvider(AIProvider):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
-        
-        endpoint = model_path
-        # Legacy fallback
-        if "hunyuan" in model_path and "/" not in model_path:
-             endpoint = "fal-ai/hunyuan-video"
-             
-        logger.info(f"[FAL] Generating video with endpoint: {endpoint}")
-
-        arguments = {
-            "prompt": prompt,
-            "duration": duration,
-            "aspect_ratio": aspect_ratio,
-        }
-        
-        if parameters:
-            arguments.update(parameters)
-            
-        if references and len(references) > 0:
-             arguments["image_url"] = references[0]
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
+        adapter = adapter or model_adapters.for_path("FAL", model_path, "VIDEO")
+        endpoint, arguments = adapter.build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            duration=duration,
+            references=references,
+            parameters=parameters,
+        )
+        logger.info(f"[FAL] Generating video with endpoint: {endpoint} (adapter: {adapter.preset})")
 
+        started_at = time.perf_counter()
         try:
-            handler = fal_client.submit(endpoint, arguments=arguments)
-            result = handler.get()
+            with tracer.span("fal.submit", endpoint=endpoint):
+                handler = fal_client.submit(endpoint, arguments=arguments)
+            with tracer.span("fal.result", endpoint=endpoint, request_id=getattr(handler, "request_id", "")):
+                result = handler.get()
             logger.info(f"[FAL] Video Result received for {endpoint}")
         except Exception as e:
             logger.error(f"[FAL] CRITICAL VIDEO ERROR: {str(e)}", exc_info=True)
             raise e
         
-        if "video" in result:
-             return result["video"]["url"]
-        return result.get("url", "")
-
-    def _map_aspect_ratio(self, ar: str) -> str:
-        """Map standard AR string to Fal image_size enum."""
-        mapping = {
-            "1:1": "square_hd", # Prefer HD
-            "16:9": "landscape_16_9",
-            "9:16": "portrait_16_9",
-            "4:3": "landscape_4_3",
-            "3:4": "portrait_4_3",
-            "21:9": "landscape_16_9", # Fallback
-        }
-        return mapping.get(ar, "square_hd")
+        video = result.get("video") or ({"url": result["url"]} if result.get("url") else None)
+        if not video or not video.get("url"):
+            logger.error(f"[FAL] Unexpected video result: {result}")
+            raise Exception("No video returned from Fal.ai")
+
+        asset = GeneratedAsset.from_url(
+            video["url"],
+            content_type=video.get("content_type") or "video/mp4",
+            width=video.get("width"),
+            height=video.get("height"),
+            seed=result.get("seed"),
+            duration=video.get("duration"),
+        )
+        return self._result([asset], endpoint, handler, result, started_at)
+
+    def _result(self, assets: List[GeneratedAsset], endpoint: str, handler, result: dict, started_at: float) -> GenerationResult:
+        timings = {"total": time.perf_counter() - started_at}
+        # Fal reports its own timings in seconds, e.g. {"inference": 1.42}
+        for key, value in (result.get("timings") or {}).items():
+            if isinstance(value, (int, float)):
+                timings[key] = float(value)
+        return GenerationResult(
+            assets=assets,
+            provider="FAL",
+            model=endpoint,
+            seed=result.get("seed"),
+            request_id=getattr(handler, "request_id", None),
+            timings=timings,
+        )
 
     def _normalize_fal_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Pass through parameters directly."""
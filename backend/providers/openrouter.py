@@ -1,28 +1,21 @@
 import os
 import json
 import re
-from openai import AsyncOpenAI
-from .base import AIProvider
+import time
+from .base import AIProvider, GeneratedAsset, GenerationResult
+from services.model_adapters import ModelAdapter
 from typing import Dict, Any, Optional, List
 from utils.logger import logger
 from services import dns_patch # keep dns patch
+from services.tracing import tracer
+from services.clients import clients
+from utils.data_uri import find_data_uri
 
 class OpenRouterProvider(AIProvider):
     def __init__(self):
-        key = os.getenv("OPENROUTER_API_KEY")
-        if not key:
+        self.client = clients.get("openrouter_images")
+        if not self.client:
             logger.warning("OPENROUTER_API_KEY not set")
-            self.client = None
-        else:
-            self.client = AsyncOpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=key,
-                timeout=60.0,
-                default_headers={
-                    "HTTP-Referer": "http://localhost:3000",
-                    "X-Title": "Lovart Flow (Local Dev)",
-                }
-            )
 
     async def generate_image(
         self,
@@ -32,8 +25,9 @@ class OpenRouterProvider(AIProvider):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None  # chat completions: the request is built below
+    ) -> GenerationResult:
         if not self.client:
              raise Exception("OpenRouter API Key missing")
         
@@ -70,9 +64,22 @@ class OpenRouterProvider(AIProvider):
 
             logger.info(f"[OPENROUTER] Generating {model_path} with extra_body keys: {list(extra_body.keys())}")
             
-            response = await self.client.chat.completions.create(**chat_params)
+            started_at = time.perf_counter()
+            with tracer.span("openrouter.chat.completions", model=model_path):
+                response = await self.client.chat.completions.create(**chat_params)
             
-            return self._extract_url_from_response(response)
+            seed = chat_params.get("seed") if isinstance(chat_params.get("seed"), int) else None
+            assets = self._extract_assets(response)
+            if len(assets) == 1:
+                assets[0].seed = seed
+            return GenerationResult(
+                assets=assets,
+                provider="OPENROUTER",
+                model=model_path,
+                seed=seed,
+                request_id=getattr(response, "id", None),
+                timings={"total": time.perf_counter() - started_at},
+            )
 
         except Exception as e:
             logger.error(f"[OPENROUTER] Generation failed: {e}", exc_info=True)
@@ -85,8 +92,9 @@ class OpenRouterProvider(AIProvider):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         # Fallback to image generation path for now as OpenRouter video support varies
         return await self.generate_image(prompt, model_path, aspect_ratio, references, parameters)
 
@@ -100,7 +108,7 @@ class OpenRouterProvider(AIProvider):
         }
         return m.get(ar, "1024x1024")
 
-    def _extract_url_from_response(self, response) -> str:
+    def _extract_assets(self, response) -> List[GeneratedAsset]:
         msg = response.choices[0].message
         
         # Check specialized 'images' or 'video' fields
@@ -108,18 +116,31 @@ class OpenRouterProvider(AIProvider):
         if not images and hasattr(msg, 'model_extra'):
              images = msg.model_extra.get('images')
              
-        if images and len(images) > 0:
-             img = images[0]
-             if isinstance(img, dict): return img.get("url")
-             if hasattr(img, "url"): return img.url
+        if images:
+             # Entries are {"type": "image_url", "image_url": {"url": ...}} or {"url": ...}; URLs are often data URIs
+             urls = [self._image_url(img) for img in images]
+             assets = [GeneratedAsset.from_url(url) for url in urls if url]
+             if assets:
+                  return assets
              
         # Check content for Markdown regex
         content = msg.content
         if not content:
              raise Exception("Empty response content from OpenRouter")
+
+        # Inline base64 image: decoded straight from the content string, without slicing it out
+        data_uri = find_data_uri(content)
+        if data_uri:
+             return [GeneratedAsset.from_data_uri(content, *data_uri)]
              
         url_match = re.search(r'https?://[^\s<>"]+', content)
         if url_match:
-             return url_match.group(0)
+             return [GeneratedAsset.from_url(url_match.group(0))]
              
         raise Exception("Could not find media URL in OpenRouter response")
+
+    def _image_url(self, img) -> Optional[str]:
+        if isinstance(img, dict):
+             return (img.get("image_url") or {}).get("url") or img.get("url")
+        image_url = getattr(img, "image_url", None)
+        return getattr(image_url, "url", None) or getattr(img, "url", None)
@@ -1,17 +1,20 @@
 import os
-import replicate
-from .base import AIProvider
+import time
+from .base import AIProvider, GeneratedAsset, GenerationResult
 from typing import Dict, Any, Optional, List
 from fastapi import HTTPException
 from utils.logger import logger
 from fastapi.concurrency import run_in_threadpool
+from services.tracing import tracer
+from services.clients import clients
+from services.model_adapters import ModelAdapter, model_adapters
 
 class ReplicateProvider(AIProvider):
     def __init__(self):
         token = os.getenv("REPLICATE_API_TOKEN")
         if not token:
             logger.warning("REPLICATE_API_TOKEN not set")
-        self.client = replicate.Client(api_token=token)
+        self.client = clients.get("replicate")
 
     async def generate_image(
         self,
@@ -21,8 +24,9 @@ class ReplicateProvider(AIProvider):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         return await run_in_threadpool(
             self._generate_image_sync,
             prompt,
@@ -31,7 +35,8 @@ class ReplicateProvider(AIProvider):
             references,
             parameters,
             resolution,
-            num_images
+            num_images,
+            adapter
         )
 
     def _generate_image_sync(
@@ -42,24 +47,19 @@ class ReplicateProvider(AIProvider):
         references: Optional[List[str]] = None,
         parameters: Optional[Dict[str, Any]] = None,
         resolution: Optional[str] = None,
-        num_images: int = 1
-    ) -> str:
-        
-        input_params = {"prompt": prompt}
-        
-        # Determine aspect ratio handling
-        if "flux" in model_path.lower():
-             input_params["aspect_ratio"] = aspect_ratio
-        else:
-             input_params["aspect_ratio"] = aspect_ratio
-
-        if parameters:
-            input_params.update(parameters)
-            
-        if references:
-            input_params["image"] = references[0]
-
-        return self._run_replicate(model_path, input_params)
+        num_images: int = 1,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
+        adapter = adapter or model_adapters.for_path("REPLICATE", model_path, "IMAGE")
+        model, input_params = adapter.build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            references=references,
+            parameters=parameters,
+            resolution=resolution,
+            num_images=num_images,
+        )
+        return self._run_replicate(model, input_params)
 
     async def generate_video(
         self,
@@ -68,8 +68,9 @@ class ReplicateProvider(AIProvider):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
         return await run_in_threadpool(
              self._generate_video_sync,
              prompt,
@@ -77,7 +78,8 @@ class ReplicateProvider(AIProvider):
              duration,
              aspect_ratio,
              references,
-             parameters
+             parameters,
+             adapter
         )
 
     def _generate_video_sync(
@@ -87,51 +89,55 @@ class ReplicateProvider(AIProvider):
         duration: str = "5s",
         aspect_ratio: str = "16:9",
         references: Optional[List[str]] = None,
-        parameters: Optional[Dict[str, Any]] = None
-    ) -> str:
-        
-        input_params = {"prompt": prompt}
-        
-        # Handle Duration
-        if duration:
-             try:
-                 sec = int(duration.replace("s", ""))
-                 input_params["duration"] = sec
-             except:
-                 pass
-        
-        if aspect_ratio:
-             input_params["aspect_ratio"] = aspect_ratio
-
-        if parameters:
-            input_params.update(parameters)
-            
-        if references:
-             if len(references) >= 2:
-                  input_params["start_image"] = references[0]
-                  input_params["end_image"] = references[1]
-             else:
-                  input_params["image"] = references[0]
-
-        return self._run_replicate(model_path, input_params)
+        parameters: Optional[Dict[str, Any]] = None,
+        adapter: Optional[ModelAdapter] = None
+    ) -> GenerationResult:
+        adapter = adapter or model_adapters.for_path("REPLICATE", model_path, "VIDEO")
+        model, input_params = adapter.build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            duration=duration,
+            references=references,
+            parameters=parameters,
+        )
+        return self._run_replicate(model, input_params, content_type="video/mp4", duration=input_params.get("duration"))
 
-    def _run_replicate(self, model: str, inputs: Dict[str, Any]) -> str:
+    def _run_replicate(self, model: str, inputs: Dict[str, Any], **asset_fields) -> GenerationResult:
         logger.info(f"[REPLICATE] Running {model} with inputs keys: {list(inputs.keys())}")
+        started_at = time.perf_counter()
         try:
-            output = self.client.run(model, input=inputs)
+            with tracer.span("replicate.run", model=model):
+                output = self.client.run(model, input=inputs)
             
-            # Unpack Output
-            if isinstance(output, str):
-                return output
-            elif isinstance(output, list) and len(output) > 0:
-                return output[0] if isinstance(output[0], str) else output[0].get("url", str(output[0]))
-            elif isinstance(output, dict):
-                 if "url" in output: return output["url"]
-                 if "video" in output: return output["video"]
-                 if "output" in output: return output["output"]
-            
-            raise Exception(f"Unknown output format: {type(output)}")
+            urls = self._output_urls(output)
+            if not urls:
+                raise Exception(f"Unknown output format: {type(output)}")
             
         except Exception as e:
             logger.error(f"[REPLICATE] Error: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Replicate error: {str(e)}")
+
+        # client.run() only returns the output; the seed is known when the caller pinned it
+        seed = inputs.get("seed") if isinstance(inputs.get("seed"), int) else None
+        return GenerationResult(
+            assets=[GeneratedAsset.from_url(url, seed=seed if len(urls) == 1 else None, **asset_fields) for url in urls],
+            provider="REPLICATE",
+            model=model,
+            seed=seed,
+            timings={"total": time.perf_counter() - started_at},
+        )
+
+    def _output_urls(self, output) -> List[str]:
+        """Unpack the output shapes models return: URL, FileOutput, list of either, or a dict."""
+        if isinstance(output, str):
+            return [output]
+        if isinstance(output, list):
+            return [url for item in output for url in self._output_urls(item)]
+        if isinstance(output, dict):
+            for key in ("url", "video", "output"):
+                if output.get(key):
+                    return self._output_urls(output[key])
+            return []
+        # replicate>=1.0 FileOutput
+        url = getattr(output, "url", None)
+        return [str(url)] if url else []
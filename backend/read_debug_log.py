@@ -2,7 +2,7 @@
 import os
 
 try:
-    with open("backend/debug_gen.log", "rb") as f:
+    with open("backend/backend.log", "rb") as f:
         # Seek to end
         f.seek(0, os.SEEK_END)
         size = f.tell()
@@ -1,9 +1,20 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from services.supabase_client import supabase
+from services.gemini_pool import gemini_model_pool
+from services.generation_scheduler import generation_scheduler
+from services.tracing import tracer, render_flame
+from services.model_adapters import ModelAdapter, AdapterValidationError, model_adapters
+from services.slug_cache import slug_page_cache
+from services.search_index import search_service
+from services.profiler import loop_watchdog, slow_request_log, sample_profile, PROFILE_MAX_SECONDS
+from fastapi.concurrency import run_in_threadpool
 from functools import wraps
+from utils.logger import get_logger
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # ============================================
 # Request Models
@@ -33,6 +44,7 @@ class AddModelRequest(BaseModel):
     api_path: str
     cost_per_gen: float = 0
     description: str | None = None
+    adapter: dict | None = None  # Request mapping, e.g. {"preset": "fal_image", "max_images": 1} (see services/model_adapters.py)
     admin_id: str
 
 # ============================================
@@ -312,6 +324,12 @@ async def add_model(request: AddModelRequest):
     """
     if not verify_admin_role(request.admin_id):
         raise HTTPException(status_code=403, detail="Unauthorized")
+
+    # Compile the adapter up front so a bad spec is rejected here, not on the first generation
+    try:
+        ModelAdapter(request.provider, request.type, request.api_path, request.adapter)
+    except AdapterValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
         data = request.dict(exclude={"admin_id"})
@@ -322,7 +340,9 @@ async def add_model(request: AddModelRequest):
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to add model")
-            
+
+        gemini_model_pool.invalidate()
+        model_adapters.invalidate()
         return {"status": "success", "model": response.data[0]}
     except Exception as e:
         print(f"Error adding model: {e}")
@@ -339,8 +359,129 @@ async def delete_model(model_id: str, admin_id: str):
     try:
         # DB Soft delete for all
         response = supabase.table("ai_models").update({"is_active": False}).eq("id", model_id).execute()
+        gemini_model_pool.invalidate()
+        model_adapters.invalidate()
         return {"status": "success"}
     except Exception as e:
         print(f"Error deleting model: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/admin/models/invalidate-cache")
+async def invalidate_model_cache(admin_id: str):
+    """
+    Drop cached model objects after ai_models was edited outside this API (e.g. Supabase dashboard).
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    gemini_model_pool.invalidate()
+    model_adapters.invalidate()
+    return {"status": "success"}
+
+
+@router.post("/admin/generations/{generation_id}/invalidate-cache")
+async def invalidate_generation_cache(generation_id: str, admin_id: str):
+    """
+    Drop the cached public page of a generation after moderation (blur/delete),
+    and drop it from (or, after an unblur, restore it to) the search index.
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    try:
+        await run_in_threadpool(slug_page_cache.invalidate_generation, generation_id)
+        await search_service.refresh_generation(generation_id)
+        return {"status": "success"}
+    except Exception as e:
+        logger.error(f"Error invalidating generation cache: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/generation-queue")
+async def get_generation_queue_stats(admin_id: str):
+    """
+    Generation scheduler metrics: running/queued jobs per provider, rejections, timeouts and average wait.
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    return generation_scheduler.stats()
+
+
+@router.get("/admin/traces")
+async def list_traces(admin_id: str, limit: int = 50, generation_id: str | None = None):
+    """
+    Recent request traces buffered by this worker (newest first); filter by generation_id to find
+    the /generate request and background task of one generation.
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    return {"tracing": tracer.stats(), "traces": tracer.recent(min(limit, 500), generation_id)}
+
+
+@router.get("/admin/traces/{trace_id}")
+async def get_trace_breakdown(trace_id: str, admin_id: str, format: str = "json"):
+    """
+    Per-request breakdown: span tree with offsets, durations and self time.
+    format=text returns a plain-text flame/waterfall view.
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    breakdown = tracer.breakdown(trace_id)
+    if breakdown is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have been evicted from the buffer)")
+    if format == "text":
+        return PlainTextResponse(render_flame(breakdown))
+    return breakdown
+
+
+@router.get("/admin/profiling/loop")
+async def get_loop_stalls(admin_id: str, limit: int = 50, route: str | None = None):
+    """
+    Event loop watchdog of this worker: recent stalls (newest first) with the blocking call site,
+    the sampled stack and the route they ran for; filter by route template, e.g. "POST /generate".
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    return loop_watchdog.report(min(limit, 500), route)
+
+
+@router.get("/admin/profiling/slow-requests")
+async def get_slow_requests(admin_id: str, route: str | None = None):
+    """Slow (or loop-blocking) requests of this worker per route template, with their blocking call sites."""
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    return slow_request_log.report(route)
+
+
+@router.get("/admin/profiling/profile")
+async def run_sampling_profile(
+    admin_id: str,
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    threads: str = "all",
+    include_idle: bool = False,
+    format: str = "json",
+):
+    """
+    Sample this worker's stacks for `seconds` (threads=all|loop) and return the top functions.
+    format=folded returns collapsed stacks for flamegraph.pl or speedscope.
+    """
+    if not verify_admin_role(admin_id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+
+    try:
+        profile = await run_in_threadpool(sample_profile, seconds, interval_ms, threads == "loop", include_idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse(profile["folded"])
+    return profile
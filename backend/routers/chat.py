@@ -2,28 +2,29 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Union, Any, Dict
 import os
-from openai import AsyncOpenAI
 from fastapi.responses import StreamingResponse
 import json
-import fal_client
-import google.generativeai as genai
+import time
 from services.model_router import model_router
 import asyncio
-import httpx
 from services.supabase_client import supabase
+from services import chat_media
+from services.chat_history import apply_token_budget, estimate_text_tokens
+from services.chat_messages import normalize_messages, to_openai_messages, to_gemini_contents
+from services.gemini_pool import gemini_model_pool
+from services.refine_cache import refine_cache
+from services.tool_runner import run_tool_calls
+from services.fabric_cache import fabric_cache
+from services.metrics import chat_time_to_first_token, observe_first_chunk
+from services.clients import clients, lazy_module
+from fastapi.concurrency import run_in_threadpool
+from utils.logger import get_logger
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-# Initialize OpenAI client
-api_key = os.getenv("OPENAI_API_KEY")
-client = AsyncOpenAI(api_key=api_key) if api_key else None
-
-# Initialize OpenRouter client
-openrouter_key = os.getenv("OPENROUTER_API_KEY")
-openrouter_client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=openrouter_key,
-) if openrouter_key else None
+# Imported on first Gemini chat (or by the startup prewarm); the SDK is slow to import
+genai = lazy_module("google.generativeai")
 
 
 class Message(BaseModel):
@@ -162,7 +163,12 @@ async def refine_prompt(request: RefineRequest):
         "Return ONLY the refined prompt text, no explanations."
     )
     
+    cached = refine_cache.get(request.model, request.prompt)
+    if cached is not None:
+        return {"refined_prompt": cached, "cached": True}
+
     try:
+        client = await clients.aget("openai")
         if not client:
              raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
@@ -177,10 +183,12 @@ async def refine_prompt(request: RefineRequest):
         )
         
         refined_content = response.choices[0].message.content.strip()
+        if refined_content:
+            refine_cache.set(request.model, request.prompt, refined_content)
         return {"refined_prompt": refined_content}
 
     except Exception as e:
-        print(f"Refine error: {e}")
+        logger.error(f"Refine error: {e}")
         # Fallback if AI fails or key missing
         return {"refined_prompt": request.prompt}
 
@@ -209,19 +217,13 @@ async def execute_tool(tool_call_or_name, args_dict=None):
         args = json.loads(tool_call_or_name.function.arguments)
     
     if name == "generate_fabric":
-        # Call Fal.ai for texture generation
-        # Using a fast SDXL model for textures
+        # Served from the R2-backed texture cache; misses generate and re-host on R2
         try:
-            prompt = args["prompt"] + ", top down view, texture, seamless, high quality, 8k"
-            handler = await fal_client.submit_async(
-                "fal-ai/fast-sdxl",
-                arguments={"prompt": prompt, "num_images": 4}
-            )
-            result = await handler.get()
-            images = [img["url"] for img in result["images"]]
+            images, from_cache = await fabric_cache.get_grid(args["prompt"])
+            logger.info(f"Fabric grid for '{args['prompt']}' (cached={from_cache})")
             return f"<FABRIC_GRID>{json.dumps({'images': images, 'prompt': args['prompt']})}</FABRIC_GRID>"
         except Exception as e:
-            print(f"Fal Error: {e}")
+            logger.error(f"Fal Error: {e}")
             return "Sorry, I failed to generate the fabric."
 
     elif name == "generate_palette":
@@ -231,7 +233,7 @@ async def execute_tool(tool_call_or_name, args_dict=None):
     elif name == "web_search":
         # Mock web search results
         query = args["query"]
-        print(f"Web Search Query: {query}")
+        logger.info(f"Web Search Query: {query}")
         # In a real app, call Tavily or Google Search API here
         return f"Search Results for '{query}':\n1. Top Fashion Trends 2025: Sustainable materials, digital fashion, and pastel colors.\n2. Color of the Year: Future Dusk (Blue-Purple).\n3. Fabric Trends: Bio-based leathers and recycled synthetics."
 
@@ -239,7 +241,7 @@ async def execute_tool(tool_call_or_name, args_dict=None):
         # Client-side tools
         # We return a special tag that the frontend will parse and execute
         # We pass the arguments exactly as received
-        print(f"DEBUG: Constructing Client Action: {name} with args: {args}")
+        logger.debug(f"Constructing Client Action: {name} with args: {args}")
         return f"<CLIENT_ACTION type=\"{name}\" args='{json.dumps(args)}' />"
 
     return ""
@@ -273,275 +275,45 @@ def convert_tools_to_gemini(tools):
 async def chat_with_google(model_name: str, messages: List[dict]):
     """
     Handle chat interaction with Google Gemini models.
+    `messages` are canonical OpenAI-style messages (see services.chat_messages).
     Returns AI SDK compatible stream format.
     """
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="GOOGLE_API_KEY not configured")
         
-    genai.configure(api_key=api_key)
-    
-    # 1. Extract System Prompt
-    system_instruction = None
-    chat_history = []
-    last_message = ""
-    
-    print(f"DEBUG: Starting chat_with_google for model {model_name}")
-    
-    for msg in messages:
-        role = msg.get("role")
-        content = msg.get("content")
-        
-        parts = []
-        
-        # Handle complex content (image/text list)
-        if isinstance(content, list):
-            for part in content:
-                if part.get("type") == "text":
-                    text_value = part.get("text")
-                    # Ensure text is a non-empty string, not None
-                    if text_value is not None and str(text_value).strip():
-                        parts.append(str(text_value).strip())
-                elif part.get("type") == "image_url":
-                    # Handle base64 image
-                    url = part.get("image_url", {}).get("url", "")
-                    if url.startswith("data:image"):
-                        try:
-                            # Extract base64 part
-                            header, encoded = url.split(",", 1)
-                            mime_type = header.split(":")[1].split(";")[0]
-                            import base64
-                            image_data = base64.b64decode(encoded)
-                            parts.append({
-                                "inline_data": {
-                                    "mime_type": mime_type,
-                                    "data": image_data
-                                }
-                            })
-                            print(f"DEBUG: Added image input (base64): {mime_type}")
-                        except Exception as e:
-                            print(f"DEBUG: Failed to process base64 image: {e}")
-                    elif url.startswith("http"):
-                        # Handle HTTP URL - Download image
-                        try:
-                            # Use sync download inside async function is risky? No, use httpx.AsyncClient
-                            # But we are in async def but loop is not awaiting here?
-                            # We should use httpx.AsyncClient().get(url)
-                            # But we are gathering parts. We can await here.
-                            async with httpx.AsyncClient() as client:
-                                resp = await client.get(url)
-                                resp.raise_for_status()
-                                content_type = resp.headers.get("content-type", "image/jpeg")
-                                image_data = resp.content
-                                parts.append({
-                                    "inline_data": {
-                                        "mime_type": content_type,
-                                        "data": image_data
-                                    }
-                                })
-                                print(f"DEBUG: Added image input (url): {content_type}")
-                        except Exception as e:
-                            print(f"DEBUG: Failed to download image {url}: {e}")
-        elif isinstance(content, str):
-            # Ensure content is not empty
-            content_str = content.strip()
-            if content_str:
-                parts.append(content_str)
-        
-        # Filter out None values, empty strings, and ensure all text parts are non-empty strings
-        filtered_parts = []
-        for p in parts:
-            if p is None:
-                continue
-            if isinstance(p, str):
-                # Only add non-empty strings
-                if p.strip():
-                    filtered_parts.append(p.strip())
-            elif isinstance(p, dict):
-                # Keep dict parts (for images)
-                filtered_parts.append(p)
-        
-        parts = filtered_parts
-        
-        if not parts:
-            print(f"DEBUG: Skipping message with role {role} - no valid parts")
-            continue
-
-        if role == "system":
-            # For system instruction, extract first string part or convert to string
-            # Only use string parts, ignore dict parts (images) for system instruction
-            string_parts = [str(p).strip() for p in parts if isinstance(p, str) and str(p).strip()]
-            if string_parts:
-                system_instruction = " ".join(string_parts)
-            else:
-                system_instruction = SYSTEM_PROMPT
-            # Ensure system_instruction is a non-empty string
-            if not system_instruction or not isinstance(system_instruction, str):
-                system_instruction = SYSTEM_PROMPT
-            print(f"DEBUG: System instruction set (length={len(system_instruction)}): {system_instruction[:50]}...")
-        elif role == "user":
-            # Ensure all parts are valid (non-empty strings or dicts for images)
-            valid_parts = []
-            for p in parts:
-                if isinstance(p, str) and p.strip():
-                    valid_parts.append(p.strip())
-                elif isinstance(p, dict):
-                    valid_parts.append(p)
-            if valid_parts:
-                print(f"DEBUG: Adding user message with {len(valid_parts)} parts")
-                chat_history.append({"role": "user", "parts": valid_parts})
-                last_message = valid_parts
-        elif role == "assistant":
-            # Ensure all parts are valid (non-empty strings or dicts for images)
-            valid_parts = []
-            for p in parts:
-                if isinstance(p, str) and p.strip():
-                    valid_parts.append(p.strip())
-                elif isinstance(p, dict):
-                    valid_parts.append(p)
-            if valid_parts:
-                print(f"DEBUG: Adding assistant message with {len(valid_parts)} parts")
-                chat_history.append({"role": "model", "parts": valid_parts})
-
-    # Ensure system_instruction is set and is a valid string
-    if not system_instruction or not isinstance(system_instruction, str) or not system_instruction.strip():
-        system_instruction = SYSTEM_PROMPT
-    system_instruction = str(system_instruction).strip()
-    
-    # Remove the last message from history as it will be sent in send_message
-    if chat_history and chat_history[-1]["role"] == "user":
-        chat_history.pop()
-    
-    print(f"DEBUG: History length: {len(chat_history)}")
-    print(f"DEBUG: Last message parts: {last_message if last_message else 'None'}")
-    
-    # Validate chat_history - ensure all parts are valid
-    validated_history = []
-    for entry in chat_history:
-        validated_parts = []
-        for p in entry.get("parts", []):
-            if isinstance(p, str) and p.strip():
-                validated_parts.append(p.strip())
-            elif isinstance(p, dict):
-                validated_parts.append(p)
-        if validated_parts:
-            validated_history.append({
-                "role": entry["role"],
-                "parts": validated_parts
-            })
+    gemini_model_pool.configure(genai, api_key)
     
-    chat_history = validated_history
-    print(f"DEBUG: Validated history length: {len(chat_history)}")
-    
-    # 2. Initialize Model with Tools
-    gemini_tools = convert_tools_to_gemini(TOOLS)
+    logger.debug(f"Starting chat_with_google for model {model_name}")
+
+    # 1. Build system instruction, history and current message in one validated pass
+    system_instruction, chat_history, current_msg_parts = await to_gemini_contents(messages, SYSTEM_PROMPT)
+    logger.debug(f"History length: {len(chat_history)}, current message parts: {len(current_msg_parts)}")
     
+    # 2. Reuse a prepared Model with Tools (built lazily, shared across requests)
     try:
-        # Double-check history before creating model
-        final_history = []
-        for entry in chat_history:
-            final_parts = []
-            for p in entry.get("parts", []):
-                if isinstance(p, str):
-                    # Ensure it's a non-empty string
-                    p_str = str(p).strip()
-                    if p_str:
-                        final_parts.append(p_str)
-                elif isinstance(p, dict):
-                    # Keep dict parts (for images) - validate structure
-                    if "mime_type" in p and "data" in p:
-                        final_parts.append(p)
-                    else:
-                        print(f"DEBUG: Skipping invalid dict part: {p}")
-            if final_parts:
-                final_history.append({
-                    "role": entry["role"],
-                    "parts": final_parts
-                })
-        
-        print(f"DEBUG: Final history for model creation: {len(final_history)} entries")
-        for i, entry in enumerate(final_history):
-            parts_info = []
-            for p in entry['parts']:
-                if isinstance(p, str):
-                    parts_info.append(f"str({len(p)} chars)")
-                elif isinstance(p, dict):
-                    parts_info.append(f"dict({p.get('mime_type', 'unknown')})")
-                else:
-                    parts_info.append(f"{type(p).__name__}")
-            print(f"DEBUG: Entry {i}: role={entry['role']}, parts_count={len(entry['parts'])}, parts={parts_info}")
-        
-        # Validate system_instruction one more time
-        if not isinstance(system_instruction, str) or not system_instruction.strip():
-            print(f"DEBUG: Invalid system_instruction, using default")
-            system_instruction = SYSTEM_PROMPT
-        
-        print(f"DEBUG: Creating GenerativeModel with system_instruction type={type(system_instruction).__name__}, length={len(system_instruction)}")
-        
-        model = genai.GenerativeModel(
-            model_name,
-            system_instruction=system_instruction,
-            tools=gemini_tools,
-            # Set tool config to auto
-            tool_config={'function_calling_config': 'AUTO'}
-        )
+        gemini_tools = gemini_model_pool.get_tools(TOOLS, convert_tools_to_gemini)
+        model = gemini_model_pool.get_model(genai, model_name, system_instruction, gemini_tools)
         
-        print(f"DEBUG: Model created successfully")
-        
-        # Don't create chat here if we're using mock response
-        chat = model.start_chat(history=final_history)
+        chat = model.start_chat(history=chat_history)
         
     except Exception as e:
-        print(f"DEBUG: Error creating model: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Error creating model: {e}", exc_info=True)
         if "429" in str(e) or "ResourceExhausted" in str(e) or "Quota exceeded" in str(e):
              yield format_ai_sdk_stream("⚠️ **系统繁忙 (配额超限)**\n\nAI 模型当前繁忙，请等待一分钟后再试。")
         else:
              yield format_ai_sdk_stream(f"Error initializing model: {str(e)}")
         return
     
-    # 4. Generate Response (Stream)
+    # 3. Generate Response (Stream)
     # We use stream=True but need to buffer to check for function calls
-    print(f"Sending message to Google model: {model_name}")
+    logger.info(f"Sending message to Google model: {model_name}")
     
     try:
-        # Get the last user message to send
-        if last_message:
-            # Validate last_message parts
-            validated_last_message = []
-            for p in last_message:
-                if isinstance(p, str) and p.strip():
-                    validated_last_message.append(p.strip())
-                elif isinstance(p, dict):
-                    validated_last_message.append(p)
-            current_msg_parts = validated_last_message if validated_last_message else ["Hello"]
-            history_context = chat_history
-        elif len(chat_history) > 0 and chat_history[-1]["role"] == "user":
-            current_msg_parts = chat_history[-1]["parts"]
-            history_context = chat_history[:-1]
-        else:
-            # Fallback if weird structure
-            current_msg_parts = ["Hello"]
-            history_context = []
-
-        # Validate current_msg_parts before sending
-        final_parts = []
-        for p in current_msg_parts:
-            if isinstance(p, str) and p.strip():
-                final_parts.append(p.strip())
-            elif isinstance(p, dict):
-                final_parts.append(p)
-        
-        if not final_parts:
-            final_parts = ["Hello"]
-        
-        print(f"DEBUG: Sending {len(final_parts)} parts to Gemini: {[str(p)[:50] if isinstance(p, str) else 'image' for p in final_parts]}")
-        response = await chat.send_message_async(final_parts, stream=True)
+        response = await chat.send_message_async(current_msg_parts, stream=True)
         
-        print(f"DEBUG: Response stream started. Iterating...")
+        tool_calls = []
         async for chunk in response:
-            print(f"DEBUG: Received chunk: {chunk.text if hasattr(chunk, 'text') else 'No text'}")
             if hasattr(chunk, "text") and chunk.text:
                 yield format_ai_sdk_stream(chunk.text)
             
@@ -551,15 +323,14 @@ async def chat_with_google(model_name: str, messages: List[dict]):
             # We need to inspect parts.
             for part in chunk.parts:
                 if fn := part.function_call:
-                    print(f"DEBUG: Function Call detected: {fn.name}")
-                    # Execute tool and yield result tag
-                    tool_result = await execute_tool(fn.name, dict(fn.args))
-                    print(f"DEBUG: Tool execution result: {tool_result[:50]}...")
-                    yield format_ai_sdk_stream(tool_result)
+                    logger.debug(f"Function Call detected: {fn.name}")
+                    tool_calls.append((fn.name, dict(fn.args)))
+
+        # Execute all tools of the turn concurrently, streaming each result tag as it completes
+        async for tool_result in run_tool_calls(tool_calls, execute_tool):
+            yield format_ai_sdk_stream(tool_result + "\n")
     except Exception as e:
-        print(f"DEBUG: Gemini Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Gemini Error: {e}", exc_info=True)
         if "429" in str(e) or "ResourceExhausted" in str(e) or "Quota exceeded" in str(e):
              yield format_ai_sdk_stream("⚠️ **系统繁忙 (配额超限)**\n\nAI 模型当前繁忙，请等待一分钟后再试。")
         else:
@@ -568,54 +339,20 @@ async def chat_with_google(model_name: str, messages: List[dict]):
 
 @router.post("/chat")
 async def chat_endpoint(request: ChatRequest):
+    started_at = time.perf_counter()
+    client, openrouter_client = await clients.aget("openai"), await clients.aget("openrouter")
     try:
-        print(f"DEBUG: Chat Request received for model {request.model}")
-        print(f"DEBUG: Request messages count: {len(request.messages)}")
-        for i, m in enumerate(request.messages):
-            print(f"DEBUG: Message {i}: role={m.role}, content_type={type(m.content).__name__}, content_length={len(str(m.content)) if m.content else 0}")
-        
-        # Process messages to handle vision input
-        processed_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        
+        logger.debug(f"Chat Request received for model {request.model}")
+        logger.debug(f"Request messages count: {len(request.messages)}")
+
+        # Offload inline base64 images to R2 once; everything below works on short URLs
         for m in request.messages:
-            content = m.content
-            # Ensure content is a string
-            if not isinstance(content, str):
-                print(f"DEBUG: Warning: content is not a string, converting: {type(content)}")
-                content = str(content) if content else ""
-            
-            # Check for our custom image tag convention: [IMAGE]data:image/png;base64,...[/IMAGE]
-            if "[IMAGE]" in content and "[/IMAGE]" in content:
-                parts = content.split("[IMAGE]")
-                text_part = parts[0].strip()
-                image_part = parts[1].split("[/IMAGE]")[0].strip()
-                
-                new_content = []
-                # Always add text part to satisfy strict API requirements (Gemini via OpenRouter)
-                # Use a space if empty, as some APIs reject empty strings
-                text_content = str(text_part) if text_part else " "
-                new_content.append({"type": "text", "text": text_content})
-                
-                if image_part:
-                    new_content.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": str(image_part)
-                        }
-                    })
-                
-                processed_messages.append({"role": m.role, "content": new_content})
-            else:
-                # Ensure content is a non-empty string
-                if content and content.strip():
-                    processed_messages.append({"role": m.role, "content": str(content).strip()})
-                else:
-                    print(f"DEBUG: Skipping empty message for role {m.role}")
+            if isinstance(m.content, str) and "data:image" in m.content:
+                m.content = await run_in_threadpool(chat_media.offload_inline_images, m.content)
 
-        print(f"DEBUG: Processed messages count: {len(processed_messages)}")
-        for i, msg in enumerate(processed_messages):
-            content_type = type(msg.get("content")).__name__
-            print(f"DEBUG: Processed message {i}: role={msg.get('role')}, content_type={content_type}")
+        # Parse the [IMAGE] tag convention once into canonical OpenAI-style messages
+        messages = normalize_messages(request.messages)
+        logger.debug(f"Normalized messages count: {len(messages)}")
 
         # 1. Fetch Model Config from Database
         active_client = client
@@ -628,10 +365,10 @@ async def chat_endpoint(request: ChatRequest):
             
             if db_model:
                 model_provider = db_model.get("provider", "OPENAI").upper()
-                print(f"DEBUG: Resolved model {request.model} to provider {model_provider}")
+                logger.debug(f"Resolved model {request.model} to provider {model_provider}")
             else:
                 # Fallback heuristics
-                print(f"DEBUG: Model {request.model} not found in DB, using heuristics")
+                logger.debug(f"Model {request.model} not found in DB, using heuristics")
                 if request.model.startswith("models/gemini"):
                      model_provider = "GOOGLE"
                 elif "/" in request.model:
@@ -641,7 +378,7 @@ async def chat_endpoint(request: ChatRequest):
                 else:
                      model_provider = "OPENAI"
         except Exception as e:
-            print(f"Error fetching model config: {e}")
+            logger.error(f"Error fetching model config: {e}")
             # Fallback heuristics on DB error
             if request.model.startswith("models/gemini"):
                     model_provider = "GOOGLE"
@@ -652,8 +389,10 @@ async def chat_endpoint(request: ChatRequest):
 
         # 2. Select Client based on Provider
         if model_provider == "GOOGLE":
+             # Keep the prompt inside the context budget (system prompt + recent turns)
+             google_messages = apply_token_budget([{"role": "system", "content": SYSTEM_PROMPT}] + messages)
              return StreamingResponse(
-                 chat_with_google(request.model, processed_messages),
+                 observe_first_chunk(chat_with_google(request.model, google_messages), chat_time_to_first_token, started_at, provider="GOOGLE"),
                  media_type="text/event-stream"
              )
         
@@ -661,99 +400,19 @@ async def chat_endpoint(request: ChatRequest):
             if not openrouter_client:
                 raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
             active_client = openrouter_client
-            print(f"DEBUG: Using OpenRouter client")
+            logger.debug("Using OpenRouter client")
             
         elif model_provider == "OPENAI":
              if not client:
                 raise HTTPException(status_code=500, detail="OpenAI API key not configured")
              active_client = client
-             print(f"DEBUG: Using OpenAI client")
+             logger.debug("Using OpenAI client")
 
         # --- Enhanced Message Processing for Compatibility ---
-        
-        final_messages = []
-        
-        # 1. Handle System Prompt
-        current_system_prompt = SYSTEM_PROMPT
-        
-        temp_messages = []
-        for m in request.messages:
-             content = m.content
-             if not isinstance(content, str):
-                 content = str(content) if content else ""
-             
-             if "[IMAGE]" in content and "[/IMAGE]" in content:
-                 parts = content.split("[IMAGE]")
-                 text_part = parts[0].strip()
-                 image_part = parts[1].split("[/IMAGE]")[0].strip()
-                 
-                 new_content = []
-                 text_content = str(text_part) if text_part else " "
-                 new_content.append({"type": "text", "text": text_content})
-                 
-                 if image_part:
-                     new_content.append({
-                         "type": "image_url",
-                         "image_url": {
-                             "url": str(image_part)
-                         }
-                     })
-                 temp_messages.append({"role": m.role, "content": new_content})
-             else:
-                 if content and content.strip():
-                     temp_messages.append({"role": m.role, "content": str(content).strip()})
-        
-        # 2. Merge Strategies
-        merged_messages = []
-        
-        if temp_messages:
-            first_msg = temp_messages[0]
-            if first_msg["role"] == "user":
-                if isinstance(first_msg["content"], str):
-                    first_msg["content"] = current_system_prompt + "\n\n" + first_msg["content"]
-                elif isinstance(first_msg["content"], list):
-                    text_found = False
-                    for part in first_msg["content"]:
-                        if part.get("type") == "text":
-                            part["text"] = current_system_prompt + "\n\n" + part["text"]
-                            text_found = True
-                            break
-                    if not text_found:
-                        first_msg["content"].insert(0, {"type": "text", "text": current_system_prompt + "\n\n"})
-            else:
-                merged_messages.append({"role": "user", "content": current_system_prompt})
-        else:
-             merged_messages.append({"role": "user", "content": current_system_prompt})
-
-        for msg in temp_messages:
-            if not merged_messages:
-                merged_messages.append(msg)
-                continue
-            
-            last_msg = merged_messages[-1]
-            
-            if last_msg["role"] == msg["role"]:
-                if isinstance(last_msg["content"], str) and isinstance(msg["content"], str):
-                    last_msg["content"] += "\n\n" + msg["content"]
-                else:
-                    if isinstance(last_msg["content"], str):
-                        last_msg["content"] = [{"type": "text", "text": last_msg["content"]}]
-                    
-                    if isinstance(msg["content"], str):
-                        last_msg["content"].append({"type": "text", "text": msg["content"]})
-                    elif isinstance(msg["content"], list):
-                        last_msg["content"].extend(msg["content"])
-        
-        for msg in merged_messages:
-            if isinstance(msg["content"], list):
-                if all(part.get("type") == "text" for part in msg["content"]):
-                    msg["content"] = "\n\n".join(part["text"] for part in msg["content"])
-
-        processed_messages = merged_messages
-        
-        # Debug Payload
-        payload_debug = json.dumps(processed_messages, default=str)
-        print(f"DEBUG: Processed Messages Payload: payload_debug")
+        # System prompt is merged into the first user turn, so reserve room for it in the budget
+        messages = apply_token_budget(messages, reserved_tokens=estimate_text_tokens(SYSTEM_PROMPT))
+        processed_messages = to_openai_messages(messages, SYSTEM_PROMPT)
+        logger.debug(f"Processed messages count: {len(processed_messages)}")
 
         # Smart Model Selection with Auto-Fallback
         attempted_models = []
@@ -788,11 +447,11 @@ async def chat_endpoint(request: ChatRequest):
                  continue 
 
             if not model_router.is_model_available(model_path):
-                print(f"Skipping {model_path} (in cooldown)")
+                logger.info(f"Skipping {model_path} (in cooldown)")
                 continue
             
             try:
-                print(f"Attempting model: {model_path} via {current_provider}")
+                logger.info(f"Attempting model: {model_path} via {current_provider}")
                 attempted_models.append(model_path)
                 
                 response = await current_client.chat.completions.create(
@@ -803,7 +462,7 @@ async def chat_endpoint(request: ChatRequest):
                     stream=False
                 )
                 
-                print(f"✓ Model {model_path} succeeded")
+                logger.info(f"✓ Model {model_path} succeeded")
                 break
                 
             except Exception as e:
@@ -811,15 +470,15 @@ async def chat_endpoint(request: ChatRequest):
                 last_error = e
                 
                 if "429" in error_str or "rate limit" in error_str or "quota" in error_str:
-                    print(f"✗ Model {model_path} rate limited")
+                    logger.warning(f"✗ Model {model_path} rate limited")
                     model_router.mark_model_failed(model_path)
                 else:
-                    print(f"✗ Model {model_path} failed: {str(e)[:100]}")
+                    logger.warning(f"✗ Model {model_path} failed: {str(e)[:100]}")
                 
                 continue
         
         if response is None:
-            print(f"All models failed. Attempted: {attempted_models}")
+            logger.error(f"All models failed. Attempted: {attempted_models}")
             cooldown_info = model_router.get_cooldown_info()
             
             async def all_failed_generator():
@@ -842,11 +501,23 @@ async def chat_endpoint(request: ChatRequest):
         message = response.choices[0].message
 
         if message.tool_calls:
+            tool_calls = []
             for tool_call in message.tool_calls:
-                result = await execute_tool(tool_call)
-                async def tool_response_generator():
-                    yield format_ai_sdk_stream(str(result))
-                return StreamingResponse(tool_response_generator(), media_type="text/event-stream")
+                try:
+                    args = json.loads(tool_call.function.arguments or "{}")
+                except json.JSONDecodeError:
+                    logger.warning(f"Invalid arguments for tool {tool_call.function.name}: {tool_call.function.arguments}")
+                    args = {}
+                tool_calls.append((tool_call.function.name, args))
+
+            async def tool_response_generator():
+                # All tool calls run concurrently; each result is streamed as soon as it completes
+                async for result in run_tool_calls(tool_calls, execute_tool):
+                    yield format_ai_sdk_stream(result + "\n")
+            return StreamingResponse(
+                observe_first_chunk(tool_response_generator(), chat_time_to_first_token, started_at, provider=current_provider),
+                media_type="text/event-stream"
+            )
         
         else:
             content = message.content or ""
@@ -858,17 +529,18 @@ async def chat_endpoint(request: ChatRequest):
                     yield format_ai_sdk_stream(chunk)
                     await asyncio.sleep(0.01)
             
-            return StreamingResponse(text_response_generator(), media_type="text/event-stream")
+            return StreamingResponse(
+                observe_first_chunk(text_response_generator(), chat_time_to_first_token, started_at, provider=current_provider),
+                media_type="text/event-stream"
+            )
 
     except Exception as e:
-        print(f"Chat Endpoint Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Chat Endpoint Error: {e}", exc_info=True)
         
         error_str = str(e)
         if "429" in error_str or "rate limit" in error_str.lower() or "quota" in error_str.lower():
              model_name = request.model
-             print(f"DEBUG: Returning 429 Error Response for {model_name}")
+             logger.warning(f"Returning 429 Error Response for {model_name}")
              
              async def error_generator():
                  yield format_ai_sdk_stream(f"⚠️ **系统繁忙 (配额超限)**\n\n模型 `{model_name}` 当前请求量过大或配额不足。\n\n**建议操作**：\n1. 请稍等几分钟后再试。\n2. 尝试切换其他模型 (如 GLM-4 Air)。")
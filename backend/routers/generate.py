@@ -1,12 +1,14 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Response
 from pydantic import BaseModel
 from services.supabase_client import supabase
+import asyncio
 import time
 import uuid
-from utils.logger import logger
+from utils.logger import get_logger
 from typing import Optional
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -24,7 +26,25 @@ class GenerateRequest(BaseModel):
     num_images: int = 1 # New: Number of images to generate
 
 from services import fal_ai, storage, replicate_service, openrouter_service
-
+from services.generation_scheduler import generation_scheduler, GenerationQueueFull
+from services.credit_ledger import credit_ledger, InsufficientCreditsError
+from services.model_adapters import model_adapters, AdapterValidationError
+from services.search_index import search_service
+from services.sitemap import sitemap_service
+from services.slug_cache import slug_page_cache, SLUG_NEGATIVE_TTL, SLUG_PAGE_MAX_AGE
+from utils.http_cache import not_modified
+from services.metrics import generation_duration, generation_queue_wait, generation_failures
+from services.tracing import traced, tracer
+from fastapi.concurrency import run_in_threadpool
+
+QUEUE_FULL_DETAIL = "Too many generations in progress. Please wait for some to finish."
+
+def ensure_queue_capacity(user_id: str):
+    """Reject before credits are deducted if the user already has too many generations pending."""
+    if not generation_scheduler.has_capacity(user_id):
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+
+@traced("generation.process")
 async def process_generation_task(
     generation_id: str, 
     prompt: str, 
@@ -36,7 +56,9 @@ async def process_generation_task(
     duration: str | None,
     references: list[str] | None,
     resolution: str | None,
-    num_images: int
+    num_images: int,
+    user_id: str | None = None,
+    reservation_id: str | None = None
 ):
     """
     Executes AI generation using Unified Provider Architecture.
@@ -44,6 +66,10 @@ async def process_generation_task(
     """
     from providers.factory import ProviderFactory
 
+    provider_name, started_at, provider_done = "UNKNOWN", None, False
+    # Metric labels only take values from ai_models (or constants): request.model/type are client input
+    model_label, type_label = "unknown", "video" if type == "video" else "image"
+    tracer.current().set_attribute("generation_id", generation_id)
     try:
         logger.info(f"--- Processing Generation Task {generation_id} ---")
         
@@ -56,6 +82,7 @@ async def process_generation_task(
                 # Prioritize DB api_path over payload model
                 if model_config.get("api_path"):
                     model = model_config.get("api_path")
+                model_label = model_config.get("api_path") or str(model_config.get("id"))
 
         # 2. Determine Provider from DB Configuration
         provider_name = model_config.get("provider", "FAL") if model_config else "FAL"
@@ -65,8 +92,13 @@ async def process_generation_task(
         
         logger.info(f"Using Provider: {provider_name} for model: {model}")
 
-        # 3. Get Async Provider
-        provider = ProviderFactory.get_provider(provider_name)
+        # 3. Get Async Provider and the model's compiled adapter (cached per model version)
+        # Provider construction may build its SDK client; keep that off the event loop
+        provider = await run_in_threadpool(ProviderFactory.get_provider, provider_name)
+        if model_config:
+            adapter = model_adapters.get(model_config, type)
+        else:
+            adapter = model_adapters.for_path(provider_name, model, type)
         
         # 4. Resolve Parameters (Legacy + Dynamic)
         final_ar = aspect_ratio
@@ -75,59 +107,95 @@ async def process_generation_task(
         if not final_ar:
              final_ar = "1:1" if type == "image" else "16:9"
 
-        # 5. Generate (Async Wait)
-        temp_url = ""
-        if type == "video":
-            temp_url = await provider.generate_video(
-                prompt=prompt,
-                model_path=model,
-                duration=duration or "5s",
-                aspect_ratio=final_ar,
-                references=references,
-                parameters=parameters
-            )
-        else:
-            temp_url = await provider.generate_image(
-                prompt=prompt,
-                model_path=model,
-                aspect_ratio=final_ar,
-                references=references,
-                parameters=parameters,
-                resolution=resolution,
-                num_images=num_images
-            )
-            
-        logger.info(f"Generation successful. Temp URL: {temp_url}")
-
-        # 6. Upload to R2 (Async wrapper if storage is sync, but storage currently is sync-only in service)
-        # TODO: Refactor storage to async in future. For now, wrap in threadpool if heavy?
-        # storage.upload_to_r2 does requests.get and requests.put usually.
-        # We should wrap it.
-        from fastapi.concurrency import run_in_threadpool
-        final_url = await run_in_threadpool(storage.upload_to_r2, temp_url)
+        # 5. Generate (Async Wait) - queued behind the provider/user concurrency limits
+        result = None
+        cost = float((model_config or {}).get("cost_per_gen") or 1)
+        queued_at = time.perf_counter()
+        queue_span = tracer.span("provider.queue", provider=provider_name)
+        async with generation_scheduler.slot(provider_name, user_id or generation_id, cost=cost):
+            queue_span.finish()
+            generation_queue_wait.observe(time.perf_counter() - queued_at, provider=provider_name)
+            started_at = time.perf_counter()
+            with tracer.span("provider.generate", provider=provider_name, model=model, type=type) as span:
+                if type == "video":
+                    result = await provider.generate_video(
+                        prompt=prompt,
+                        model_path=model,
+                        duration=duration or "5s",
+                        aspect_ratio=final_ar,
+                        references=references,
+                        parameters=parameters,
+                        adapter=adapter
+                    )
+                else:
+                    result = await provider.generate_image(
+                        prompt=prompt,
+                        model_path=model,
+                        aspect_ratio=final_ar,
+                        references=references,
+                        parameters=parameters,
+                        resolution=resolution,
+                        num_images=num_images,
+                        adapter=adapter
+                    )
+                span.set_attribute("assets", len(result.assets))
+                if result.seed is not None:
+                    span.set_attribute("seed", result.seed)
+
+        if not result.assets:
+            raise Exception(f"{provider_name} returned no outputs")
+        logger.info(f"Generation successful: {len(result.assets)} output(s)", extra={"generation_id": generation_id, **result.describe()})
+        generation_duration.observe(time.perf_counter() - started_at, provider=provider_name, model=model_label, type=type_label, status="ok")
+        provider_done = True
+
+        # 6. Upload every output to R2 in parallel (storage is sync; each upload runs in the threadpool)
+        final_urls = await asyncio.gather(*(
+            run_in_threadpool(storage.upload_asset_to_r2, asset) for asset in result.assets
+        ))
+        final_url = final_urls[0]
         
         logger.info(f"Upload successful. Final URL: {final_url}")
         
-        # 7. Update Database
+        # 7. Update Database (result_url stays the first output for existing readers)
         supabase.table("generations").update({
             "status": "COMPLETED",
-            "result_url": final_url
+            "result_url": final_url,
+            "outputs": [{"url": url, **asset.describe()} for url, asset in zip(final_urls, result.assets)],
+            "result_metadata": result.describe(),
         }).eq("id", generation_id).execute()
         
         logger.info(f"Task {generation_id} Completed.")
+        credit_ledger.commit(reservation_id, generation_id)
 
     except Exception as e:
         logger.error(f"Generation {generation_id} failed: {e}", exc_info=True)
+        tracer.current().record_exception(e)
+        generation_failures.inc(provider=provider_name, model=model_label)
+        if started_at is not None and not provider_done:
+            generation_duration.observe(time.perf_counter() - started_at, provider=provider_name, model=model_label, type=type_label, status="error")
+        await credit_ledger.release(reservation_id, f"Generation {generation_id} failed: {e}"[:500])
         supabase.table("generations").update({
             "status": "FAILED"
         }).eq("id", generation_id).execute()
+        return
+
+    # 8. Post-completion hooks: the generation is done and paid for, so a failure here
+    # must not refund it or mark it FAILED
+    try:
+        await search_service.refresh_generation(generation_id)
+        sitemap_service.mark_changed()
+        await run_in_threadpool(slug_page_cache.populate, generation_id)
+    except Exception as e:
+        logger.error(f"Post-completion hooks failed for generation {generation_id}: {e}", exc_info=True)
 
 @router.post("/generate")
 async def generate_image(request: GenerateRequest, background_tasks: BackgroundTasks):
     try:
-        with open("debug_gen.log", "a") as f:
-            f.write(f"\n[{time.strftime('%X')}] API: Received /generate request\n")
-            f.write(f"User: {request.user_id}, Prompt: {request.prompt[:50]}..., Model ID: {request.model_id}\n")
+        logger.debug("Received /generate request", extra={
+            "user_id": request.user_id, "prompt": request.prompt[:50], "model_id": request.model_id
+        })
+
+        ensure_queue_capacity(request.user_id)
 
         # 1. Fetch model configuration to determine cost
         cost = 4  # Default cost
@@ -136,11 +204,11 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
         if request.model_id:
             # Fetch from database
             # Try api_path first (for legacy string IDs like "flux-pro"), then fallback to UUID
-            model_response = supabase.table("ai_models").select("cost_per_gen, api_path, provider").eq("api_path", request.model_id).eq("is_active", True).execute()
+            model_response = supabase.table("ai_models").select("*").eq("api_path", request.model_id).eq("is_active", True).execute()
             
             # If not found by api_path, try by UUID (id)
             if not model_response.data or len(model_response.data) == 0:
-                model_response = supabase.table("ai_models").select("cost_per_gen, api_path, provider").eq("id", request.model_id).eq("is_active", True).execute()
+                model_response = supabase.table("ai_models").select("*").eq("id", request.model_id).eq("is_active", True).execute()
             
             if model_response.data and len(model_response.data) > 0:
                 model_config = model_response.data[0]
@@ -155,18 +223,37 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
             else:
                 cost = 4
 
-        # 2. Deduct Credits
+        # 2. Validate inputs against the model's compiled adapter (fails before any credits are held)
         try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": cost
-            }).execute()
-            with open("debug_gen.log", "a") as f: f.write(f"credits deducted: {cost}\n")
-        except Exception as e:
-            with open("debug_gen.log", "a") as f: f.write(f"CREDIT ERROR: {str(e)}\n")
-            raise HTTPException(status_code=402, detail=f"Insufficient credits or error: {str(e)}")
-
-        # 3. Create Generation Record with Slug
+            # Compiling raises too if ai_models.adapter was saved with an invalid spec
+            if model_config:
+                adapter = model_adapters.get(model_config, request.type)
+            else:
+                adapter = model_adapters.for_path("FAL", request.model, request.type)
+            adapter.validate(
+                request.prompt,
+                aspect_ratio=request.aspect_ratio,
+                duration=request.duration,
+                references=request.references,
+                parameters=request.parameters,
+                resolution=request.resolution,
+                num_images=request.num_images,
+            )
+        except AdapterValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        # 3. Reserve Credits (committed when the generation completes, released if it fails)
+        try:
+            reservation_id = await credit_ledger.reserve(request.user_id, int(cost), f"Generation ({request.type})")
+            logger.debug("Credits reserved", extra={"user_id": request.user_id, "credits": cost})
+        except InsufficientCreditsError as e:
+            logger.info("Credit reservation refused", extra={"user_id": request.user_id, "error": str(e)})
+            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        except Exception:
+            logger.error("Credit reservation failed", extra={"user_id": request.user_id}, exc_info=True)
+            raise HTTPException(status_code=503, detail="Credit service unavailable, please try again")
+
+        # 4. Create Generation Record with Slug
         from slugify import slugify
         
         # Generate slug: first 10 words + short UUID
@@ -185,16 +272,23 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
             "slug": slug
         }
         
-        response = supabase.table("generations").insert(generation_data).execute()
+        try:
+            response = supabase.table("generations").insert(generation_data).execute()
+        except Exception:
+            await credit_ledger.release(reservation_id, "Failed to create generation record")
+            raise
         
-        with open("debug_gen.log", "a") as f: f.write(f"DB Insert Response: {response.data}\n")
+        logger.debug("Generation record inserted", extra={"rows": response.data})
         
         if not response.data:
+            await credit_ledger.release(reservation_id, "Failed to create generation record")
             raise HTTPException(status_code=500, detail="Failed to create generation record")
             
         generation_id = response.data[0]['id']
+        tracer.current().set_attribute("generation_id", generation_id)
+        await credit_ledger.attach(reservation_id, generation_id)
 
-        # 4. Start Background Task (Real AI Generation)
+        # 5. Start Background Task (Real AI Generation)
         background_tasks.add_task(
             process_generation_task, 
             generation_id, 
@@ -207,7 +301,9 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
             request.duration,
             request.references or [],
             request.resolution,
-            request.num_images
+            request.num_images,
+            request.user_id,
+            reservation_id
         )
 
         return {"status": "pending", "generation_id": generation_id, "slug": slug}
@@ -219,22 +315,39 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @router.get("/generations/slug/{slug}")
-async def get_generation_by_slug(slug: str):
+async def get_generation_by_slug(slug: str, request: Request):
     """
     Get public generation details by slug for SEO/Explore pages.
+    Completed pages are served from the slug cache with a strong ETag and a short
+    max-age; nginx/CDN answer repeats and revalidate afterwards (304 while unchanged),
+    so moderation and profile edits reach them within SLUG_PAGE_MAX_AGE.
     """
     try:
-        response = supabase.table("generations").select("*, profiles(username, avatar_url)").eq("slug", slug).execute()
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Generation not found")
-        return response.data[0]
+        page = slug_page_cache.get(slug)
+        if page is None:
+            page = await run_in_threadpool(slug_page_cache.load, slug)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    body, etag = page
+    if body is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Generation not found",
+            headers={"Cache-Control": f"public, max-age={SLUG_NEGATIVE_TTL}"}
+        )
+    response = Response(content=body, media_type="application/json")
+    if etag is None:
+        # Still in progress (the page will change) or flagged NSFW: always revalidate
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return not_modified(request, response, etag, f"public, max-age={SLUG_PAGE_MAX_AGE}") or response
+
 @router.get("/generations/sitemap")
 async def get_generations_sitemap(limit: int = 5000):
     """
     Get top public generations for sitemap.
+    Kept for older frontends; crawlers should use the sharded /sitemap.xml index.
     """
     try:
         # Fetch completed generations, ordered by created_at desc
@@ -282,50 +395,54 @@ class ImageProcessRequest(BaseModel):
 @router.post("/generate/upscale")
 async def upscale_image_endpoint(request: ImageProcessRequest):
     try:
-        # 1. Deduct Credits (e.g., 2 credits for 2x, 4 for 4x, 8 for 8x?)
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 2 credits for 2x, 4 for 4x, 8 for 8x?) - released automatically if the call fails
         # Let's keep it simple: 2 credits for any upscale for now, or scale * 1
         cost = 2
         if request.scale > 2:
             cost = 4 # Higher cost for 4x/8x
         
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": cost
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        async with credit_ledger.hold(request.user_id, cost, "Upscale"):
+            # 2. Call AI Service (Fal.ai preferred over Replicate for reliability)
+            # temp_url = replicate_service.upscale_image(request.image_url)
+            async with generation_scheduler.slot("FAL", request.user_id):
+                temp_url = await run_in_threadpool(fal_ai.upscale_image, request.image_url, request.scale)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service (Fal.ai preferred over Replicate for reliability)
-        # temp_url = replicate_service.upscale_image(request.image_url)
-        temp_url = fal_ai.upscale_image(request.image_url, scale=request.scale)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate/remove-background")
 async def remove_background_endpoint(request: ImageProcessRequest):
     try:
-        # 1. Deduct Credits (e.g., 1 credit for remove bg)
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": 1
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 1 credit for remove bg) - released automatically if the call fails
+        async with credit_ledger.hold(request.user_id, 1, "Remove background"):
+            # 2. Call AI Service (Replicate)
+            async with generation_scheduler.slot("REPLICATE", request.user_id):
+                temp_url = await run_in_threadpool(replicate_service.remove_background, request.image_url)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service (Replicate)
-        temp_url = replicate_service.remove_background(request.image_url)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -339,22 +456,24 @@ class InpaintRequest(BaseModel):
 @router.post("/generate/inpaint")
 async def inpaint_image_endpoint(request: InpaintRequest):
     try:
-        # 1. Deduct Credits (e.g., 4 credits for flux fill)
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": 4
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 4 credits for flux fill) - released automatically if the call fails
+        async with credit_ledger.hold(request.user_id, 4, "Inpaint"):
+            # 2. Call AI Service
+            async with generation_scheduler.slot("FAL", request.user_id):
+                temp_url = await run_in_threadpool(fal_ai.inpaint_image, request.image_url, request.mask_url, request.prompt)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service
-        temp_url = await fal_ai.inpaint_image(request.image_url, request.mask_url, request.prompt)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -368,22 +487,24 @@ class EditRequest(BaseModel):
 @router.post("/generate/edit")
 async def edit_image_endpoint(request: EditRequest):
     try:
-        # 1. Deduct Credits (e.g., 4 credits for flux dev)
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": 4
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 4 credits for flux dev) - released automatically if the call fails
+        async with credit_ledger.hold(request.user_id, 4, "Edit"):
+            # 2. Call AI Service
+            async with generation_scheduler.slot("FAL", request.user_id):
+                temp_url = await run_in_threadpool(fal_ai.edit_image, request.image_url, request.prompt, request.strength)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service
-        temp_url = await fal_ai.edit_image(request.image_url, request.prompt, request.strength)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -483,22 +604,24 @@ class MockupRequest(BaseModel):
 @router.post("/generate/mockup")
 async def mockup_image_endpoint(request: MockupRequest):
     try:
-        # 1. Deduct Credits (e.g., 4 credits for flux dev)
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": 4
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 4 credits for flux dev) - released automatically if the call fails
+        async with credit_ledger.hold(request.user_id, 4, "Mockup"):
+            # 2. Call AI Service
+            async with generation_scheduler.slot("FAL", request.user_id):
+                temp_url = await run_in_threadpool(fal_ai.generate_mockup, request.image_url, request.prompt)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service
-        temp_url = fal_ai.generate_mockup(request.image_url, request.prompt)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -513,21 +636,23 @@ class ExpandRequest(BaseModel):
 @router.post("/generate/expand")
 async def expand_image_endpoint(request: ExpandRequest):
     try:
-        # 1. Deduct Credits (e.g., 4 credits for flux fill)
-        try:
-            supabase.rpc("deduct_user_credits", {
-                "user_uuid": request.user_id,
-                "amount_to_deduct": 4
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+        ensure_queue_capacity(request.user_id)
+
+        # 1. Reserve Credits (e.g., 4 credits for flux fill) - released automatically if the call fails
+        async with credit_ledger.hold(request.user_id, 4, "Expand"):
+            # 2. Call AI Service
+            async with generation_scheduler.slot("FAL", request.user_id):
+                temp_url = await run_in_threadpool(fal_ai.expand_image, request.image_url, request.prompt, request.direction, request.amount)
+
+            # 3. Upload to R2
+            final_url = storage.upload_to_r2(temp_url)
 
-        # 2. Call AI Service
-        temp_url = fal_ai.expand_image(request.image_url, request.prompt, request.direction, request.amount)
-        
-        # 3. Upload to R2
-        final_url = storage.upload_to_r2(temp_url)
-        
         return {"url": final_url}
+    except InsufficientCreditsError as e:
+        raise HTTPException(status_code=402, detail=f"Insufficient credits: {str(e)}")
+    except GenerationQueueFull:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_DETAIL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
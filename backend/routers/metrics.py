@@ -0,0 +1,50 @@
+import hmac
+import ipaddress
+import os
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from services.metrics import metrics
+from services.generation_scheduler import generation_scheduler
+from services.stripe_events import stripe_event_queue
+
+router = APIRouter()
+
+# Bearer token for scrapers. Without it /metrics only answers direct loopback requests,
+# since port 8000 is published and the route must not depend on nginx not exposing it.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+generation_running = metrics.gauge("generation_running", "Generations holding a provider slot", ("provider",))
+generation_queued = metrics.gauge("generation_queued", "Generations waiting for a provider slot", ("provider",))
+generation_running.set_function(
+    lambda: {(name,): q["running"] for name, q in generation_scheduler.stats()["providers"].items()}
+)
+generation_queued.set_function(
+    lambda: {(name,): q["queued"] for name, q in generation_scheduler.stats()["providers"].items()}
+)
+stripe_events = metrics.gauge("stripe_events", "Stripe webhook events in the local queue", ("status",))
+stripe_events.set_function(
+    lambda: {(status,): count for status, count in {"pending": 0, "failed": 0, **stripe_event_queue.counts()}.items()}
+)
+
+
+def _is_local_request(request: Request) -> bool:
+    # Requests relayed by a local proxy (nginx, the Next.js rewrite) carry forwarding headers
+    if "x-forwarded-for" in request.headers or "x-real-ip" in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.client.host).is_loopback
+    except (AttributeError, ValueError):
+        return False
+
+
+@router.get("/metrics")
+def get_metrics(request: Request):
+    """
+    Prometheus text exposition of this worker's metrics.
+    """
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+    elif not _is_local_request(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
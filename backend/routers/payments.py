@@ -1,14 +1,17 @@
 from fastapi import APIRouter, HTTPException, Request, Header
 from pydantic import BaseModel
-import stripe
 import os
-from services.supabase_client import supabase
-from data.default_plans import DEFAULT_PLANS
+from services.clients import clients
+from services.config_cache import config_cache
+from services.stripe_events import stripe_event_queue, HANDLED_EVENT_TYPES
+from fastapi.concurrency import run_in_threadpool
+from utils.logger import get_logger
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-# Initialize Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Stripe SDK is imported and configured on first use (services.clients)
+stripe_secret_key = os.getenv("STRIPE_SECRET_KEY")
 endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 class CheckoutRequest(BaseModel):
@@ -19,22 +22,13 @@ class CheckoutRequest(BaseModel):
 
 @router.post("/stripe/checkout")
 async def create_checkout_session(request: CheckoutRequest):
-    if not stripe.api_key:
+    if not stripe_secret_key:
         raise HTTPException(status_code=500, detail="Stripe API key not configured")
+    stripe = await clients.aget("stripe")
 
     try:
-        # 1. Fetch plan details
-        plan = None
-        try:
-            plan_res = supabase.table("subscription_plans").select("*").eq("id", request.plan_id).execute()
-            if plan_res.data:
-                plan = plan_res.data[0]
-        except Exception:
-            pass
-        
-        # Fallback to default plans if not found in DB
-        if not plan:
-            plan = next((p for p in DEFAULT_PLANS if p["id"] == request.plan_id), None)
+        # 1. Fetch plan details (cached; falls back to default plans)
+        plan = config_cache.get_plan(request.plan_id)
 
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
@@ -44,16 +38,10 @@ async def create_checkout_session(request: CheckoutRequest):
         credits = plan["credits_monthly"]
         
         # Determine allowed payment methods from System Settings
-        payment_method_types = ["card"] # Default
-        try:
-            settings_res = supabase.table("system_settings").select("value").eq("key", "payment_methods").execute()
-            if settings_res.data:
-                payment_method_types = settings_res.data[0]["value"]
-                # Ensure it's a list
-                if not isinstance(payment_method_types, list):
-                     payment_method_types = ["card"]
-        except Exception as e:
-            print(f"Warning: Could not fetch payment settings, defaulting to card. Error: {e}")
+        payment_method_types = config_cache.get_setting("payment_methods", ["card"])
+        # Ensure it's a list
+        if not isinstance(payment_method_types, list):
+            payment_method_types = ["card"]
 
         # Create Stripe Session
         session = stripe.checkout.sessions.create(
@@ -92,6 +80,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         raise HTTPException(status_code=500, detail="Stripe webhook secret not configured")
 
     payload = await request.body()
+    stripe = await clients.aget("stripe")
 
     try:
         event = stripe.webhook.construct_event(
@@ -102,25 +91,14 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
     except stripe.error.SignatureVerificationError as e:
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session.get("metadata", {}).get("user_id")
-        credits = int(session.get("metadata", {}).get("credits", 0))
-
-        if user_id and credits > 0:
-            try:
-                # Update user credits
-                # First get current credits
-                profile_res = supabase.table("profiles").select("credits").eq("id", user_id).single().execute()
-                current_credits = profile_res.data.get("credits", 0) or 0
-                
-                new_credits = current_credits + credits
-                
-                supabase.table("profiles").update({"credits": new_credits}).eq("id", user_id).execute()
-                print(f"Credits added for user {user_id}: +{credits}")
-            except Exception as e:
-                print(f"Error adding credits via webhook: {e}")
-                return {"status": "error", "message": str(e)}
+    # Acknowledge immediately; credits are applied from the durable local queue (exactly once per event id)
+    if event["type"] in HANDLED_EVENT_TYPES:
+        try:
+            await run_in_threadpool(stripe_event_queue.enqueue, event)
+        except Exception as e:
+            logger.error(f"Error queueing Stripe event {event['id']}: {e}", exc_info=True)
+            # Let Stripe retry delivery
+            raise HTTPException(status_code=500, detail="Failed to queue event")
 
     return {"status": "success"}
 
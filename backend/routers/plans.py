@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi import APIRouter, HTTPException, Query, Body, Request, Response
 from services.supabase_client import supabase
+from services.config_cache import config_cache
+from utils.http_cache import not_modified
 from pydantic import BaseModel
 from typing import List, Optional, Any
 import json
@@ -25,24 +27,18 @@ class PlanUpdate(PlanBase):
     pass
 
 @router.get("/plans")
-def get_plans(active_only: bool = True):
-    try:
-        query = supabase.table("subscription_plans").select("*").order("tier_level")
-        if active_only:
-            query = query.eq("is_active", True)
-        
-        response = query.execute()
-        return response.data
-    except Exception as e:
-        print(f"Error fetching plans: {e}")
-        # Fallback for development if table doesn't exist yet
-        # Fallback for development if table doesn't exist yet
-        return DEFAULT_PLANS
+def get_plans(request: Request, response: Response, active_only: bool = True):
+    # Served from the config cache; clients revalidate with If-None-Match
+    cached = not_modified(request, response, config_cache.etag(f"plans-{int(active_only)}"))
+    if cached:
+        return cached
+    return config_cache.get_plans(active_only)
 
 @router.post("/plans")
 def create_plan(plan: PlanCreate):
     try:
         response = supabase.table("subscription_plans").insert(plan.dict()).execute()
+        config_cache.invalidate()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -51,6 +47,7 @@ def create_plan(plan: PlanCreate):
 def update_plan(plan_id: str, plan: PlanUpdate):
     try:
         response = supabase.table("subscription_plans").update(plan.dict()).eq("id", plan_id).execute()
+        config_cache.invalidate()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -59,6 +56,7 @@ def update_plan(plan_id: str, plan: PlanUpdate):
 def delete_plan(plan_id: str):
     try:
         supabase.table("subscription_plans").delete().eq("id", plan_id).execute()
+        config_cache.invalidate()
         return {"message": "Plan deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,9 +2,14 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 from services.supabase_client import supabase
 from routers.admin import verify_admin_role
-from typing import List, Optional
+from typing import List, Literal, Optional
+from fastapi.concurrency import run_in_threadpool
+from services.prompt_index import prompt_index, decode_cursor, encode_cursor
+from services.search_index import search_service
+from utils.logger import get_logger
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # ============================================
 # Request Models
@@ -45,40 +50,78 @@ class GalleryItem(BaseModel):
 # API Endpoints
 # ============================================
 
+def _fetch_rows_by_id(ids: List[str]) -> List[dict]:
+    if not ids:
+        return []
+    rows = supabase.table("curated_prompts").select("*").in_("id", ids).execute().data
+    by_id = {str(row["id"]): row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+def _gallery_from_db(category, tag, cursor, offset, limit, count_mode):
+    """Keyset query against Supabase, used when the in-memory index is unavailable."""
+    query = supabase.table("curated_prompts")\
+        .select("*", count=None if count_mode == "none" else count_mode)\
+        .eq("is_active", True)
+    if category:
+        query = query.eq("category", category)
+    if tag:
+        # Contains specific tag in array
+        query = query.contains("tags", [tag])
+    if cursor:
+        created_at, prompt_id = cursor
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{prompt_id})')
+    # Order by created_at desc (newest first), id as tie-breaker
+    query = query.order("created_at", desc=True).order("id", desc=True)
+    if offset:
+        query = query.range(offset, offset + limit - 1)
+    else:
+        query = query.limit(limit)
+    response = query.execute()
+    next_cursor = None
+    if len(response.data) == limit:
+        last = response.data[-1]
+        next_cursor = encode_cursor((last["created_at"], str(last["id"])))
+    return response.data, response.count, next_cursor
+
 @router.get("/prompts/gallery")
 async def get_gallery(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     category: Optional[str] = None,
-    tag: Optional[str] = None
+    tag: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count_mode: Literal["exact", "planned", "estimated", "none"] = "estimated"
 ):
     """
-    Get public curated prompts with pagination and filtering.
+    Get public curated prompts with filtering.
+    Pass the returned next_cursor to get the following page (keyset pagination);
+    page is still accepted for older clients. count_mode only applies when the
+    in-memory index is unavailable (index counts are always exact).
     """
     try:
-        offset = (page - 1) * limit
-        
-        query = supabase.table("curated_prompts")\
-            .select("*", count="exact")\
-            .eq("is_active", True)
-            
-        if category:
-            query = query.eq("category", category)
-            
-        if tag:
-            # Contains specific tag in array
-            query = query.contains("tags", [tag])
-            
-        # Order by created_at desc (newest first)
-        response = query.order("created_at", desc=True)\
-            .range(offset, offset + limit - 1)\
-            .execute()
-            
+        cursor_key = decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    offset = 0 if cursor_key else (page - 1) * limit
+
+    try:
+        try:
+            await run_in_threadpool(prompt_index.ensure_loaded)
+        except Exception as e:
+            logger.warning(f"Prompt index unavailable, querying database: {e}")
+            data, count, next_cursor = await run_in_threadpool(
+                _gallery_from_db, category, tag, cursor_key, offset, limit, count_mode
+            )
+        else:
+            ids, count, next_cursor = prompt_index.query(category, tag, cursor_key, offset, limit)
+            data = await run_in_threadpool(_fetch_rows_by_id, ids)
+
         return {
-            "data": response.data,
-            "count": response.count,
+            "data": data,
+            "count": count,
             "page": page,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -101,7 +144,9 @@ async def create_prompt(request: CreatePromptRequest):
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create prompt entry")
-            
+
+        prompt_index.upsert(response.data[0])
+        search_service.upsert_prompt(response.data[0])
         return {"status": "success", "data": response.data[0]}
     except Exception as e:
         print(f"Error creating prompt: {e}")
@@ -142,7 +187,9 @@ async def update_prompt(prompt_id: str, request: UpdatePromptRequest):
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Prompt not found or update failed")
-            
+
+        prompt_index.upsert(response.data[0])
+        search_service.upsert_prompt(response.data[0])
         return {"status": "success", "data": response.data[0]}
     except Exception as e:
         print(f"Error updating prompt: {e}")
@@ -167,6 +214,8 @@ async def delete_prompt(prompt_id: str, admin_id: str):
         if not response.data:
              raise HTTPException(status_code=404, detail="Prompt not found")
 
+        prompt_index.remove(prompt_id)
+        search_service.remove_prompt(prompt_id)
         return {"status": "success", "deleted_id": prompt_id}
     except Exception as e:
         print(f"Error deleting prompt: {e}")
@@ -175,23 +224,10 @@ async def delete_prompt(prompt_id: str, admin_id: str):
 @router.get("/prompts/categories")
 async def get_categories():
     """
-    Get list of unique categories.
+    Get list of unique categories (served from the in-memory prompt index).
     """
     try:
-        # Note: Supabase JS client doesn't support .distinct() directly in some versions 
-        # or requires a specific rpc properly.
-        # A simpler way if data is small is to fetch distinct categories column
-        # But for now, we can hardcode or distinct via python if not immense.
-        # Ideally, use a postgres function. 
-        # Let's try fetching all categories (assuming not millions) and unique them, or specific query.
-        
-        # Proper way: rpc or raw sql (if allowed).
-        # Fallback: Just return predefined list if dynamic is hard without RPC.
-        # Let's fetch active categories efficiently ? 
-        # Actually, let's just make an RPC call if we want perf, or select categories.
-        
-        response = supabase.table("curated_prompts").select("category").eq("is_active", True).execute()
-        categories = sorted(list(set([item['category'] for item in response.data if item['category']])))
-        return {"categories": categories}
+        await run_in_threadpool(prompt_index.ensure_loaded)
+        return {"categories": prompt_index.categories()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
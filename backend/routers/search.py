@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from services.supabase_client import supabase
+from services.search_index import search_service, KIND_GENERATION, KIND_NAMES, KIND_PROMPT
+from typing import List, Literal
+
+router = APIRouter()
+
+SEARCH_KINDS = {
+    "all": (KIND_PROMPT, KIND_GENERATION),
+    "prompts": (KIND_PROMPT,),
+    "generations": (KIND_GENERATION,),
+}
+
+
+def _hydrate(hits) -> List[dict]:
+    """Fetch the rows of the hits, dropping anything deactivated or moderated since it was indexed."""
+    prompt_ids = [doc_id for kind, doc_id, _ in hits if kind == KIND_PROMPT]
+    generation_ids = [doc_id for kind, doc_id, _ in hits if kind == KIND_GENERATION]
+    rows = {}
+    if prompt_ids:
+        for row in supabase.table("curated_prompts")\
+                .select("id, title, prompt, image_url, category, tags")\
+                .in_("id", prompt_ids).eq("is_active", True).execute().data:
+            rows[(KIND_PROMPT, str(row["id"]))] = row
+    if generation_ids:
+        for row in supabase.table("generations")\
+                .select("id, slug, prompt, result_url, created_at")\
+                .in_("id", generation_ids).eq("is_deleted", False).eq("is_nsfw", False).execute().data:
+            rows[(KIND_GENERATION, str(row["id"]))] = row
+
+    results = []
+    for kind, doc_id, score in hits:
+        row = rows.get((kind, doc_id))
+        if row:
+            results.append({"type": KIND_NAMES[kind], "score": round(score, 4), **row})
+    return results
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Literal["all", "prompts", "generations"] = "all",
+    limit: int = Query(20, ge=1, le=50),
+):
+    """
+    Full-text search over curated prompts and public generations (BM25 ranked).
+    The last word also matches as a prefix, so this can back search-as-you-type.
+    """
+    if not search_service.ready:
+        raise HTTPException(status_code=503, detail="Search index is loading, try again shortly")
+    try:
+        hits = await search_service.search(q, limit, SEARCH_KINDS[type])
+        results = await run_in_threadpool(_hydrate, hits)
+        return {"query": q, "results": results, "count": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/search/suggest")
+async def suggest(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(8, ge=1, le=20)):
+    """
+    Autocomplete: most frequent indexed terms starting with the last word of q.
+    """
+    if not search_service.ready:
+        return {"suggestions": []}
+    return {"suggestions": await search_service.suggest(q, limit)}
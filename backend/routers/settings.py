@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from services.supabase_client import supabase
 from routers.admin import verify_admin_role, log_admin_action
+from services.rate_limiter import rate_limiter, RATE_LIMIT_SETTING_KEY
+from services.config_cache import config_cache
+from utils.http_cache import not_modified
 from typing import Any
 
 router = APIRouter()
@@ -13,27 +16,27 @@ class SettingUpdate(BaseModel):
     admin_id: str
 
 @router.get("/admin/settings")
-async def get_settings():
+def get_settings(request: Request, response: Response):
     """
     Get all system settings.
     """
-    try:
-        response = supabase.table("system_settings").select("*").execute()
-        # Convert list to dict for easier frontend consumption
-        settings = {item['key']: item['value'] for item in response.data}
-        return {
-            "status": "success",
-            "data": response.data,
-            "settings": settings # Convenience format
-        }
-    except Exception as e:
-        print(f"Error fetching settings: {e}")
+    cached = not_modified(request, response, config_cache.etag("settings"))
+    if cached:
+        return cached
+
+    rows = config_cache.get_settings_rows()
+    if rows is None:
         # Return default if table doesn't exist yet or fails
         return {
             "status": "error",
-            "message": str(e),
+            "message": config_cache.settings_error,
             "settings": {"payment_methods": ["card"]} 
         }
+    return {
+        "status": "success",
+        "data": rows,
+        "settings": config_cache.settings_dict() # Convenience format
+    }
 
 @router.post("/admin/settings")
 @log_admin_action(action_type="update_setting", resource_type="system_setting")
@@ -58,6 +61,10 @@ async def update_setting(request: SettingUpdate):
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to update setting")
 
+        config_cache.invalidate()
+        if request.key == RATE_LIMIT_SETTING_KEY:
+            rate_limiter.invalidate_config()
+
         return {"status": "success", "data": response.data[0]}
     except Exception as e:
         print(f"Error updating setting: {e}")
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Response
+from services.sitemap import sitemap_service, XML_MEDIA_TYPE
+
+router = APIRouter()
+
+SITEMAP_CACHE_CONTROL = "public, max-age=300"
+
+
+@router.get("/sitemap.xml")
+async def get_sitemap_index():
+    """
+    Sitemap index: the static pages plus one shard per SITEMAP_SHARD_SIZE explore pages.
+    """
+    try:
+        body = await sitemap_service.index_xml()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=body, media_type=XML_MEDIA_TYPE, headers={"Cache-Control": SITEMAP_CACHE_CONTROL})
+
+
+@router.get("/sitemaps/pages.xml")
+async def get_pages_sitemap():
+    return Response(content=sitemap_service.pages_xml(), media_type=XML_MEDIA_TYPE, headers={"Cache-Control": SITEMAP_CACHE_CONTROL})
+
+
+@router.get("/sitemaps/generations-{shard}.xml")
+async def get_generations_sitemap_shard(shard: int):
+    """
+    One shard of explore pages, oldest first (served from cache, or streamed while it is regenerated).
+    """
+    try:
+        response = await sitemap_service.shard_response(shard)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if response is None:
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    response.headers["Cache-Control"] = SITEMAP_CACHE_CONTROL
+    return response
@@ -1,14 +1,57 @@
-import ypy_websocket
-from ypy_websocket.websocket_server import WebsocketServer
+import asyncio
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List, Any
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Any, Optional
 from utils.logger import logger
+from services.clients import lazy_module
+from services.metrics import websocket_connections, websocket_rooms
+
+ypy_websocket_server = lazy_module("ypy_websocket.websocket_server")
 
 router = APIRouter()
 
-# Initialize Ypy WebSocket Server
-# auto_clean_rooms=True will remove rooms when last client disconnects (in-memory)
-websocket_server = WebsocketServer(auto_clean_rooms=True)
+
+class LazyWebsocketServer:
+    """
+    The Ypy WebSocket server, imported and started on the first Yjs connection
+    instead of at startup, so it costs nothing until a canvas is opened.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def rooms(self) -> dict:
+        return self.server.rooms if self.server is not None else {}
+
+    async def get(self):
+        if self.server is None:
+            async with self.lock:
+                if self.server is None:
+                    # Import in the threadpool; the first connection shouldn't stall the loop
+                    module = await run_in_threadpool(ypy_websocket_server._load)
+                    # auto_clean_rooms=True will remove rooms when last client disconnects (in-memory)
+                    server = module.WebsocketServer(auto_clean_rooms=True)
+                    self.task = asyncio.create_task(server.start())
+                    await server.started.wait()
+                    self.server = server
+        return self.server
+
+    async def stop(self):
+        # ypy-websocket <=0.12 has no graceful stop; cancelling the task is standard
+        task, self.task, self.server = self.task, None, None
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+websocket_server = LazyWebsocketServer()
+websocket_rooms.set_function(lambda: {(): len(websocket_server.rooms)})
 
 # Adapter to bridge FastAPI WebSocket with ypy-websocket expectations
 class FastAPIWebsocketAdapter:
@@ -67,18 +110,22 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
     - Awareness updates
     - Broadcasting document updates
     """
+    connected = False
     try:
         # We need to manually accept the connection first? 
         # ypy-websocket's `serve` method expects an accepted websocket usually, 
         # or at least a standardasgi websocket.
         # FastAPI's WebSocket needs to be accepted.
         await websocket.accept()
+        websocket_connections.inc()
+        connected = True
         
         # Wrap the FastAPI websocket to match ypy-websocket interface
         socket_adapter = FastAPIWebsocketAdapter(websocket)
         logger.info(f"Yjs Client connected to room: {room_id}")
         
-        await websocket_server.serve(socket_adapter)
+        server = await websocket_server.get()
+        await server.serve(socket_adapter)
         
     except WebSocketDisconnect:
         logger.info(f"Yjs Client disconnected from room: {room_id}")
@@ -90,3 +137,6 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
              await websocket.close()
         except:
              pass
+    finally:
+        if connected:
+            websocket_connections.dec()
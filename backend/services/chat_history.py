@@ -0,0 +1,189 @@
+"""
+Chat History Windowing Service
+Keeps chat prompts inside a token budget: system prompt and recent turns are kept
+verbatim, older turns are folded into a short extractive summary, and images are
+stripped from everything but the most recent messages.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Rough per-image cost (OpenAI high-detail tile estimate); good enough for budgeting
+IMAGE_TOKENS = 765
+# Per-message overhead for role/formatting tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "12000"))
+DEFAULT_KEEP_RECENT = int(os.getenv("CHAT_CONTEXT_KEEP_RECENT", "6"))
+DEFAULT_KEEP_IMAGES = int(os.getenv("CHAT_CONTEXT_KEEP_IMAGES", "2"))
+SUMMARY_SNIPPET_CHARS = 160
+SUMMARY_MAX_TOKENS = 600
+
+# CJK characters are roughly one token each; everything else is ~4 chars/token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Fast local token estimate (no tokenizer dependency)."""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    content = message.get("content")
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    if isinstance(content, str):
+        tokens += estimate_text_tokens(content)
+    elif isinstance(content, list):
+        for part in content:
+            if not isinstance(part, dict):
+                tokens += estimate_text_tokens(str(part))
+            elif part.get("type") == "text":
+                tokens += estimate_text_tokens(part.get("text") or "")
+            elif part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_message_tokens(m) for m in messages)
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text") or "" for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return ""
+
+
+def _has_image(message: Dict[str, Any]) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        isinstance(part, dict) and part.get("type") == "image_url" for part in content
+    )
+
+
+def _strip_images(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of the message with image parts replaced by a short marker."""
+    text = _message_text(message).strip()
+    marker = "[image omitted]"
+    return {"role": message["role"], "content": f"{text}\n{marker}" if text else marker}
+
+
+def _prepend_text(message: Dict[str, Any], text: str) -> Dict[str, Any]:
+    content = message.get("content")
+    if isinstance(content, list):
+        return {"role": message["role"], "content": [{"type": "text", "text": text}] + content}
+    return {"role": message["role"], "content": f"{text}\n\n{content or ''}"}
+
+
+def _summarize(messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Cheap extractive summary of dropped turns, newest snippets kept first within SUMMARY_MAX_TOKENS."""
+    lines = []
+    used = 0
+    for m in reversed(messages):
+        text = " ".join(_message_text(m).split())
+        if not text:
+            continue
+        if len(text) > SUMMARY_SNIPPET_CHARS:
+            text = text[:SUMMARY_SNIPPET_CHARS] + "..."
+        line = f"- {m['role']}: {text}"
+        used += estimate_text_tokens(line)
+        if used > SUMMARY_MAX_TOKENS:
+            break
+        lines.append(line)
+
+    if not lines:
+        return None
+
+    lines.reverse()
+    return {
+        "role": "user",
+        "content": "Summary of earlier conversation (older turns were truncated):\n" + "\n".join(lines),
+    }
+
+
+def apply_token_budget(
+    messages: List[Dict[str, Any]],
+    max_tokens: int = DEFAULT_TOKEN_BUDGET,
+    reserved_tokens: int = 0,
+    keep_recent: int = DEFAULT_KEEP_RECENT,
+    keep_images: int = DEFAULT_KEEP_IMAGES,
+) -> List[Dict[str, Any]]:
+    """
+    Window a list of {"role", "content"} messages to fit `max_tokens`.
+
+    - System messages are always kept (and counted against the budget).
+    - `reserved_tokens` accounts for prompt text added later (e.g. a merged system prompt).
+    - The newest `keep_recent` messages are kept even if they exceed the budget.
+    - Images are stripped from all but the newest `keep_images` image-bearing messages.
+    - Older turns that do not fit are replaced by a single summary message.
+    Messages are only copied when they are modified.
+    """
+    system_messages = [m for m in messages if m.get("role") == "system"]
+    turns = [m for m in messages if m.get("role") != "system"]
+
+    # 1. Strip images from older messages
+    images_seen = 0
+    for i in range(len(turns) - 1, -1, -1):
+        if _has_image(turns[i]):
+            images_seen += 1
+            if images_seen > keep_images:
+                turns[i] = _strip_images(turns[i])
+
+    budget = max_tokens - reserved_tokens - estimate_messages_tokens(system_messages)
+    # 2. Walk backwards keeping the newest turns that fit, leaving room for the summary.
+    # Costs are only estimated for turns we actually look at, so long histories stay cheap.
+    turn_budget = budget - SUMMARY_MAX_TOKENS
+    costs: Dict[int, int] = {}
+    kept_from = len(turns)
+    used = 0
+    total = 0
+    keeping = True
+    for i in range(len(turns) - 1, -1, -1):
+        costs[i] = estimate_message_tokens(turns[i])
+        total += costs[i]
+        is_recent = len(turns) - i <= keep_recent
+        if keeping and (is_recent or used + costs[i] <= turn_budget):
+            used += costs[i]
+            kept_from = i
+        else:
+            keeping = False
+            if total > budget:
+                break
+    else:
+        # Whole history fits without summarizing
+        if total <= budget:
+            return system_messages + turns
+
+    # Conversations should not start with a dangling assistant turn
+    while kept_from < len(turns) - 1 and turns[kept_from].get("role") == "assistant":
+        used -= costs[kept_from]
+        kept_from += 1
+
+    dropped = turns[:kept_from]
+    kept = turns[kept_from:]
+    summary = _summarize(dropped) if dropped else None
+
+    result = list(system_messages)
+    if summary and kept and kept[0].get("role") == "user":
+        # Fold the summary into the first kept user turn to preserve role alternation
+        kept[0] = _prepend_text(kept[0], summary["content"])
+    elif summary:
+        result.append(summary)
+    result.extend(kept)
+
+    if dropped:
+        logger.debug(f"Chat history windowed: kept {len(kept)}/{len(turns)} turns, ~{used} tokens (budget {budget})")
+    return result
@@ -0,0 +1,97 @@
+"""
+Chat Media Service
+Offloads inline base64 images ([IMAGE]data:image/...;base64,...[/IMAGE]) from chat
+messages to R2, so each image is decoded and uploaded once and then referenced by URL.
+"""
+import base64
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from services import storage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Matches a base64 image data URI anywhere in a message body
+DATA_URI_PATTERN = re.compile(r"data:(image/[A-Za-z0-9.+-]+);base64,([A-Za-z0-9+/=]+)")
+
+MIME_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+CHAT_MEDIA_FOLDER = "chat"
+
+
+class ChatMediaCache:
+    def __init__(self, max_entries: int = 2048):
+        # content hash -> public URL, in LRU order
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self.lock:
+            url = self.entries.get(digest)
+            if url is not None:
+                self.entries.move_to_end(digest)
+            return url
+
+    def set(self, digest: str, url: str):
+        with self.lock:
+            self.entries[digest] = url
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# Global instance
+chat_media_cache = ChatMediaCache()
+
+
+def offload_data_uri(mime_type: str, encoded: str) -> str:
+    """
+    Upload one base64 image to R2 under a content-addressed key and return its URL.
+    The hash is taken over the base64 text, so cache hits never decode the payload.
+    """
+    digest = hashlib.sha256(encoded.encode("ascii")).hexdigest()
+
+    cached = chat_media_cache.get(digest)
+    if cached:
+        return cached
+
+    extension = MIME_EXTENSIONS.get(mime_type, "png")
+    file_content = base64.b64decode(encoded)
+    url = storage.upload_bytes_to_r2(
+        file_content,
+        mime_type,
+        folder=CHAT_MEDIA_FOLDER,
+        filename=f"{digest}.{extension}",
+    )
+    chat_media_cache.set(digest, url)
+    return url
+
+
+def offload_inline_images(content: str) -> str:
+    """
+    Replace every inline base64 image in a message with its R2 URL.
+    Images that fail to upload are left inline so the turn still works.
+    Blocking (hashing, decode, R2 PUT) - call via run_in_threadpool.
+    """
+    if not content or "data:image" not in content:
+        return content
+
+    def replace(match: re.Match) -> str:
+        try:
+            return offload_data_uri(match.group(1), match.group(2))
+        except Exception as e:
+            logger.warning(f"Chat image offload failed, keeping inline data: {e}")
+            return match.group(0)
+
+    return DATA_URI_PATTERN.sub(replace, content)
@@ -0,0 +1,188 @@
+"""
+Chat Message Normalization
+Single-pass pipeline that turns raw chat messages (with the [IMAGE]...[/IMAGE] tag
+convention) into one canonical OpenAI-style list, then formats it per provider:
+- OpenAI / OpenRouter: system prompt merged into the first user turn, same-role turns merged
+- Gemini: system_instruction + history + current message parts, validated once
+"""
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+IMAGE_OPEN_TAG = "[IMAGE]"
+IMAGE_CLOSE_TAG = "[/IMAGE]"
+
+
+def parse_content(content: Any) -> Optional[Any]:
+    """
+    Parse one raw message body into canonical content.
+    Returns a stripped string, a [text, image_url] part list, or None for empty messages.
+    """
+    if not isinstance(content, str):
+        content = str(content) if content else ""
+
+    open_at = content.find(IMAGE_OPEN_TAG)
+    if open_at != -1:
+        close_at = content.find(IMAGE_CLOSE_TAG, open_at)
+        if close_at != -1:
+            text_part = content[:open_at].strip()
+            image_part = content[open_at + len(IMAGE_OPEN_TAG):close_at].strip()
+            # Always add a text part to satisfy strict APIs (Gemini via OpenRouter);
+            # use a space if empty, as some APIs reject empty strings
+            parts = [{"type": "text", "text": text_part or " "}]
+            if image_part:
+                parts.append({"type": "image_url", "image_url": {"url": image_part}})
+            return parts
+
+    content = content.strip()
+    return content or None
+
+
+def normalize_messages(messages: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Convert request messages (objects with .role/.content) into canonical
+    {"role", "content"} dicts. Empty messages are dropped.
+    """
+    normalized = []
+    for m in messages:
+        content = parse_content(m.content)
+        if content is None:
+            logger.debug(f"Skipping empty message for role {m.role}")
+            continue
+        normalized.append({"role": m.role, "content": content})
+    return normalized
+
+
+def _prefix_system_prompt(message: Dict[str, Any], system_prompt: str) -> Dict[str, Any]:
+    content = message["content"]
+    if isinstance(content, str):
+        return {"role": message["role"], "content": system_prompt + "\n\n" + content}
+
+    parts = list(content)
+    for i, part in enumerate(parts):
+        if part.get("type") == "text":
+            parts[i] = {"type": "text", "text": system_prompt + "\n\n" + part["text"]}
+            break
+    else:
+        parts.insert(0, {"type": "text", "text": system_prompt + "\n\n"})
+    return {"role": message["role"], "content": parts}
+
+
+def to_openai_messages(messages: List[Dict[str, Any]], system_prompt: str) -> List[Dict[str, Any]]:
+    """
+    Format canonical messages for OpenAI-compatible APIs (OpenAI and OpenRouter).
+    The system prompt is merged into the first user turn and consecutive same-role
+    turns are merged, which keeps strict providers (e.g. Gemini via OpenRouter) happy.
+    Input messages are never mutated.
+    """
+    turns = [m for m in messages if m.get("role") != "system"]
+    merged: List[Dict[str, Any]] = []
+
+    if turns and turns[0]["role"] == "user":
+        turns = [_prefix_system_prompt(turns[0], system_prompt)] + turns[1:]
+    else:
+        merged.append({"role": "user", "content": system_prompt})
+
+    for msg in turns:
+        if not merged or merged[-1]["role"] != msg["role"]:
+            merged.append(msg)
+            continue
+
+        last_msg = merged[-1]
+        if isinstance(last_msg["content"], str) and isinstance(msg["content"], str):
+            merged[-1] = {"role": last_msg["role"], "content": last_msg["content"] + "\n\n" + msg["content"]}
+        else:
+            parts = [{"type": "text", "text": last_msg["content"]}] if isinstance(last_msg["content"], str) else list(last_msg["content"])
+            if isinstance(msg["content"], str):
+                parts.append({"type": "text", "text": msg["content"]})
+            else:
+                parts.extend(msg["content"])
+            merged[-1] = {"role": last_msg["role"], "content": parts}
+
+    # Collapse text-only part lists back to plain strings
+    for i, msg in enumerate(merged):
+        content = msg["content"]
+        if isinstance(content, list) and all(part.get("type") == "text" for part in content):
+            merged[i] = {"role": msg["role"], "content": "\n\n".join(part["text"] for part in content)}
+
+    return merged
+
+
+async def _image_part(url: str, http_client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+    """Build a Gemini inline_data part from a data URI or an HTTP URL."""
+    try:
+        if url.startswith("data:image"):
+            header, encoded = url.split(",", 1)
+            mime_type = header.split(":")[1].split(";")[0]
+            return {"inline_data": {"mime_type": mime_type, "data": base64.b64decode(encoded)}}
+        if url.startswith("http"):
+            resp = await http_client.get(url)
+            resp.raise_for_status()
+            return {"inline_data": {
+                "mime_type": resp.headers.get("content-type", "image/jpeg"),
+                "data": resp.content,
+            }}
+    except Exception as e:
+        logger.debug(f"Failed to load image input {url[:80]}: {e}")
+    return None
+
+
+async def to_gemini_contents(
+    messages: List[Dict[str, Any]],
+    default_system_prompt: str,
+) -> Tuple[str, List[Dict[str, Any]], List[Any]]:
+    """
+    Format canonical messages for Gemini in one pass.
+    Returns (system_instruction, history, current_message_parts); every part is
+    already a non-empty string or an inline_data dict, so no re-validation is needed.
+    """
+    system_instruction = None
+    history: List[Dict[str, Any]] = []
+
+    async with httpx.AsyncClient() as http_client:
+        for msg in messages:
+            role = msg.get("role")
+            content = msg.get("content")
+
+            parts: List[Any] = []
+            if isinstance(content, str):
+                if content.strip():
+                    parts.append(content.strip())
+            elif isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "text":
+                        text = str(part.get("text") or "").strip()
+                        if text:
+                            parts.append(text)
+                    elif part.get("type") == "image_url":
+                        image = await _image_part(part.get("image_url", {}).get("url", ""), http_client)
+                        if image:
+                            parts.append(image)
+
+            if not parts:
+                continue
+
+            if role == "system":
+                text_parts = [p for p in parts if isinstance(p, str)]
+                if text_parts:
+                    system_instruction = " ".join(text_parts)
+            elif role in ("user", "assistant"):
+                gemini_role = "user" if role == "user" else "model"
+                # Gemini expects alternating roles, so merge consecutive same-role turns
+                if history and history[-1]["role"] == gemini_role:
+                    history[-1]["parts"].extend(parts)
+                else:
+                    history.append({"role": gemini_role, "parts": parts})
+
+    # The last user turn is sent via send_message, the rest is chat history
+    if history and history[-1]["role"] == "user":
+        current_parts = history.pop()["parts"]
+    else:
+        current_parts = ["Hello"]
+
+    return system_instruction or default_system_prompt, history, current_parts
@@ -0,0 +1,194 @@
+"""
+Clients
+Registry of lazily built SDK clients and lazily imported heavy modules, so the API process
+starts serving before openai, replicate, stripe, boto3, fal_client and google.generativeai
+are loaded (they used to be imported and instantiated at module import by main.py's routers).
+- clients.get(name) builds a client on first use (thread-safe) and reuses it; factories
+  return None when the credentials are not configured. Each client is built under its
+  own lock, never the registry lock, so a slow SDK import only blocks callers of that client
+- async handlers use `await clients.aget(name)`: a client that isn't built yet (e.g. still
+  being prewarmed) is built/waited for in the threadpool instead of on the event loop
+- lazy_module("fal_client") returns a proxy that imports the module on first attribute access
+- clients.prewarm() loads CLIENT_PREWARM ("all", "none" or a comma list) in a background
+  thread after startup, so the first requests rarely pay for the imports either
+- clients.stats() reports what has been loaded and how long each import/construction took
+- clients.override(name, client) swaps a client (load tests, local fakes)
+"""
+import importlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CLIENT_PREWARM = os.getenv("CLIENT_PREWARM", "all")
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",  # Optional, for including your app on openrouter.ai rankings.
+    "X-Title": "Lovart Flow (Local Dev)",  # Optional. Shows in rankings on openrouter.ai.
+}
+
+
+class ClientRegistry:
+    def __init__(self):
+        self.factories: Dict[str, Callable[[], Any]] = {}
+        self.instances: Dict[str, Any] = {}
+        self.modules: Dict[str, "LazyModule"] = {}
+        self.load_times: Dict[str, float] = {}
+        self.lock = threading.RLock()  # guards the dicts only; held for in-memory work
+        self.build_locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self.factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        try:
+            return self.instances[name]
+        except KeyError:
+            pass
+        with self.lock:
+            build_lock = self.build_locks.setdefault(name, threading.Lock())
+        with build_lock:
+            if name in self.instances:
+                return self.instances[name]
+            started = time.perf_counter()
+            client = self.factories[name]()
+            with self.lock:
+                self.load_times[name] = time.perf_counter() - started
+                # An override() that landed meanwhile wins
+                return self.instances.setdefault(name, client)
+
+    async def aget(self, name: str) -> Any:
+        """get() for async handlers: never imports or builds on the event loop."""
+        try:
+            return self.instances[name]
+        except KeyError:
+            return await run_in_threadpool(self.get, name)
+
+    def override(self, name: str, client: Any):
+        with self.lock:
+            self.instances[name] = client
+
+    def record_import(self, name: str, seconds: float):
+        self.load_times[f"import {name}"] = seconds
+
+    def _prewarm_sync(self, names: List[str]):
+        for name in names:
+            try:
+                if name in self.modules:
+                    self.modules[name]._load()
+                else:
+                    self.get(name)
+            except Exception as e:
+                logger.warning(f"Prewarming {name} failed: {e}")
+        logger.info(f"Prewarmed {len(names)} clients/modules in {sum(self.load_times.values()):.2f}s")
+
+    def prewarm(self, setting: str = CLIENT_PREWARM) -> Optional[threading.Thread]:
+        """Load clients and modules in a daemon thread (call once the app is serving)."""
+        if setting == "none":
+            return None
+        names = list(self.modules) + list(self.factories) if setting == "all" else [n.strip() for n in setting.split(",") if n.strip()]
+        thread = threading.Thread(target=self._prewarm_sync, args=(names,), name="client-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {
+            "loaded": sorted(list(self.instances) + [f"import {n}" for n, m in self.modules.items() if m._module is not None]),
+            "pending": sorted([n for n in self.factories if n not in self.instances] + [f"import {n}" for n, m in self.modules.items() if m._module is None]),
+            "load_ms": {name: round(seconds * 1000, 1) for name, seconds in self.load_times.items()},
+        }
+
+
+class LazyModule:
+    """Module proxy: `fal_client = lazy_module("fal_client")`, then use it as the module."""
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            object.__setattr__(self, "_module", module)
+            clients.record_import(self._name, time.perf_counter() - started)
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self._load(), attr, value)
+
+
+def lazy_module(name: str) -> LazyModule:
+    with clients.lock:
+        if name not in clients.modules:
+            clients.modules[name] = LazyModule(name)
+        return clients.modules[name]
+
+
+# --- Client factories ---
+
+def _openai():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key)
+
+
+def _openrouter():
+    """Chat completions (streaming, routers/chat.py)."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key)
+
+
+def _openrouter_images():
+    """Image generation through chat completions (providers/openrouter.py)."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key, timeout=60.0, default_headers=OPENROUTER_HEADERS)
+
+
+def _openrouter_sync():
+    """Sync client for the legacy services/openrouter_service.py helpers."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+    from openai import OpenAI
+    return OpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key, timeout=60.0, default_headers=OPENROUTER_HEADERS)
+
+
+def _replicate():
+    import replicate
+    return replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
+
+
+def _stripe():
+    import stripe
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return stripe
+
+
+# Global instance
+clients = ClientRegistry()
+clients.register("openai", _openai)
+clients.register("openrouter", _openrouter)
+clients.register("openrouter_images", _openrouter_images)
+clients.register("openrouter_sync", _openrouter_sync)
+clients.register("replicate", _replicate)
+clients.register("stripe", _stripe)
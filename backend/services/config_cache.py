@@ -0,0 +1,106 @@
+"""
+Config Cache
+In-memory copy of subscription_plans and system_settings. Both change a few times a
+month but were queried on every checkout and page view.
+- the ETag of the read endpoints is a hash of the loaded content, so it is the same in
+  every worker and across restarts, and changes exactly when the content does
+- invalidate() (plan/setting writes through the API) forces a reload on next access
+- entries are reloaded after CONFIG_CACHE_TTL seconds, so edits made directly in
+  Supabase (or through another worker) are picked up as well
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from data.default_plans import DEFAULT_PLANS
+from services.supabase_client import supabase
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONFIG_CACHE_TTL = int(os.getenv("CONFIG_CACHE_TTL", "300"))
+
+
+class ConfigCache:
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self.plans: Optional[List[dict]] = None  # None = table unavailable, use DEFAULT_PLANS
+        self.settings_rows: Optional[List[dict]] = None
+        self.settings_error: Optional[str] = None
+        self.content_hash = ""
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def _load(self):
+        plans, settings_rows, settings_error = self.plans, self.settings_rows, None
+        try:
+            plans = supabase.table("subscription_plans").select("*").order("tier_level").execute().data
+        except Exception as e:
+            logger.error(f"Error fetching plans: {e}", exc_info=True)
+        try:
+            settings_rows = supabase.table("system_settings").select("*").execute().data
+        except Exception as e:
+            logger.error(f"Error fetching settings: {e}", exc_info=True)
+            settings_error = str(e)
+
+        # DEFAULT_PLANS is what get_plans() serves while the table is unavailable
+        content_hash = hashlib.sha1(
+            json.dumps([plans if plans is not None else DEFAULT_PLANS, settings_rows], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        self.plans, self.settings_rows, self.settings_error = plans, settings_rows, settings_error
+        self.content_hash = content_hash
+        self.loaded_at = time.time()
+
+    def _ensure_loaded(self):
+        if time.time() - self.loaded_at < self.ttl_seconds:
+            return
+        with self.lock:
+            if time.time() - self.loaded_at >= self.ttl_seconds:
+                self._load()
+
+    def invalidate(self):
+        """Force a reload on next access (call after writes); the ETag follows the new content."""
+        with self.lock:
+            self.loaded_at = 0.0
+
+    def etag(self, resource: str) -> str:
+        self._ensure_loaded()
+        return f'"{resource}-{self.content_hash[:16]}"'
+
+    # --- Plans ---
+
+    def get_plans(self, active_only: bool = True) -> List[dict]:
+        self._ensure_loaded()
+        if self.plans is None:
+            # Fallback for development if table doesn't exist yet
+            return DEFAULT_PLANS
+        if active_only:
+            return [p for p in self.plans if p.get("is_active")]
+        return self.plans
+
+    def get_plan(self, plan_id: str) -> Optional[dict]:
+        plan = next((p for p in self.get_plans(active_only=False) if str(p.get("id")) == str(plan_id)), None)
+        # Fallback to default plans if not found in DB
+        return plan or next((p for p in DEFAULT_PLANS if p["id"] == plan_id), None)
+
+    # --- Settings ---
+
+    def get_settings_rows(self) -> Optional[List[dict]]:
+        self._ensure_loaded()
+        return self.settings_rows
+
+    def get_setting(self, key: str, default: Any = None) -> Any:
+        for row in self.get_settings_rows() or []:
+            if row.get("key") == key:
+                return row.get("value")
+        return default
+
+    def settings_dict(self) -> Dict[str, Any]:
+        return {row["key"]: row["value"] for row in self.get_settings_rows() or []}
+
+
+# Global instance
+config_cache = ConfigCache(ttl_seconds=CONFIG_CACHE_TTL)
@@ -0,0 +1,187 @@
+"""
+Credit Ledger
+Reserve / commit / release flow for paid operations:
+- reserve() holds credits up front (atomic balance check in reserve_user_credits)
+- commit() marks the reservation as spent; commits are queued and written in batches
+  by a background flusher (one commit_credit_reservations RPC per batch)
+- release() returns the credits immediately when the operation fails
+Reservations that are never settled (e.g. the worker died before its queued commits
+were written) are settled by a periodic sweep after RESERVATION_TIMEOUT seconds, by the
+status of the linked generation: COMPLETED is committed, anything else is released.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.supabase_client import supabase
+from utils.logger import logger
+
+COMMIT_FLUSH_INTERVAL = float(os.getenv("CREDIT_COMMIT_FLUSH_INTERVAL", "2"))
+COMMIT_BATCH_SIZE = int(os.getenv("CREDIT_COMMIT_BATCH_SIZE", "50"))
+RESERVATION_TIMEOUT = int(os.getenv("CREDIT_RESERVATION_TIMEOUT", "7200"))
+SWEEP_INTERVAL = int(os.getenv("CREDIT_SWEEP_INTERVAL", "300"))
+
+
+# reserve_user_credits refuses with RAISE EXCEPTION 'Insufficient credits' (SQLSTATE P0001)
+INSUFFICIENT_CREDITS_MESSAGE = "Insufficient credits"
+
+
+class InsufficientCreditsError(Exception):
+    pass
+
+
+def _is_insufficient_credits(error: Exception) -> bool:
+    # postgrest's APIError carries the Postgres SQLSTATE and message
+    return getattr(error, "code", None) == "P0001" and INSUFFICIENT_CREDITS_MESSAGE in str(getattr(error, "message", "") or error)
+
+
+class CreditLedger:
+    def __init__(self):
+        self.pending_commits: List[Dict[str, Optional[str]]] = []
+        self.flush_event: Optional[asyncio.Event] = None
+        self.tasks: List[asyncio.Task] = []
+        self.committed = 0
+        self.released = 0
+
+    # --- Reserve / release (immediate) ---
+
+    def _reserve_sync(self, user_id: str, amount: int, reason: str, generation_id: Optional[str]) -> str:
+        try:
+            res = supabase.rpc("reserve_user_credits", {
+                "p_user_id": user_id,
+                "p_amount": amount,
+                "p_reason": reason,
+                "p_generation_id": generation_id,
+            }).execute()
+        except Exception as e:
+            # Only the balance check is a 402; timeouts and outages propagate as server errors
+            if _is_insufficient_credits(e):
+                raise InsufficientCreditsError(INSUFFICIENT_CREDITS_MESSAGE) from e
+            raise
+        return res.data
+
+    async def reserve(self, user_id: str, amount: int, reason: str, generation_id: Optional[str] = None) -> str:
+        """Hold credits; raises InsufficientCreditsError if the balance is too low, other errors as-is."""
+        return await run_in_threadpool(self._reserve_sync, user_id, int(amount), reason, generation_id)
+
+    def _release_sync(self, reservation_id: str, reason: str) -> bool:
+        res = supabase.rpc("release_credit_reservation", {
+            "p_reservation_id": reservation_id,
+            "p_reason": reason,
+        }).execute()
+        return bool(res.data)
+
+    async def release(self, reservation_id: Optional[str], reason: str):
+        """Return held credits. Never raises - a failed release is left for the expiry sweep."""
+        if not reservation_id:
+            return
+        try:
+            if await run_in_threadpool(self._release_sync, reservation_id, reason):
+                self.released += 1
+                logger.info(f"Released credit reservation {reservation_id}: {reason}")
+        except Exception as e:
+            logger.error(f"Failed to release credit reservation {reservation_id}: {e}")
+
+    def _attach_sync(self, reservation_id: str, generation_id: str):
+        supabase.table("credit_reservations").update({"generation_id": generation_id}).eq("id", reservation_id).execute()
+
+    async def attach(self, reservation_id: Optional[str], generation_id: str):
+        """
+        Link a reservation to the generation it pays for, so the expiry sweep can tell
+        completed work from failed work. Never raises - an unlinked reservation is released.
+        """
+        if not reservation_id:
+            return
+        try:
+            await run_in_threadpool(self._attach_sync, reservation_id, generation_id)
+        except Exception as e:
+            logger.error(f"Failed to link credit reservation {reservation_id} to generation {generation_id}: {e}")
+
+    # --- Commit (batched) ---
+
+    def commit(self, reservation_id: Optional[str], generation_id: Optional[str] = None):
+        """Queue a reservation as spent; written with the next batch."""
+        if not reservation_id:
+            return
+        self.pending_commits.append({"reservation_id": reservation_id, "generation_id": generation_id})
+        if self.flush_event and len(self.pending_commits) >= COMMIT_BATCH_SIZE:
+            self.flush_event.set()
+
+    def _commit_sync(self, batch: List[Dict[str, Optional[str]]]):
+        supabase.rpc("commit_credit_reservations", {"p_commits": batch}).execute()
+
+    async def flush(self):
+        while self.pending_commits:
+            batch = self.pending_commits[:COMMIT_BATCH_SIZE]
+            del self.pending_commits[:COMMIT_BATCH_SIZE]
+            try:
+                await run_in_threadpool(self._commit_sync, batch)
+                self.committed += len(batch)
+            except Exception as e:
+                # Put the batch back; committing is idempotent per reservation
+                logger.error(f"Credit commit batch of {len(batch)} failed: {e}")
+                self.pending_commits[:0] = batch
+                return
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=COMMIT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await self.flush()
+
+    def _sweep_sync(self) -> dict:
+        res = supabase.rpc("release_expired_credit_reservations", {"p_max_age_seconds": RESERVATION_TIMEOUT}).execute()
+        return res.data or {}
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                settled = await run_in_threadpool(self._sweep_sync)
+                if settled.get("committed") or settled.get("released"):
+                    logger.info(
+                        f"Settled expired credit reservations: {settled.get('committed', 0)} committed "
+                        f"(generation completed), {settled.get('released', 0)} released"
+                    )
+            except Exception as e:
+                logger.error(f"Credit reservation sweep failed: {e}")
+            await asyncio.sleep(SWEEP_INTERVAL)
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.flush_event = asyncio.Event()
+        self.tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._sweep_loop())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        await self.flush()
+
+    @asynccontextmanager
+    async def hold(self, user_id: str, amount: int, reason: str):
+        """
+        Reserve credits for the duration of a block; commit on success, release on any error:
+            async with credit_ledger.hold(user_id, 4, "Upscale"):
+                url = await run_in_threadpool(...)
+        """
+        reservation_id = await self.reserve(user_id, amount, reason)
+        try:
+            yield reservation_id
+        except BaseException as e:
+            await self.release(reservation_id, f"{reason} failed: {e}"[:500])
+            raise
+        self.commit(reservation_id)
+
+    def stats(self) -> dict:
+        return {"pending_commits": len(self.pending_commits), "committed": self.committed, "released": self.released}
+
+
+# Global instance
+credit_ledger = CreditLedger()
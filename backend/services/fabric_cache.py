@@ -0,0 +1,209 @@
+"""
+Fabric Texture Cache
+Serves generate_fabric grids from a cache keyed by normalized prompt.
+- Generated grids are re-hosted on R2 (Fal URLs expire) and a small JSON manifest per
+  prompt is stored next to them, so the cache survives restarts.
+- Only grids fully re-hosted on R2 are cached; if an upload fails the caller gets the
+  Fal URLs once and nothing is stored.
+- Cache hits return immediately; a fresh variant is generated in the background
+  (stale-while-revalidate) until each prompt has FABRIC_CACHE_MAX_VARIANTS grids,
+  which are then served in rotation. Background variants are paid generations, so there
+  is at most one per prompt every FABRIC_CACHE_VARIANT_INTERVAL seconds and at most
+  FABRIC_CACHE_MAX_BACKGROUND running at once.
+- Popular prompts can be pre-warmed at startup.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from services import storage
+from services.clients import lazy_module
+from utils.logger import get_logger
+
+fal_client = lazy_module("fal_client")
+logger = get_logger(__name__)
+
+FABRIC_MODEL = "fal-ai/fast-sdxl"
+FABRIC_PROMPT_SUFFIX = ", top down view, texture, seamless, high quality, 8k"
+FABRIC_FOLDER = "fabrics"
+FABRIC_MANIFEST_FOLDER = "fabrics/manifests"
+
+MAX_VARIANTS = int(os.getenv("FABRIC_CACHE_MAX_VARIANTS", "3"))
+REFRESH_INTERVAL = int(os.getenv("FABRIC_CACHE_REFRESH_INTERVAL", "3600"))
+MAX_ENTRIES = int(os.getenv("FABRIC_CACHE_MAX_ENTRIES", "500"))
+VARIANT_INTERVAL = int(os.getenv("FABRIC_CACHE_VARIANT_INTERVAL", "600"))
+MAX_BACKGROUND = int(os.getenv("FABRIC_CACHE_MAX_BACKGROUND", "2"))
+PREWARM_PROMPTS = [
+    p.strip() for p in os.getenv("FABRIC_PREWARM_PROMPTS", "linen,denim,silk,cotton,wool,leather,velvet").split(",")
+    if p.strip()
+]
+
+# Filler words that don't change which texture the user wants
+_STOPWORDS = {"a", "an", "the", "of", "fabric", "fabrics", "texture", "textures", "material", "pattern"}
+_NON_WORD = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize_fabric_prompt(prompt: str) -> str:
+    words = _NON_WORD.sub(" ", prompt.lower()).split()
+    return " ".join(w for w in words if w not in _STOPWORDS) or prompt.lower().strip()
+
+
+class FabricEntry:
+    __slots__ = ("variants", "updated_at", "hits", "refreshed_at")
+
+    def __init__(self, variants: List[List[str]], updated_at: float):
+        self.variants = variants
+        self.updated_at = updated_at
+        self.hits = 0
+        self.refreshed_at = 0.0  # last background variant started (successful or not)
+
+
+class FabricTextureCache:
+    def __init__(self):
+        self.entries: Dict[str, FabricEntry] = {}
+        self.inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _key(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+    # --- R2 manifest persistence ---
+
+    def _load_manifest_sync(self, key: str) -> Optional[List[List[str]]]:
+        try:
+            s3 = storage.get_s3_client()
+            obj = s3.get_object(Bucket=storage.R2_BUCKET_NAME, Key=f"{FABRIC_MANIFEST_FOLDER}/{key}.json")
+            return json.loads(obj["Body"].read()).get("variants") or None
+        except Exception:
+            return None
+
+    def _save_manifest_sync(self, key: str, prompt: str, variants: List[List[str]]):
+        try:
+            s3 = storage.get_s3_client()
+            s3.put_object(
+                Bucket=storage.R2_BUCKET_NAME,
+                Key=f"{FABRIC_MANIFEST_FOLDER}/{key}.json",
+                Body=json.dumps({"prompt": prompt, "variants": variants}).encode("utf-8"),
+                ContentType="application/json",
+            )
+        except Exception as e:
+            logger.warning(f"Fabric manifest save failed for {prompt}: {e}")
+
+    # --- Generation ---
+
+    async def _generate_grid(self, prompt: str) -> Tuple[List[str], bool]:
+        """Return (image_urls, rehosted); failed uploads keep their (expiring) Fal URL."""
+        handler = await fal_client.submit_async(
+            FABRIC_MODEL,
+            arguments={"prompt": prompt + FABRIC_PROMPT_SUFFIX, "num_images": 4}
+        )
+        result = await handler.get()
+        fal_urls = [img["url"] for img in result["images"]]
+        # Re-host on R2 in parallel
+        uploads = await asyncio.gather(*[
+            run_in_threadpool(storage.upload_to_r2, url, FABRIC_FOLDER, fallback=False) for url in fal_urls
+        ], return_exceptions=True)
+        failed = [r for r in uploads if isinstance(r, BaseException)]
+        if failed:
+            logger.warning(f"Fabric grid for {prompt!r} not cached, {len(failed)} R2 upload(s) failed: {failed[0]}")
+        images = [url if isinstance(r, BaseException) else r for url, r in zip(fal_urls, uploads)]
+        return images, not failed
+
+    async def _add_variant(self, key: str, prompt: str) -> List[str]:
+        images, rehosted = await self._generate_grid(prompt)
+        if not rehosted:
+            return images
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = FabricEntry([], 0)
+            entry.refreshed_at = time.time()  # the first grid counts towards the variant interval
+            self.entries[key] = entry
+            self._evict()
+        entry.variants = (entry.variants + [images])[-MAX_VARIANTS:]
+        entry.updated_at = time.time()
+        await run_in_threadpool(self._save_manifest_sync, key, prompt, entry.variants)
+        return images
+
+    def _spawn(self, key: str, prompt: str) -> asyncio.Task:
+        """Start (or join) the single in-flight generation for a key (generated from the user's own wording)."""
+        task = self.inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._add_variant(key, prompt))
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+            self.inflight[key] = task
+        return task
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled() and task.exception():
+            logger.error(f"Fabric generation failed: {task.exception()}", exc_info=task.exception())
+
+    def _may_refresh(self, key: str, entry: FabricEntry) -> bool:
+        return (
+            key not in self.inflight
+            and time.time() - entry.refreshed_at >= VARIANT_INTERVAL
+            and len(self.inflight) < MAX_BACKGROUND
+        )
+
+    def _evict(self):
+        while len(self.entries) > MAX_ENTRIES:
+            coldest = min(self.entries, key=lambda k: (self.entries[k].hits, self.entries[k].updated_at))
+            del self.entries[coldest]
+
+    async def _lookup(self, key: str) -> Optional[FabricEntry]:
+        """Memory first, then the R2 manifest (e.g. after a restart)."""
+        entry = self.entries.get(key)
+        if entry is None:
+            variants = await run_in_threadpool(self._load_manifest_sync, key)
+            if variants:
+                entry = FabricEntry(variants, time.time())
+                self.entries[key] = entry
+                self._evict()
+        return entry
+
+    # --- Public API ---
+
+    async def get_grid(self, prompt: str) -> Tuple[List[str], bool]:
+        """
+        Return (image_urls, from_cache) for a fabric prompt.
+        Misses generate synchronously; hits are instant and may trigger a background variant.
+        """
+        normalized = normalize_fabric_prompt(prompt)
+        key = self._key(normalized)
+
+        entry = await self._lookup(key)
+        if entry and entry.variants:
+            entry.hits += 1
+            images = entry.variants[entry.hits % len(entry.variants)]
+            stale = time.time() - entry.updated_at > REFRESH_INTERVAL
+            if (len(entry.variants) < MAX_VARIANTS or stale) and self._may_refresh(key, entry):
+                entry.refreshed_at = time.time()
+                self._spawn(key, prompt)
+            return images, True
+
+        # Miss: generate now (joins an in-flight prewarm for the same prompt)
+        images = await asyncio.shield(self._spawn(key, prompt))
+        return images, False
+
+    async def prewarm(self, prompts: Optional[List[str]] = None):
+        """Make sure popular prompts have at least one cached grid (R2 manifest or fresh generation)."""
+        for prompt in prompts if prompts is not None else PREWARM_PROMPTS:
+            normalized = normalize_fabric_prompt(prompt)
+            key = self._key(normalized)
+            try:
+                entry = await self._lookup(key)
+                if not entry or not entry.variants:
+                    await self._spawn(key, prompt)
+            except Exception as e:
+                logger.error(f"Fabric prewarm failed for {prompt}: {e}", exc_info=True)
+
+
+# Global instance
+fabric_cache = FabricTextureCache()
@@ -1,6 +1,9 @@
-import fal_client
 import os
 from fastapi import HTTPException
+from services.clients import lazy_module
+from services.model_adapters import model_adapters
+
+fal_client = lazy_module("fal_client")
 
 # Ensure FAL_KEY is set
 if not os.getenv("FAL_KEY"):
@@ -12,77 +15,16 @@ def generate_image(prompt: str, model: str = "flux-pro", aspect_ratio: str = "1:
     Returns the URL of the generated image.
     """
     try:
-        # Use the provided model string as the endpoint directly if it looks like a FAL path
-        # Otherwise fall back to mapping for legacy support
-        endpoint = model
-        if not "/" in model:
-            if model == "flux-dev":
-                endpoint = "fal-ai/flux/dev"
-            else:
-                endpoint = "fal-ai/flux-pro/v1.1"
-            
+        # Endpoint (legacy names included) and arguments come from the compiled adapter
+        endpoint, arguments = model_adapters.for_path("FAL", model, "IMAGE").build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            references=references,
+            parameters=parameters,
+            resolution=resolution,
+            num_images=num_images,
+        )
         print(f"[FAL] Generating image with endpoint: {endpoint}, n={num_images}")
-            
-        # Map aspect ratio to image_size
-        image_size = "square"
-        if aspect_ratio == "16:9":
-            image_size = "landscape_16_9"
-        elif aspect_ratio == "9:16":
-            image_size = "portrait_16_9"
-        elif aspect_ratio == "4:3":
-            image_size = "landscape_4_3"
-        elif aspect_ratio == "3:4":
-            image_size = "portrait_4_3"
-
-        # Override with explicit resolution if provided (format "WxH")
-        # FAL often takes image_size dict {width: w, height: h} for custom sizes if supported
-        arguments = {
-            "prompt": prompt,
-            "image_size": image_size,
-            "num_images": num_images,
-            "safety_tolerance": "2", # Allow some creative freedom
-        }
-        
-        if resolution and "x" in resolution:
-            try:
-                w, h = map(int, resolution.split("x"))
-                arguments["image_size"] = { "width": w, "height": h }
-            except:
-                pass # Fallback to aspect ratio default
-        
-        # Merge dynamic parameters if provided
-        if parameters:
-            # Handle common parameter mappings for Fal compatibility
-            mapped_params = parameters.copy()
-            
-            # Map 'format' or 'image_format' to 'output_format'
-            if "format" in mapped_params:
-                mapped_params["output_format"] = mapped_params.pop("format")
-            if "image_format" in mapped_params:
-                mapped_params["output_format"] = mapped_params.pop("image_format")
-            
-            # Additional parameter mappings
-            if "steps" in mapped_params and "num_inference_steps" not in mapped_params:
-                mapped_params["num_inference_steps"] = mapped_params.pop("steps")
-            
-            # Allow common parameters to pass through
-            # guidance_scale, num_inference_steps, seed, enable_safety_checker
-            
-            arguments.update(mapped_params)
-        
-        # Add reference images if provided
-        if references and len(references) > 0:
-            # Special handling for models that require 'image_urls' (plural) even for single image
-            if "nano-banana" in model:
-                arguments["image_urls"] = references[:3]
-            else:
-                arguments["image_url"] = references[0]  # Use first reference as main image
-                # Some models support multiple reference images via image_urls array
-                if len(references) > 1:
-                     # For flux/dev, typically 'image_url' is single. 
-                     # Some implementations allow list. We keep single for safety unless known otherwise.
-                     pass 
-        
         print(f"[FAL] Arguments: {arguments}")
         
         handler = fal_client.submit(
@@ -108,67 +50,14 @@ def generate_video(prompt: str, model: str = "kling-pro", duration: str = "5s",
     Returns the URL of the generated video.
     """
     try:
-        # Use the provided model string as the endpoint directly if it looks like a FAL path
-        endpoint = model
-        if not "/" in model:
-            endpoint = "fal-ai/kling-video/v1/standard/text-to-video"
-            if model == "luma-dream-machine":
-                endpoint = "fal-ai/luma-dream-machine"
-
-        print(f"[FAL] Generating video with endpoint: {endpoint}")
-
-        # Map duration
-        duration_seconds = 5
-        if duration == "10s":
-            duration_seconds = 10
-
-        arguments = {
-            "prompt": prompt,
-            "duration": str(duration_seconds),
-            "aspect_ratio": aspect_ratio
-        }
-        
-        # Merge dynamic parameters if provided
-        if parameters:
-            arguments.update(parameters)
-            
-        # Ensure duration is correct format (strip 's')
-        if "duration" in arguments:
-            d = str(arguments["duration"])
-            if d.endswith("s"):
-                arguments["duration"] = d.replace("s", "")
-        
-        
-        # Handle endpoint switching for Kling if no references
-        if "kling" in endpoint and "image-to-video" in endpoint:
-            has_refs = False
-            if references and len(references) > 0:
-                 has_refs = True
-            
-            if not has_refs:
-                print(f"Switching {endpoint} to text-to-video variant")
-                endpoint = endpoint.replace("image-to-video", "text-to-video")
-
-        # Add reference images (start/end frames) if provided
-        if references and len(references) > 0:
-            if len(references) >= 2:
-                # Use first as start frame, second as end frame
-                if isinstance(references[0], str):
-                    arguments["image_url"] = references[0]
-                elif isinstance(references[0], dict) and "url" in references[0]:
-                    arguments["image_url"] = references[0]["url"]
-                    
-                if isinstance(references[1], str):
-                    arguments["end_image_url"] = references[1]
-                elif isinstance(references[1], dict) and "url" in references[1]:
-                    arguments["end_image_url"] = references[1]["url"]
-
-            elif len(references) == 1:
-                # Use single reference as start frame
-                if isinstance(references[0], str):
-                    arguments["image_url"] = references[0]
-                elif isinstance(references[0], dict) and "url" in references[0]:
-                     arguments["image_url"] = references[0]["url"]
+        # Kling models switch to text-to-video without a start frame and take an end frame
+        endpoint, arguments = model_adapters.for_path("FAL", model, "VIDEO").build(
+            prompt,
+            aspect_ratio=aspect_ratio,
+            duration=duration,
+            references=references,
+            parameters=parameters,
+        )
 
         print(f"[FAL] Arguments: {arguments}")
         print(f"[FAL] Endpoint: {endpoint}")
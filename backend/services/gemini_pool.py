@@ -0,0 +1,84 @@
+"""
+Gemini Model Pool
+Keeps prepared google.generativeai GenerativeModel objects (and the converted tool
+declarations) so chat requests don't reconfigure the SDK and rebuild the model per message.
+Entries are keyed by (model name, system instruction, tools version) and are dropped
+on invalidate() (ai_models changes) or after a TTL, since models can also be edited
+directly in Supabase.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class GeminiModelPool:
+    def __init__(self, ttl_seconds: int = 600, max_entries: int = 32):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.models: Dict[Tuple[str, str, int], Tuple[Any, float]] = {}  # key -> (model, created_at)
+        self.version = 0
+        self.configured_key: Optional[str] = None
+        self.gemini_tools: Optional[List[dict]] = None
+        self.lock = threading.Lock()
+
+    def configure(self, genai, api_key: str):
+        """Call genai.configure only when the API key actually changes."""
+        if self.configured_key != api_key:
+            with self.lock:
+                if self.configured_key != api_key:
+                    genai.configure(api_key=api_key)
+                    self.configured_key = api_key
+                    self.models.clear()
+
+    def get_tools(self, tools: List[dict], converter: Callable[[List[dict]], Optional[List[dict]]]):
+        """Convert OpenAI tool definitions to Gemini format once."""
+        if self.gemini_tools is None:
+            self.gemini_tools = converter(tools)
+        return self.gemini_tools
+
+    def get_model(self, genai, model_name: str, system_instruction: str, tools: Optional[List[dict]]):
+        prompt_hash = hashlib.sha1(system_instruction.encode("utf-8")).hexdigest()
+        key = (model_name, prompt_hash, self.version)
+        now = time.time()
+
+        with self.lock:
+            entry = self.models.get(key)
+            if entry and now - entry[1] < self.ttl_seconds:
+                return entry[0]
+
+        model = genai.GenerativeModel(
+            model_name,
+            system_instruction=system_instruction,
+            tools=tools,
+            # Set tool config to auto
+            tool_config={'function_calling_config': 'AUTO'}
+        )
+
+        with self.lock:
+            # Drop expired and stale-version entries before inserting
+            for k in [k for k, (_, created) in self.models.items() if now - created >= self.ttl_seconds or k[2] != self.version]:
+                del self.models[k]
+            if len(self.models) >= self.max_entries:
+                oldest = min(self.models, key=lambda k: self.models[k][1])
+                del self.models[oldest]
+            self.models[key] = (model, now)
+
+        logger.debug(f"Prepared Gemini model {model_name} (pool size {len(self.models)})")
+        return model
+
+    def invalidate(self):
+        """Drop all prepared models, e.g. after ai_models or tool definitions change."""
+        with self.lock:
+            self.version += 1
+            self.models.clear()
+            self.gemini_tools = None
+
+
+# Global instance
+gemini_model_pool = GeminiModelPool(ttl_seconds=int(os.getenv("GEMINI_MODEL_POOL_TTL", "600")))
@@ -0,0 +1,296 @@
+"""
+Generation Scheduler
+Sits in front of provider calls (/generate and the image-tool endpoints) and bounds:
+- concurrency per provider (whole-account limits at Fal, Replicate, ...)
+- concurrency and queue length per user
+Waiting jobs are dispatched by weighted fair queuing: each user's jobs get a virtual
+finish tag of max(V, user's last tag) + cost / weight, where weight grows with the
+plan tier_level, so one user's burst cannot starve everyone else and paying tiers
+get a larger share when providers are saturated.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.supabase_client import supabase
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip().upper()] = int(value)
+    return limits
+
+
+PROVIDER_LIMITS = _parse_limits(os.getenv("GEN_PROVIDER_LIMITS", "FAL=8,REPLICATE=4,OPENROUTER=8"))
+DEFAULT_PROVIDER_LIMIT = int(os.getenv("GEN_PROVIDER_DEFAULT_LIMIT", "4"))
+USER_MAX_RUNNING = int(os.getenv("GEN_USER_MAX_RUNNING", "2"))
+USER_MAX_PENDING = int(os.getenv("GEN_USER_MAX_PENDING", "20"))
+QUEUE_TIMEOUT = float(os.getenv("GEN_QUEUE_TIMEOUT", "900"))
+TIER_CACHE_TTL = int(os.getenv("GEN_TIER_CACHE_TTL", "300"))
+
+
+class GenerationQueueFull(Exception):
+    """The user already has USER_MAX_PENDING generations queued or running."""
+
+
+class _Waiter:
+    __slots__ = ("user_id", "finish_tag", "start_tag", "future", "enqueued_at")
+
+    def __init__(self, user_id: str, start_tag: float, finish_tag: float, future: asyncio.Future):
+        self.user_id = user_id
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ProviderQueue:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self.waiting: Dict[str, Deque[_Waiter]] = {}  # user_id -> FIFO of that user's jobs
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.last_finish: Dict[str, float] = {}
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        provider_limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 4,
+        user_max_running: int = 2,
+        user_max_pending: int = 20,
+        queue_timeout: float = 900,
+    ):
+        self.provider_limits = provider_limits or {}
+        self.default_limit = default_limit
+        self.user_max_running = user_max_running
+        self.user_max_pending = user_max_pending
+        self.queue_timeout = queue_timeout
+
+        self.queues: Dict[str, _ProviderQueue] = {}
+        self.user_running: Dict[str, int] = {}
+        self.user_pending: Dict[str, int] = {}  # queued + running, across providers
+
+        self.dispatched = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        name = (provider or "FAL").upper()
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = _ProviderQueue(name, self.provider_limits.get(name, self.default_limit))
+            self.queues[name] = queue
+        return queue
+
+    def has_capacity(self, user_id: str) -> bool:
+        """Cheap admission check, used before credits are deducted."""
+        return self.user_pending.get(user_id, 0) < self.user_max_pending
+
+    # --- Dispatch ---
+
+    def _next_waiter(self, queue: _ProviderQueue) -> Optional[_Waiter]:
+        """Smallest finish tag among users that are below their running cap."""
+        best = None
+        for user_id, waiters in queue.waiting.items():
+            if self.user_running.get(user_id, 0) >= self.user_max_running:
+                continue
+            head = waiters[0]
+            if best is None or head.finish_tag < best.finish_tag:
+                best = head
+        return best
+
+    def _dispatch(self):
+        for queue in self.queues.values():
+            while queue.running < queue.limit:
+                waiter = self._next_waiter(queue)
+                if waiter is None:
+                    break
+                self._dequeue(queue, waiter)
+                queue.virtual_time = max(queue.virtual_time, waiter.start_tag)
+                queue.running += 1
+                self.user_running[waiter.user_id] = self.user_running.get(waiter.user_id, 0) + 1
+                self.dispatched += 1
+                self.total_wait += time.monotonic() - waiter.enqueued_at
+                waiter.future.set_result(None)
+
+            # Forget finish tags that can no longer affect ordering
+            if len(queue.last_finish) > 10000:
+                queue.last_finish = {
+                    u: tag for u, tag in queue.last_finish.items()
+                    if tag > queue.virtual_time or u in queue.waiting
+                }
+
+    def _dequeue(self, queue: _ProviderQueue, waiter: _Waiter):
+        waiters = queue.waiting.get(waiter.user_id)
+        if not waiters:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        queue.queued -= 1
+        if not waiters:
+            del queue.waiting[waiter.user_id]
+
+    def _decrement(self, counts: Dict[str, int], user_id: str):
+        remaining = counts.get(user_id, 0) - 1
+        if remaining > 0:
+            counts[user_id] = remaining
+        else:
+            counts.pop(user_id, None)
+
+    # --- Public API ---
+
+    async def acquire(self, provider: str, user_id: str, tier_level: int = 0, cost: float = 1.0):
+        if not self.has_capacity(user_id):
+            self.rejected += 1
+            raise GenerationQueueFull(f"User {user_id} has too many pending generations")
+
+        queue = self._queue(provider)
+        weight = 1 + max(tier_level, 0)
+        start_tag = max(queue.virtual_time, queue.last_finish.get(user_id, 0.0))
+        finish_tag = start_tag + max(cost, 0.01) / weight
+        queue.last_finish[user_id] = finish_tag
+
+        waiter = _Waiter(user_id, start_tag, finish_tag, asyncio.get_running_loop().create_future())
+        queue.waiting.setdefault(user_id, deque()).append(waiter)
+        queue.queued += 1
+        self.user_pending[user_id] = self.user_pending.get(user_id, 0) + 1
+
+        self._dispatch()
+        if waiter.future.done():
+            return
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just as we gave up
+                self.release(provider, user_id)
+            else:
+                self._dequeue(queue, waiter)
+                self._decrement(self.user_pending, user_id)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+            raise
+
+    def release(self, provider: str, user_id: str):
+        queue = self._queue(provider)
+        queue.running = max(queue.running - 1, 0)
+        self._decrement(self.user_running, user_id)
+        self._decrement(self.user_pending, user_id)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, provider: str, user_id: str, cost: float = 1.0):
+        """
+        Hold a provider slot for the duration of a provider call:
+            async with generation_scheduler.slot("FAL", user_id):
+                result = await provider.generate_image(...)
+        """
+        tier_level = await get_user_tier(user_id)
+        await self.acquire(provider, user_id, tier_level=tier_level, cost=cost)
+        try:
+            yield
+        finally:
+            self.release(provider, user_id)
+
+    def stats(self) -> dict:
+        return {
+            "providers": {
+                name: {
+                    "limit": q.limit,
+                    "running": q.running,
+                    "queued": q.queued,
+                    "queued_users": len(q.waiting),
+                }
+                for name, q in self.queues.items()
+            },
+            "users_active": len(self.user_pending),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.dispatched * 1000, 1) if self.dispatched else 0.0,
+        }
+
+
+# --- Plan tier lookup ---
+
+_tier_cache: Dict[str, tuple] = {}  # user_id -> (tier_level, fetched_at)
+
+
+def _fetch_user_tier(user_id: str) -> int:
+    res = supabase.table("profiles").select("*").eq("id", user_id).execute()
+    if not res.data:
+        return 0
+    profile = res.data[0]
+    if profile.get("tier_level") is not None:
+        return int(profile["tier_level"])
+    return 1 if profile.get("is_pro") else 0
+
+
+async def get_user_tier(user_id: str) -> int:
+    cached = _tier_cache.get(user_id)
+    if cached and time.time() - cached[1] < TIER_CACHE_TTL:
+        return cached[0]
+    try:
+        tier = await run_in_threadpool(_fetch_user_tier, user_id)
+    except Exception as e:
+        logger.warning(f"Tier lookup failed for {user_id}: {e}")
+        tier = cached[0] if cached else 0
+    if len(_tier_cache) > 10000:
+        _tier_cache.clear()
+    _tier_cache[user_id] = (tier, time.time())
+    return tier
+
+
+def peek_user_tier(user_id: str) -> Optional[int]:
+    """Cached tier without any DB work (None if unknown or expired)."""
+    cached = _tier_cache.get(user_id)
+    if cached and time.time() - cached[1] < TIER_CACHE_TTL:
+        return cached[0]
+    return None
+
+
+_tier_warming: Set[str] = set()
+
+
+def warm_user_tier(user_id: str):
+    """Fetch a user's tier in the background (at most one lookup in flight per user)."""
+    if user_id in _tier_warming:
+        return
+
+    async def _warm():
+        try:
+            await get_user_tier(user_id)
+        finally:
+            _tier_warming.discard(user_id)
+
+    _tier_warming.add(user_id)
+    asyncio.create_task(_warm())
+
+
+# Global instance
+generation_scheduler = GenerationScheduler(
+    provider_limits=PROVIDER_LIMITS,
+    default_limit=DEFAULT_PROVIDER_LIMIT,
+    user_max_running=USER_MAX_RUNNING,
+    user_max_pending=USER_MAX_PENDING,
+    queue_timeout=QUEUE_TIMEOUT,
+)
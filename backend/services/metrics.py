@@ -0,0 +1,267 @@
+"""
+Metrics
+Minimal in-process Prometheus registry (counters, gauges, histograms) rendered in the
+text exposition format by GET /metrics - no client library or push gateway needed.
+Metrics are per worker process; scrape each worker (or run a single worker) as usual.
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+GENERATION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[tuple, float] = {}
+        self.function: Optional[Callable[[], Dict[tuple, float]]] = None
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], Dict[tuple, float]]):
+        """Compute the gauge at scrape time: function returns {label values tuple: value}."""
+        self.function = function
+
+    def _samples(self) -> List[str]:
+        if self.function:
+            try:
+                items = list(self.function().items())
+            except Exception:
+                items = []
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """with histogram.time(route="x"): ... records the elapsed seconds."""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self.lock:
+            items = [(key, list(entry)) for key, entry in self.values.items()]
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{labels} {entry[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+metrics = MetricsRegistry()
+
+# --- Pipeline metrics ---
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template (until the body is fully sent)",
+    ("method", "route", "status"),
+)
+generation_duration = metrics.histogram(
+    "generation_duration_seconds", "Provider call duration in process_generation_task",
+    ("provider", "model", "type", "status"), GENERATION_BUCKETS,
+)
+generation_queue_wait = metrics.histogram(
+    "generation_queue_wait_seconds", "Time a generation waited for a provider slot",
+    ("provider",), DEFAULT_BUCKETS + (30.0, 60.0, 300.0),
+)
+generation_failures = metrics.counter(
+    "generation_failures_total", "Failed generations by provider and model", ("provider", "model"),
+)
+r2_upload_bytes = metrics.counter("r2_upload_bytes_total", "Bytes uploaded to R2", ("folder",))
+r2_upload_duration = metrics.histogram(
+    "r2_upload_duration_seconds", "R2 upload duration (including the download for URL sources)", ("source", "status"),
+)
+supabase_request_duration = metrics.histogram(
+    "supabase_request_duration_seconds", "Supabase PostgREST latency until response headers", ("method", "resource", "status"),
+)
+chat_time_to_first_token = metrics.histogram(
+    "chat_time_to_first_token_seconds", "Time from chat request to the first streamed chunk", ("provider",),
+    DEFAULT_BUCKETS + (20.0, 30.0, 60.0),
+)
+websocket_connections = metrics.gauge("websocket_connections", "Open Yjs websocket connections")
+websocket_rooms = metrics.gauge("websocket_rooms", "Active Yjs rooms")
+event_loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop heartbeat woke up (time the loop was blocked)",
+    (), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+event_loop_stalls = metrics.counter(
+    "event_loop_stalls_total", "Event loop blocks longer than LOOP_LAG_THRESHOLD_MS by route template", ("route",),
+)
+
+
+async def observe_first_chunk(stream, histogram: Histogram, started_at: float, **labels):
+    """Pass an async stream through, recording the delay until its first chunk."""
+    first = True
+    async for chunk in stream:
+        if first:
+            histogram.observe(time.perf_counter() - started_at, **labels)
+            first = False
+        yield chunk
+
+
+class MetricsMiddleware:
+    """Raw ASGI middleware recording http_request_duration_seconds (streaming-safe)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI stores the matched route in the scope; use its template to bound cardinality
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
@@ -0,0 +1,383 @@
+"""
+Model Adapters
+Per-model request builders for the generation providers, compiled once per model version
+instead of re-deriving the argument layout from the api_path on every call.
+- ai_models.adapter (jsonb) declares how a model takes its inputs: a preset plus overrides
+  for aspect ratio, duration, references, renames, defaults, endpoints (see PRESETS)
+- models without an adapter get the preset that matches their provider/type/api_path
+- parameters_schema options and slider ranges are compiled into validators, so /generate
+  rejects bad inputs (422) before credits are reserved
+- compiled adapters are cached by (model id, updated_at); the update trigger on ai_models
+  bumps updated_at, so edits take effect without a restart
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Legacy model strings (no provider path) still sent by old clients
+LEGACY_ENDPOINTS = {
+    ("FAL", "IMAGE"): {"flux-dev": "fal-ai/flux/dev", "*": "fal-ai/flux-pro/v1.1"},
+    ("FAL", "VIDEO"): {
+        "hunyuan": "fal-ai/hunyuan-video",
+        "luma-dream-machine": "fal-ai/luma-dream-machine",
+        "*": "fal-ai/kling-video/v1/standard/text-to-video",
+    },
+}
+
+FAL_IMAGE_SIZES = {
+    "1:1": "square_hd",
+    "16:9": "landscape_16_9",
+    "9:16": "portrait_16_9",
+    "4:3": "landscape_4_3",
+    "3:4": "portrait_4_3",
+    "21:9": "landscape_16_9",
+}
+
+_FAL_IMAGE = {
+    "aspect_ratio": "fal_image_size",
+    "resolution": "image_size",
+    "num_images": "num_images",
+    "max_images": 4,
+    "defaults": {"safety_tolerance": "2"},
+    "rename": {"format": "output_format", "image_format": "output_format", "steps": "num_inference_steps"},
+    "references": {"mode": "single", "key": "image_url"},
+}
+
+# Keys of an ai_models.adapter spec (every key is optional; "preset" picks the base):
+#   aspect_ratio  "fal_image_size" (enum image_size) | "aspect_ratio" (sent as is) | "none"
+#   resolution    "image_size" ("WxH" -> {"width", "height"} when no image_size is set) | "none"
+#   duration      "passthrough" | "seconds" (int) | "seconds_string" ("5") | "none"
+#   references    {"mode": "single" | "list" | "start_end", "key", "start_key", "end_key", "max", "required"}
+#   num_images    argument name for the image count, or null to not send it; max_images caps it
+#   defaults      arguments sent unless the request sets them; rename maps parameter names
+#   endpoint      provider endpoint (default: api_path); text_endpoint is used when there are no references
+PRESETS: Dict[str, dict] = {
+    "fal_image": _FAL_IMAGE,
+    "fal_image_multi_ref": {**_FAL_IMAGE, "references": {"mode": "list", "key": "image_urls", "max": 3}},
+    "fal_video": {
+        "aspect_ratio": "aspect_ratio",
+        "duration": "passthrough",
+        "references": {"mode": "single", "key": "image_url"},
+    },
+    "fal_kling_video": {
+        "aspect_ratio": "aspect_ratio",
+        "duration": "seconds_string",
+        "references": {"mode": "start_end", "key": "image_url", "end_key": "end_image_url"},
+    },
+    "replicate_image": {
+        "aspect_ratio": "aspect_ratio",
+        "references": {"mode": "single", "key": "image"},
+    },
+    "replicate_video": {
+        "aspect_ratio": "aspect_ratio",
+        "duration": "seconds",
+        "references": {"mode": "start_end", "key": "image", "start_key": "start_image", "end_key": "end_image"},
+    },
+    # Chat-completion providers build their own request; the adapter only validates
+    "passthrough": {},
+}
+
+_SPEC_VALUES = {
+    "aspect_ratio": ("fal_image_size", "aspect_ratio", "none"),
+    "resolution": ("image_size", "none"),
+    "duration": ("passthrough", "seconds", "seconds_string", "none"),
+}
+_REFERENCE_MODES = ("single", "list", "start_end")
+
+
+class AdapterValidationError(ValueError):
+    """Invalid generation inputs for a model (or an invalid adapter spec)."""
+
+
+def default_preset(provider: str, model_type: str, api_path: str) -> str:
+    """Preset for models without an explicit ai_models.adapter (resolved once per model version)."""
+    path = (api_path or "").lower()
+    if provider == "FAL":
+        if model_type == "VIDEO":
+            return "fal_kling_video" if "kling" in path else "fal_video"
+        return "fal_image_multi_ref" if "nano-banana" in path else "fal_image"
+    if provider == "REPLICATE":
+        return "replicate_video" if model_type == "VIDEO" else "replicate_image"
+    return "passthrough"
+
+
+def _duration_seconds(value) -> Optional[int]:
+    try:
+        return int(str(value).strip().rstrip("s"))
+    except ValueError:
+        return None
+
+
+class ModelAdapter:
+    def __init__(self, provider: str, model_type: str, api_path: str, spec: Optional[dict] = None, parameters_schema: Optional[list] = None):
+        self.provider = (provider or "FAL").upper()
+        self.model_type = (model_type or "IMAGE").upper()
+        self.api_path = api_path
+        if spec is not None and not isinstance(spec, dict):
+            raise AdapterValidationError("Adapter spec must be a JSON object")
+        spec = dict(spec or {})
+        self.endpoint = spec.get("endpoint") or self._legacy_endpoint(api_path or "")
+        preset = spec.pop("preset", None) or default_preset(self.provider, self.model_type, self.endpoint)
+        if preset not in PRESETS:
+            raise AdapterValidationError(f"Unknown adapter preset '{preset}'")
+        self.preset = preset
+        self.spec = {**PRESETS[preset], **spec}
+        self._check_spec()
+
+        self.text_endpoint = self.spec.get("text_endpoint")
+        references = self.spec.get("references") or {}
+        if preset == "fal_kling_video" and not self.text_endpoint and "image-to-video" in self.endpoint:
+            # Kling image-to-video endpoints have a text-to-video twin for requests without a frame
+            self.text_endpoint = self.endpoint.replace("image-to-video", "text-to-video")
+        self.references_required = references.get("required", "image-to-video" in self.endpoint and not self.text_endpoint)
+
+        self.steps: List[Callable[[dict, dict], None]] = self._compile_steps()
+        self.validators: List[Callable[[dict], None]] = self._compile_validators(parameters_schema or [])
+
+    # --- Compilation ---
+
+    def _check_spec(self):
+        for key, allowed in _SPEC_VALUES.items():
+            value = self.spec.get(key, "none")
+            if value not in allowed:
+                raise AdapterValidationError(f"Adapter {key} must be one of {', '.join(allowed)}, got '{value}'")
+        references = self.spec.get("references")
+        if references and (not isinstance(references, dict) or references.get("mode") not in _REFERENCE_MODES):
+            raise AdapterValidationError(f"Adapter references.mode must be one of {', '.join(_REFERENCE_MODES)}")
+
+    def _legacy_endpoint(self, api_path: str) -> str:
+        if "/" in api_path:
+            return api_path
+        aliases = LEGACY_ENDPOINTS.get((self.provider, self.model_type))
+        if not aliases:
+            return api_path
+        return aliases.get(api_path) or next((v for k, v in aliases.items() if k != "*" and api_path.startswith(k)), aliases["*"])
+
+    def _compile_steps(self) -> List[Callable[[dict, dict], None]]:
+        """Turn the spec into a fixed list of argument transforms (run in order per request)."""
+        spec, steps = self.spec, []
+        defaults = dict(spec.get("defaults") or {})
+        num_images_key = spec.get("num_images")
+        rename = dict(spec.get("rename") or {})
+
+        def base(args, req):
+            args["prompt"] = req["prompt"]
+            if num_images_key:
+                args[num_images_key] = req["num_images"]
+            args.update(defaults)
+        steps.append(base)
+
+        if spec.get("aspect_ratio") == "fal_image_size":
+            def aspect_ratio(args, req):
+                params = req["parameters"]
+                if req["aspect_ratio"] and "image_size" not in params and "aspect_ratio" not in params:
+                    args["image_size"] = FAL_IMAGE_SIZES.get(req["aspect_ratio"], "square_hd")
+            steps.append(aspect_ratio)
+        elif spec.get("aspect_ratio") == "aspect_ratio":
+            def aspect_ratio(args, req):
+                if req["aspect_ratio"]:
+                    args["aspect_ratio"] = req["aspect_ratio"]
+            steps.append(aspect_ratio)
+
+        duration_mode = spec.get("duration", "none")
+        if duration_mode != "none":
+            def duration(args, req):
+                if req["duration"]:
+                    args["duration"] = req["duration"]
+            steps.append(duration)
+
+        def parameters(args, req):
+            for key, value in req["parameters"].items():
+                args[rename.get(key, key)] = value
+        steps.append(parameters)
+
+        if spec.get("resolution") == "image_size":
+            def resolution(args, req):
+                res = req["resolution"]
+                if res and "x" in res and "image_size" not in args:
+                    try:
+                        width, height = map(int, res.split("x"))
+                        args["image_size"] = {"width": width, "height": height}
+                    except ValueError:
+                        pass
+            steps.append(resolution)
+
+        # Normalised after the merge, so schema values like "5s" get the model's format too
+        if duration_mode in ("seconds", "seconds_string"):
+            def duration_format(args, req):
+                if "duration" in args:
+                    seconds = _duration_seconds(args["duration"])
+                    if seconds is None:
+                        del args["duration"]
+                    else:
+                        args["duration"] = seconds if duration_mode == "seconds" else str(seconds)
+            steps.append(duration_format)
+
+        references = spec.get("references")
+        if references:
+            mode, key = references["mode"], references.get("key", "image_url")
+            limit = references.get("max")
+            start_key, end_key = references.get("start_key", key), references.get("end_key")
+
+            def add_references(args, req):
+                refs = req["references"]
+                if not refs:
+                    return
+                if mode == "list":
+                    args[key] = refs[:limit] if limit else list(refs)
+                elif mode == "start_end" and end_key and len(refs) >= 2:
+                    args[start_key] = refs[0]
+                    args[end_key] = refs[1]
+                else:
+                    args[key] = refs[0]
+            steps.append(add_references)
+        return steps
+
+    def _compile_validators(self, parameters_schema: list) -> List[Callable[[dict], None]]:
+        validators = []
+        max_images = self.spec.get("max_images") if self.spec.get("num_images") else None
+
+        def counts(req):
+            # Models without a num_images argument get req["num_images"] clamped to 1 (see _request)
+            if req["num_images"] < 1 or (max_images and req["num_images"] > max_images):
+                raise AdapterValidationError(f"num_images must be between 1 and {max_images}" if max_images else "num_images must be at least 1")
+            if self.references_required and not req["references"]:
+                raise AdapterValidationError(f"{self.api_path} needs a reference image")
+        validators.append(counts)
+
+        for field in parameters_schema:
+            if not isinstance(field, dict) or not field.get("key"):
+                continue
+            key = field["key"]
+            # Top-level aspect_ratio/duration are checked against the same schema field
+            top_level = key if key in ("aspect_ratio", "duration") else None
+            options = [o.get("value") if isinstance(o, dict) else o for o in field.get("options") or []]
+            if options:
+                allowed = {str(o) for o in options}
+                # "5s" and 5 are the same duration; the duration step formats it per model
+                normalize = _duration_seconds if key == "duration" else str
+                accepted = {normalize(o) for o in options}
+
+                def check_option(req, key=key, allowed=allowed, accepted=accepted, normalize=normalize,
+                                 top_level=top_level, label=field.get("label") or key):
+                    for value in self._values(req, key, top_level):
+                        if normalize(value) not in accepted:
+                            raise AdapterValidationError(f"{label} must be one of {', '.join(sorted(allowed))}, got '{value}'")
+                validators.append(check_option)
+            elif "min" in field or "max" in field:
+                low, high = field.get("min"), field.get("max")
+                if any(bound is not None and not isinstance(bound, (int, float)) for bound in (low, high)):
+                    raise AdapterValidationError(f"parameters_schema {key}: min and max must be numbers")
+
+                def check_range(req, key=key, low=low, high=high, label=field.get("label") or key):
+                    if key not in req["parameters"]:
+                        return
+                    try:
+                        number = float(req["parameters"][key])
+                    except (TypeError, ValueError):
+                        raise AdapterValidationError(f"{label} must be a number")
+                    if (low is not None and number < low) or (high is not None and number > high):
+                        raise AdapterValidationError(f"{label} must be between {low} and {high}")
+                validators.append(check_range)
+        return validators
+
+    @staticmethod
+    def _values(req: dict, key: str, top_level: Optional[str] = None) -> List[Any]:
+        if key in req["parameters"]:
+            return [req["parameters"][key]]
+        # The top-level value is only sent when the parameters don't set it
+        return [req[top_level]] if top_level and req.get(top_level) else []
+
+    # --- Per request ---
+
+    def _request(self, prompt, aspect_ratio, duration, references, parameters, resolution, num_images) -> dict:
+        num_images = num_images or 1
+        if not self.spec.get("num_images"):
+            # The model can't take an image count (e.g. replicate_image): one image, as before adapters
+            num_images = min(num_images, 1)
+        return {
+            "prompt": prompt,
+            "aspect_ratio": aspect_ratio,
+            "duration": duration,
+            "references": [r["url"] if isinstance(r, dict) else r for r in references or [] if r],
+            "parameters": parameters or {},
+            "resolution": resolution,
+            "num_images": num_images,
+        }
+
+    def validate(self, prompt: str = "", aspect_ratio: Optional[str] = None, duration: Optional[str] = None,
+                 references: Optional[list] = None, parameters: Optional[dict] = None,
+                 resolution: Optional[str] = None, num_images: int = 1):
+        """Raise AdapterValidationError if the inputs don't fit this model."""
+        req = self._request(prompt, aspect_ratio, duration, references, parameters, resolution, num_images)
+        for validator in self.validators:
+            validator(req)
+
+    def build(self, prompt: str, aspect_ratio: Optional[str] = None, duration: Optional[str] = None,
+              references: Optional[list] = None, parameters: Optional[dict] = None,
+              resolution: Optional[str] = None, num_images: int = 1) -> Tuple[str, dict]:
+        """
+        Return (endpoint, provider arguments) for one request.
+        Inputs are expected to have passed validate() (done by /generate before credits are reserved).
+        """
+        req = self._request(prompt, aspect_ratio, duration, references, parameters, resolution, num_images)
+        args: dict = {}
+        for step in self.steps:
+            step(args, req)
+        endpoint = self.endpoint if req["references"] or not self.text_endpoint else self.text_endpoint
+        return endpoint, args
+
+    def describe(self) -> dict:
+        return {
+            "provider": self.provider,
+            "type": self.model_type,
+            "preset": self.preset,
+            "endpoint": self.endpoint,
+            "text_endpoint": self.text_endpoint,
+            "references_required": self.references_required,
+            "spec": self.spec,
+            "validators": len(self.validators),
+        }
+
+
+class ModelAdapterRegistry:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.adapters: "OrderedDict[tuple, ModelAdapter]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key: tuple, factory: Callable[[], ModelAdapter]) -> ModelAdapter:
+        with self.lock:
+            adapter = self.adapters.get(key)
+            if adapter is not None:
+                self.adapters.move_to_end(key)
+                return adapter
+        adapter = factory()
+        with self.lock:
+            self.adapters[key] = adapter
+            while len(self.adapters) > self.max_entries:
+                self.adapters.popitem(last=False)
+        return adapter
+
+    def get(self, model_config: dict, model_type: Optional[str] = None) -> ModelAdapter:
+        """Compiled adapter for an ai_models row (needs provider, type, api_path; adapter/parameters_schema optional)."""
+        provider = (model_config.get("provider") or "FAL").upper()
+        model_type = (model_config.get("type") or model_type or "IMAGE").upper()
+        key = (model_config.get("id") or model_config.get("api_path"), model_config.get("updated_at"), provider, model_type)
+        return self._get(key, lambda: ModelAdapter(
+            provider, model_type, model_config.get("api_path") or "",
+            model_config.get("adapter"), model_config.get("parameters_schema"),
+        ))
+
+    def for_path(self, provider: str, model_path: str, model_type: str) -> ModelAdapter:
+        """Default adapter for a bare model path (legacy requests without an ai_models row)."""
+        provider, model_type = (provider or "FAL").upper(), (model_type or "IMAGE").upper()
+        return self._get(("path", model_path, provider, model_type), lambda: ModelAdapter(provider, model_type, model_path or ""))
+
+    def invalidate(self):
+        with self.lock:
+            self.adapters.clear()
+
+
+# Global instance
+model_adapters = ModelAdapterRegistry()
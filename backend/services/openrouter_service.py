@@ -1,33 +1,22 @@
-from openai import OpenAI
-import os
-import time
+import logging
 
 import httpx
 
+from utils.logger import get_logger
+from services.clients import clients
+from utils.data_uri import find_data_uri
+
 # Patch DNS for OpenRouter to bypass local proxy issues
 from services import dns_patch
 
-openrouter_key = os.getenv("OPENROUTER_API_KEY")
-
-
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=openrouter_key,
-    timeout=60.0, 
-    default_headers={
-        "HTTP-Referer": "http://localhost:3000", # Optional, for including your app on openrouter.ai rankings.
-        "X-Title": "Lovart Flow (Local Dev)", # Optional. Shows in rankings on openrouter.ai.
-    }
-) if openrouter_key else None
+logger = get_logger(__name__)
 
 def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_images=1):
-    with open("debug_gen.log", "a") as f:
-        f.write(f"[{time.strftime('%X')}] Service: generate_image called with model={model}, n={num_images}\n")
+    logger.debug("generate_image called", extra={"model": model, "num_images": num_images})
+    client = clients.get("openrouter_sync")
     if not client:
-        with open("debug_gen.log", "a") as f: f.write("ERROR: Client is None (Key missing)\n")
+        logger.error("OpenRouter client is None (key missing)")
         raise Exception("OpenRouter API key not configured")
-    
-    print(f"DEBUG: openrouter_service.generate_image called with model={model}")
 
     # Map aspect ratio to Flux-friendly resolutions (approx 1MP)
     # References: OpenRouter Flux docs / community benchmarks
@@ -44,7 +33,7 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
     
     size = size_map.get(aspect_ratio, "1024x1024")
 
-    print(f"DEBUG: OpenRouter Image Gen. Model: {model}, Size: {size}")
+    logger.debug("OpenRouter image generation", extra={"model": model, "size": size})
 
     # Method 1: Try Standard OpenAI Image API (often 405 for Flux on OpenRouter)
     try:
@@ -57,14 +46,13 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
         if extra_params:
              api_params["extra_body"] = extra_params
             
-        print(f"DEBUG: Calling Images API with params: {api_params}")
+        logger.debug("Calling Images API", extra={"params": api_params})
         response = client.images.generate(**api_params)
         
         if response.data:
              return response.data[0].url
     except Exception as img_err:
-        with open("debug_gen.log", "a") as f: f.write(f"DEBUG: Standard Image API failed: {img_err}\n")
-        print(f"DEBUG: Standard Image API failed ({img_err}), trying Chat API fallback...")
+        logger.info(f"Standard Image API failed ({img_err}), trying Chat API fallback")
         pass # Fall through to Chat method
 
     # Method 2: Fallback to Chat Completions (for Flux, etc.)
@@ -106,13 +94,12 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
 
         response = client.chat.completions.create(**chat_params)
         
-        # Truncate raw response logging to avoid massive base64 dumps
-        response_str = str(response)
-        if len(response_str) > 1000:
-            response_str = response_str[:1000] + "... [TRUNCATED]"
-        
-        with open("debug_gen.log", "a") as f: f.write(f"DEBUG: RAW CHAT RESPONSE (Truncated): {response_str}\n")
-        print(f"DEBUG: RAW RESPONSE (Truncated): {response_str}")
+        # Truncate raw response logging to avoid massive base64 dumps (and skip the str() entirely unless debugging)
+        if logger.isEnabledFor(logging.DEBUG):
+            response_str = str(response)
+            if len(response_str) > 1000:
+                response_str = response_str[:1000] + "... [TRUNCATED]"
+            logger.debug("Raw chat response (truncated)", extra={"response": response_str})
 
         content = response.choices[0].message.content
         msg_obj = response.choices[0].message
@@ -126,8 +113,7 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
              images = msg_obj.model_extra.get('images')
 
         if images:
-            with open("debug_gen.log", "a") as f:
-                f.write(f"DEBUG: Found images in response: Len: {len(images)}\n")
+            logger.debug("Found images in response", extra={"count": len(images)})
             
             if len(images) > 0:
                 img_item = images[0]
@@ -157,26 +143,26 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
                     # Log the URL type but not the full content if it is data URI
                     if url.startswith("data:"):
                          preview = url[:50] + "..."
-                         print(f"DEBUG: Found Data URI in response: {preview}")
-                         with open("debug_gen.log", "a") as f: f.write(f"DEBUG: Found Data URI: {preview}\n")
+                         logger.debug("Found data URI in response", extra={"preview": preview})
                     else:
-                         print(f"DEBUG: Found Image URL: {url}")
+                         logger.debug("Found image URL in response", extra={"url": url})
                     # CRITICAL: Return the URL immediately
                     return url
         
         if not content:
              raise Exception("No content in response")
              
-        print(f"DEBUG: OpenRouter Chat Response for Image: {content[:100]}...")
+        logger.debug("OpenRouter chat response for image", extra={"content": content[:100]})
         
         # Extract Image URL
-        # 1. Check for data URI first (base64 images)
+        # 1. Check for data URI first (base64 images); located by offsets so a content that is
+        # only the data URI is returned as-is instead of being regex-matched and copied
         import re
-        data_uri_match = re.search(r'data:image/[^;]+;base64,[A-Za-z0-9+/=]+', content)
-        if data_uri_match:
-            url = data_uri_match.group(0)
-            print(f"DEBUG: Found data URI in content: {url[:50]}...")
-            return url
+        data_uri = find_data_uri(content)
+        if data_uri and content.startswith("data:image/", data_uri[0]):
+            start, end = data_uri
+            logger.debug("Found data URI in content", extra={"preview": content[start:start + 50]})
+            return content if (start, end) == (0, len(content)) else content[start:end]
         
         # 2. Regex for markdown image: ![...](url)
         img_match = re.search(r'!\[.*?\]\((.*?)\)', content)
@@ -201,7 +187,7 @@ def generate_image(prompt, model, aspect_ratio="1:1", extra_params=None, num_ima
         raise Exception("Could not find image URL in chat response")
 
     except Exception as chat_err:
-        print(f"OpenRouter Image Gen Error (Both methods failed): {chat_err}")
+        logger.error(f"OpenRouter Image Gen Error (Both methods failed): {chat_err}")
         # Raise the original error if it was more relevant, or the chat error
         raise chat_err
 
@@ -211,11 +197,12 @@ def generate_video(prompt, model, duration="5s", aspect_ratio="16:9", extra_para
     Since there is no standard OpenAI Video API, we assume the model accepts a prompt via Chat Completions
     and returns a video URL or meaningful response.
     """
+    client = clients.get("openrouter_sync")
     if not client:
         raise Exception("OpenRouter API key not configured")
 
     try:
-        print(f"DEBUG: OpenRouter Video Generation (Experimental). Model: {model}")
+        logger.debug("OpenRouter video generation (experimental)", extra={"model": model})
         
         # Try sending as a chat completion (standard for Text-to-Video models on some gateways)
         response = client.chat.completions.create(
@@ -230,7 +217,7 @@ def generate_video(prompt, model, duration="5s", aspect_ratio="16:9", extra_para
         if not content:
             raise Exception("No content in response")
             
-        print(f"DEBUG: OpenRouter Response Content: {content[:100]}...")
+        logger.debug("OpenRouter response content", extra={"content": content[:100]})
         
         # Simple heuristic: Check if content looks like a URL
         if content.startswith("http") and ("mp4" in content or "mov" in content or "url" in content):
@@ -257,5 +244,5 @@ def generate_video(prompt, model, duration="5s", aspect_ratio="16:9", extra_para
         return content
 
     except Exception as e:
-        print(f"OpenRouter Video Gen Error: {e}")
+        logger.error(f"OpenRouter Video Gen Error: {e}")
         raise e
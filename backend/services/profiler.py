@@ -0,0 +1,354 @@
+"""
+Profiler
+Admin-only profiling hooks for a running worker (no restart, no py-spy on the host):
+- LoopWatchdog: a heartbeat task in the event loop plus a watchdog thread; when the loop
+  misses its heartbeat by LOOP_LAG_THRESHOLD_MS, the watchdog samples the loop thread's stack
+  until it recovers and records the blocking call site and the request (route template) it
+  ran for
+- sample_profile(): on-demand sampling profiler over this worker's threads for N seconds,
+  returned as top functions and collapsed stacks (flamegraph.pl / speedscope input)
+- ProfilingMiddleware: requests slower than SLOW_REQUEST_MS, or that blocked the loop, are
+  kept per route template with their stalls and trace id
+Every worker profiles itself; the admin endpoints report on the worker that serves them.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from services.metrics import event_loop_lag, event_loop_stalls
+from services.tracing import tracer
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+LOOP_HEARTBEAT_MS = float(os.getenv("LOOP_HEARTBEAT_MS", "50"))
+LOOP_STALL_BUFFER = int(os.getenv("LOOP_STALL_BUFFER", "200"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+SLOW_REQUESTS_PER_ROUTE = int(os.getenv("SLOW_REQUESTS_PER_ROUTE", "20"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STACK_DEPTH = 64
+SCOPE_STALLS_KEY = "profiler.stalls"
+# Innermost frames of threads that are only waiting (idle threadpool workers, idle event loop)
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock")}
+# The loop thread is only idle inside its selector; Event/Condition.wait or queue.get there
+# is a sync wait inside an async handler, i.e. exactly the stall we are looking for
+LOOP_IDLE_FRAMES = {("selectors.py", "select")}
+# Request middlewares wrap every handler; a call site inside them means "somewhere below"
+MIDDLEWARE_FILES = {os.path.join(BACKEND_DIR, "services", name) for name in ("profiler.py", "tracing.py", "metrics.py")}
+
+
+# --- Stack helpers ---
+
+def _short_path(path: str) -> str:
+    marker = path.rfind("site-packages" + os.sep)
+    if marker != -1:
+        return path[marker + len("site-packages") + 1:]
+    if path.startswith(BACKEND_DIR + os.sep):
+        return os.path.relpath(path, BACKEND_DIR)
+    return os.sep.join(path.split(os.sep)[-2:])
+
+
+def _is_app_code(path: str) -> bool:
+    return path.startswith(BACKEND_DIR + os.sep) and "site-packages" not in path and path not in MIDDLEWARE_FILES
+
+
+def _is_idle(frame, loop_thread: bool = False) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in (LOOP_IDLE_FRAMES if loop_thread else IDLE_FRAMES)
+
+
+def _frames(frame) -> list:
+    """Root-first list of frames, keeping the innermost MAX_STACK_DEPTH."""
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _line_label(frame) -> str:
+    return f"{frame.f_code.co_name} ({_short_path(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+
+def _function_label(frame) -> str:
+    # First line instead of the current line, so samples of one function aggregate
+    return f"{frame.f_code.co_name} ({_short_path(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})"
+
+
+def _request_scope(frames: list) -> Optional[dict]:
+    """ASGI scope of the request a stack is serving, taken from the outermost middleware frame."""
+    for frame in frames:
+        if "scope" in frame.f_code.co_varnames:
+            scope = frame.f_locals.get("scope")
+            if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+                return scope
+    return None
+
+
+def _route_label(scope: dict) -> str:
+    route = scope.get("route")
+    return f"{scope.get('method', 'WS')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+# --- Event loop watchdog ---
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float, heartbeat_ms: float, buffer_size: int):
+        self.threshold = threshold_ms / 1000
+        self.interval = heartbeat_ms / 1000
+        self.stalls = deque(maxlen=buffer_size)
+        self.total_stalls = 0
+        self.max_lag = 0.0
+        self.last_beat = 0.0
+        self.last_lag = 0.0
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = threading.Event()
+        # Stall in progress (owned by the watchdog thread)
+        self.current: Optional[dict] = None
+        self.current_samples: Counter = Counter()
+
+    def start(self):
+        """Start the heartbeat and the watchdog thread (call from the event loop)."""
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            self.last_beat = before
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - before - self.interval)
+            # last_lag is written before the next last_beat, so the watchdog reads a complete stall
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            event_loop_lag.observe(lag)
+
+    def _watch(self):
+        while not self.stopping.wait(max(self.interval / 2, 0.01)):
+            try:
+                blocked = time.monotonic() - self.last_beat - self.interval
+                if blocked >= self.threshold:
+                    self._sample(blocked)
+                elif self.current is not None:
+                    self._finish(self.last_lag)
+            except Exception as e:
+                logger.warning(f"Loop watchdog sample failed: {e}")
+
+    def _sample(self, blocked: float):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None or _is_idle(frame, loop_thread=True):
+            # Recovered between the check and the sample
+            return
+        frames = _frames(frame)
+        del frame
+        if self.current is None:
+            scope = _request_scope(frames)
+            self.current = {
+                "started_at": time.time() - blocked,
+                "route": _route_label(scope) if scope is not None else None,
+                "duration_ms": None,
+            }
+            if scope is not None:
+                # Read back by ProfilingMiddleware when the request completes
+                scope.setdefault(SCOPE_STALLS_KEY, []).append(self.current)
+        app_frames = [f for f in frames if _is_app_code(f.f_code.co_filename)]
+        call_site = _line_label(app_frames[-1]) if app_frames else _line_label(frames[-1])
+        self.current_samples[(call_site, tuple(_line_label(f) for f in frames))] += 1
+
+    def _finish(self, lag: float):
+        stall, samples = self.current, self.current_samples
+        self.current, self.current_samples = None, Counter()
+        sites = Counter()
+        for (site, _), hits in samples.items():
+            sites[site] += hits
+        (call_site, stack), _ = samples.most_common(1)[0]
+        stall.update({
+            "duration_ms": round(lag * 1000, 1),
+            "call_site": call_site,
+            "blocked_in": stack[-1],
+            "call_sites": [{"site": site, "samples": hits} for site, hits in sites.most_common(5)],
+            "stack": list(stack),
+        })
+        self.stalls.append(stall)
+        self.total_stalls += 1
+        event_loop_stalls.inc(route=stall["route"] or "none")
+        logger.warning(f"Event loop blocked for {stall['duration_ms']}ms at {call_site} ({stall['route'] or 'no request'})")
+
+    def report(self, limit: int = 50, route: Optional[str] = None) -> dict:
+        stalls = [s for s in reversed(self.stalls) if route is None or s["route"] == route]
+        return {
+            "running": self.task is not None,
+            "threshold_ms": self.threshold * 1000,
+            "heartbeat_ms": self.interval * 1000,
+            "total_stalls": self.total_stalls,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "blocked_now_ms": round(max(0.0, time.monotonic() - self.last_beat - self.interval) * 1000, 1) if self.task else None,
+            "stalls": stalls[:limit],
+        }
+
+
+# --- Slow requests ---
+
+class SlowRequestLog:
+    def __init__(self, threshold_ms: float, per_route: int):
+        self.threshold = threshold_ms / 1000
+        self.per_route = per_route
+        self.routes: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def record(self, route: str, status: int, duration: float, stalls: List[dict], trace_id: Optional[str]):
+        entry = {
+            "at": time.time(),
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "trace_id": trace_id,
+            # Shared with the watchdog; stalls still in progress get their call site when they end
+            "stalls": stalls,
+        }
+        with self.lock:
+            bucket = self.routes.get(route)
+            if bucket is None:
+                bucket = self.routes[route] = {"count": 0, "max_ms": 0.0, "requests": deque(maxlen=self.per_route)}
+            bucket["count"] += 1
+            bucket["max_ms"] = max(bucket["max_ms"], entry["duration_ms"])
+            bucket["requests"].append(entry)
+
+    def report(self, route: Optional[str] = None) -> dict:
+        with self.lock:
+            items = [(name, dict(bucket, requests=list(bucket["requests"]))) for name, bucket in self.routes.items()]
+        routes = []
+        for name, bucket in items:
+            if route is not None and name != route:
+                continue
+            sites = Counter()
+            for request in bucket["requests"]:
+                for stall in request["stalls"]:
+                    if stall.get("call_site"):
+                        sites[stall["call_site"]] += 1
+            routes.append({
+                "route": name,
+                "count": bucket["count"],
+                "max_ms": bucket["max_ms"],
+                "blocking_call_sites": [{"site": site, "stalls": n} for site, n in sites.most_common(10)],
+                "recent": list(reversed(bucket["requests"])),
+            })
+        routes.sort(key=lambda r: r["max_ms"], reverse=True)
+        return {"threshold_ms": self.threshold * 1000, "routes": routes}
+
+
+class ProfilingMiddleware:
+    """Raw ASGI middleware feeding SlowRequestLog (response time until the final body is sent)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "duration": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                state["duration"] = time.perf_counter() - start
+
+        trace_id = getattr(tracer.current(), "trace_id", None)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = state["duration"] if state["duration"] is not None else time.perf_counter() - start
+            # Stalls include BackgroundTasks that ran after the response for this request
+            stalls = scope.get(SCOPE_STALLS_KEY, [])
+            if duration >= slow_request_log.threshold or stalls:
+                slow_request_log.record(
+                    _route_label(scope), state["status"], duration, stalls,
+                    f"{trace_id:032x}" if trace_id is not None else None,
+                )
+
+
+# --- Sampling profiler ---
+
+_profile_lock = threading.Lock()
+
+
+def sample_profile(seconds: float, interval_ms: float = 5.0, loop_only: bool = False, include_idle: bool = False, top: int = 30) -> dict:
+    """
+    Sample the stacks of this worker's threads every interval_ms for `seconds`.
+    Blocks the calling thread: run it in the threadpool, never on the event loop.
+    Raises RuntimeError when another profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running in this worker")
+    try:
+        own_id = threading.get_ident()
+        loop_id = loop_watchdog.loop_thread_id
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        samples = idle = loop_samples = loop_busy = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (loop_only and thread_id != loop_id):
+                    continue
+                is_idle = _is_idle(frame, loop_thread=thread_id == loop_id)
+                if thread_id == loop_id:
+                    loop_samples += 1
+                    loop_busy += not is_idle
+                if is_idle and not include_idle:
+                    idle += 1
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                thread = "event-loop" if thread_id == loop_id else names.get(thread_id, str(thread_id))
+                stacks[(thread,) + tuple(_function_label(f) for f in _frames(frame))] += 1
+                samples += 1
+            del frame
+            time.sleep(interval_ms / 1000)
+    finally:
+        _profile_lock.release()
+
+    own_time, total_time = Counter(), Counter()
+    for stack, hits in stacks.items():
+        own_time[stack[-1]] += hits
+        for label in set(stack[1:]):
+            total_time[label] += hits
+    return {
+        "seconds": seconds,
+        "interval_ms": interval_ms,
+        "samples": samples,
+        "idle_samples": idle,
+        "loop_busy_ratio": round(loop_busy / loop_samples, 3) if loop_samples else None,
+        "top_self": [{"function": f, "samples": n, "ratio": round(n / samples, 3)} for f, n in own_time.most_common(top)],
+        "top_total": [{"function": f, "samples": n, "ratio": round(n / samples, 3)} for f, n in total_time.most_common(top)],
+        "folded": "\n".join(f"{';'.join(stack)} {hits}" for stack, hits in stacks.most_common()),
+    }
+
+
+# Global instance
+loop_watchdog = LoopWatchdog(LOOP_LAG_THRESHOLD_MS, LOOP_HEARTBEAT_MS, LOOP_STALL_BUFFER)
+slow_request_log = SlowRequestLog(SLOW_REQUEST_MS, SLOW_REQUESTS_PER_ROUTE)
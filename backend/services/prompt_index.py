@@ -0,0 +1,197 @@
+"""
+Prompt Gallery Index
+In-process index of active curated_prompts: (created_at, id) sort keys plus inverted
+category -> ids and tag -> ids maps. Gallery filtering, counting, keyset (cursor)
+pagination and the category list are answered from memory; only the rows of the
+requested page are fetched from Supabase.
+The index is updated in place by the admin prompt endpoints and fully reloaded after
+PROMPT_INDEX_TTL seconds (to pick up edits made directly in Supabase). A reload builds
+the new snapshot without holding the index lock and swaps it in, so queries and
+updates on the event loop never wait for Supabase.
+"""
+import base64
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.supabase_client import supabase
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROMPT_INDEX_TTL = int(os.getenv("PROMPT_INDEX_TTL", "600"))
+LOAD_PAGE_SIZE = 1000  # PostgREST max rows per request
+
+SortKey = Tuple[str, str]  # (created_at, id)
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, prompt_id = json.loads(base64.urlsafe_b64decode(padded))
+    return str(created_at), str(prompt_id)
+
+
+class PromptIndex:
+    def __init__(self, ttl_seconds: int = 600):
+        self.ttl_seconds = ttl_seconds
+        self.keys: Dict[str, SortKey] = {}  # id -> sort key
+        self.sorted_keys: List[SortKey] = []  # ascending
+        self.by_category: Dict[str, Set[str]] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        self.meta: Dict[str, Tuple[Optional[str], List[str]]] = {}  # id -> (category, tags)
+        self.loaded_at = 0.0
+        self.lock = threading.RLock()  # guards the structures; held only for in-memory work
+        self.reload_lock = threading.Lock()  # one reload at a time
+        self.pending: Optional[List[Tuple[str, object]]] = None  # updates made during a reload
+
+    # --- Loading ---
+
+    def _fetch_all_sync(self) -> List[dict]:
+        rows: List[dict] = []
+        last: Optional[SortKey] = None
+        while True:
+            query = supabase.table("curated_prompts").select("id, created_at, category, tags").eq("is_active", True)
+            if last:
+                query = query.or_(f'created_at.gt."{last[0]}",and(created_at.eq."{last[0]}",id.gt.{last[1]})')
+            page = query.order("created_at").order("id").limit(LOAD_PAGE_SIZE).execute().data
+            rows.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                return rows
+            last = (page[-1]["created_at"], page[-1]["id"])
+
+    def ensure_loaded(self):
+        """Reload if stale. Raises if the table can't be read and nothing is loaded yet."""
+        if time.time() - self.loaded_at < self.ttl_seconds:
+            return
+        with self.reload_lock:
+            if time.time() - self.loaded_at < self.ttl_seconds:
+                return
+            with self.lock:
+                self.pending = []
+            try:
+                rows = self._fetch_all_sync()
+            except Exception:
+                with self.lock:
+                    self.pending = None
+                if self.loaded_at:
+                    # Keep serving the previous snapshot
+                    logger.error("Prompt index reload failed, serving previous snapshot", exc_info=True)
+                    self.loaded_at = time.time()
+                    return
+                raise
+
+            snapshot = PromptIndex(self.ttl_seconds)
+            for row in rows:
+                snapshot._add(row, sort=False)
+            snapshot.sorted_keys.sort()
+
+            with self.lock:
+                self.keys, self.sorted_keys = snapshot.keys, snapshot.sorted_keys
+                self.by_category, self.by_tag, self.meta = snapshot.by_category, snapshot.by_tag, snapshot.meta
+                # Replay admin updates that raced with the fetch
+                pending, self.pending = self.pending, None
+                for action, value in pending:
+                    if action == "remove":
+                        self._remove(value)
+                    else:
+                        self._upsert(value)
+                self.loaded_at = time.time()
+            logger.info(f"Prompt index loaded: {len(self.keys)} prompts, {len(self.by_category)} categories")
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+    # --- Incremental updates (admin mutations) ---
+
+    def _add(self, row: dict, sort: bool = True):
+        prompt_id = str(row["id"])
+        key = (str(row["created_at"]), prompt_id)
+        category = row.get("category")
+        tags = row.get("tags") or []
+        self.keys[prompt_id] = key
+        self.meta[prompt_id] = (category, tags)
+        if sort:
+            bisect.insort(self.sorted_keys, key)
+        else:
+            self.sorted_keys.append(key)
+        if category:
+            self.by_category.setdefault(category, set()).add(prompt_id)
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(prompt_id)
+
+    def _remove(self, prompt_id: str):
+        key = self.keys.pop(prompt_id, None)
+        if key is None:
+            return
+        at = bisect.bisect_left(self.sorted_keys, key)
+        if at < len(self.sorted_keys) and self.sorted_keys[at] == key:
+            del self.sorted_keys[at]
+        category, tags = self.meta.pop(prompt_id)
+        for index, name in [(self.by_category, category)] + [(self.by_tag, tag) for tag in tags]:
+            ids = index.get(name)
+            if ids is not None:
+                ids.discard(prompt_id)
+                if not ids:
+                    del index[name]
+
+    def _upsert(self, row: dict):
+        self._remove(str(row["id"]))
+        if row.get("is_active", True):
+            self._add(row)
+
+    def remove(self, prompt_id: str):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(("remove", prompt_id))
+            self._remove(prompt_id)
+
+    def upsert(self, row: dict):
+        """Apply a created/updated curated_prompts row (full row as returned by Supabase)."""
+        if not self.loaded_at:
+            return
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(("upsert", row))
+            self._upsert(row)
+
+    # --- Queries ---
+
+    def categories(self) -> List[str]:
+        return sorted(self.by_category)
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        tag: Optional[str] = None,
+        cursor: Optional[SortKey] = None,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Tuple[List[str], int, Optional[str]]:
+        """Return (page ids newest first, total matches, next cursor)."""
+        with self.lock:
+            if category or tag:
+                ids: Optional[Set[str]] = None
+                for index, name in ((self.by_category, category), (self.by_tag, tag)):
+                    if name:
+                        matches = index.get(name, set())
+                        ids = matches if ids is None else ids & matches
+                ordered = sorted(self.keys[i] for i in ids)
+            else:
+                ordered = self.sorted_keys
+
+            end = bisect.bisect_left(ordered, cursor) if cursor else max(len(ordered) - offset, 0)
+            start = max(end - limit, 0)
+            page = ordered[start:end][::-1]
+            next_cursor = encode_cursor(page[-1]) if page and start > 0 else None
+            return [key[1] for key in page], len(ordered), next_cursor
+
+
+# Global instance
+prompt_index = PromptIndex(ttl_seconds=PROMPT_INDEX_TTL)
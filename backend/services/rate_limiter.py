@@ -0,0 +1,331 @@
+"""
+Rate Limiter
+ASGI middleware with token buckets keyed by (route, user). Requests over the limit get
+a 429 straight from the middleware, before routing, auth or any Supabase call.
+
+- Identity: "sub" of a Supabase JWT whose signature checks out against SUPABASE_JWT_SECRET,
+  else the client IP. X-Real-IP / X-Forwarded-For are only honoured when the connection
+  comes from a proxy listed in RATE_LIMIT_TRUSTED_PROXIES; anyone reaching port 8000
+  directly is keyed on their socket address. Client-supplied ids are never trusted,
+  so made-up ids or headers can't mint fresh buckets.
+- Limits per route prefix and plan tier come from the "rate_limits" key in
+  system_settings, merged over DEFAULT_RATE_LIMITS and refreshed in the background.
+- Buckets live in memory per worker, or in a local SQLite file shared by all workers
+  on the host (RATE_LIMIT_BACKEND=sqlite; its calls run in the threadpool).
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.generation_scheduler import peek_user_tier, warm_user_tier
+from services.config_cache import config_cache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+RATE_LIMIT_SETTING_KEY = "rate_limits"
+CONFIG_TTL = int(os.getenv("RATE_LIMIT_CONFIG_TTL", "60"))
+# Secret Supabase signs its (HS256) access tokens with; without it every caller is limited by IP
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+# Addresses/CIDRs of the reverse proxies (nginx, the Next.js rewrite) allowed to set the client IP.
+# Behind Docker's published port nginx shows up as the bridge gateway, e.g. "127.0.0.1,172.17.0.1".
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1").split(",")
+    if entry.strip()
+]
+
+# per_minute: sustained rate, burst: bucket size. Routes not listed are not limited.
+DEFAULT_RATE_LIMITS = {
+    "enabled": True,
+    "routes": {
+        "/api/chat": {"per_minute": 20, "burst": 10},
+        "/api/generate": {"per_minute": 20, "burst": 10},
+        "/api/upload": {"per_minute": 30, "burst": 15},
+    },
+    # Multiplier applied to per_minute and burst, by plan tier_level
+    "tier_multipliers": {"0": 1, "1": 2, "2": 3, "3": 4, "4": 5},
+}
+
+# ============================================
+# Bucket stores
+# ============================================
+
+class MemoryBucketStore:
+    blocking = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.buckets: Dict[str, list] = {}  # key -> [tokens, updated_at]
+        self.max_keys = max_keys
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> Tuple[bool, float]:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = [burst, now]
+            self.buckets[key] = bucket
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return True, 0.0
+        bucket[0] = tokens
+        return False, (1 - tokens) / rate
+
+    def _prune(self, now: float):
+        # Buckets idle for 10 minutes are (at these rates) full again, so dropping them changes nothing
+        for key in [k for k, (_, updated) in self.buckets.items() if now - updated > 600]:
+            del self.buckets[key]
+        if len(self.buckets) >= self.max_keys:
+            self.buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Buckets in a local SQLite file so all uvicorn workers on one host share them."""
+    blocking = True  # file locks can wait up to the 1s timeout - called via the threadpool
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+        )
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> Tuple[bool, float]:
+        with self.lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self.writes += 1
+                if self.writes % 10000 == 0:
+                    self.conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - 600,))
+                self.conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                # Fail open: a locked/broken file must not take the API down
+                logger.warning(f"Rate limit store error: {e}")
+                try:
+                    self.conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                return True, 0.0
+        return (True, 0.0) if allowed else (False, (1 - tokens) / rate)
+
+
+# ============================================
+# Limiter
+# ============================================
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+        self.config = DEFAULT_RATE_LIMITS
+        self.route_prefixes = self._sorted_prefixes(self.config)
+        self.config_loaded_at = 0.0
+        self.refreshing = False
+        self.allowed = 0
+        self.limited = 0
+
+    @staticmethod
+    def _sorted_prefixes(config: dict):
+        return sorted(config.get("routes", {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _load_config_sync(self) -> dict:
+        config = {**DEFAULT_RATE_LIMITS, "routes": dict(DEFAULT_RATE_LIMITS["routes"])}
+        override = config_cache.get_setting(RATE_LIMIT_SETTING_KEY) or {}
+        if override:
+            for key, value in override.items():
+                if key == "routes":
+                    config["routes"].update(value or {})
+                else:
+                    config[key] = value
+        return config
+
+    async def _refresh_config(self):
+        try:
+            config = await run_in_threadpool(self._load_config_sync)
+            self.config = config
+            self.route_prefixes = self._sorted_prefixes(config)
+        except Exception as e:
+            logger.error(f"Rate limit config refresh failed: {e}", exc_info=True)
+        finally:
+            self.config_loaded_at = time.time()
+            self.refreshing = False
+
+    def maybe_refresh_config(self):
+        """Reload system_settings in the background; requests keep using the current config."""
+        if not self.refreshing and time.time() - self.config_loaded_at > CONFIG_TTL:
+            self.refreshing = True
+            asyncio.create_task(self._refresh_config())
+
+    def invalidate_config(self):
+        self.config_loaded_at = 0.0
+
+    def match_route(self, path: str) -> Optional[Tuple[str, dict]]:
+        for prefix, rule in self.route_prefixes:
+            if path.startswith(prefix):
+                return prefix, rule
+        return None
+
+    async def check(self, prefix: str, rule: dict, identity: str, tier_level: int) -> Tuple[bool, float]:
+        multiplier = float(self.config.get("tier_multipliers", {}).get(str(tier_level), 1))
+        rate = float(rule.get("per_minute", 60)) * multiplier / 60.0
+        burst = max(float(rule.get("burst", 10)) * multiplier, 1.0)
+        key = f"{prefix}|{identity}"
+        if self.store.blocking:
+            allowed, retry_after = await run_in_threadpool(self.store.take, key, rate, burst, time.time())
+        else:
+            allowed, retry_after = self.store.take(key, rate, burst, time.time())
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return allowed, retry_after
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited}
+
+
+def _create_store():
+    if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteBucketStore(os.getenv("RATE_LIMIT_SQLITE_PATH", "/tmp/lovart_rate_limits.db"))
+    return MemoryBucketStore()
+
+
+# Global instance
+rate_limiter = RateLimiter(_create_store())
+
+
+# ============================================
+# ASGI middleware
+# ============================================
+
+def _b64decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+
+def _jwt_subject(authorization: bytes) -> Optional[str]:
+    """User id from a Supabase JWT, only if its HS256 signature is valid and it hasn't expired."""
+    if not JWT_SECRET:
+        return None
+    try:
+        token = authorization.split(b" ", 1)[1].strip()
+        header, payload, signature = token.split(b".")
+        if json.loads(_b64decode(header)).get("alg") != "HS256":
+            return None
+        expected = hmac.new(JWT_SECRET.encode(), header + b"." + payload, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        if claims.get("exp") is not None and float(claims["exp"]) < time.time():
+            return None
+        subject = claims.get("sub")
+        return subject if isinstance(subject, str) and subject else None
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def _client_ip(scope, headers: Dict[bytes, bytes]) -> str:
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+    # nginx sets X-Real-IP to $remote_addr
+    real_ip = headers.get(b"x-real-ip")
+    if real_ip:
+        return real_ip.strip().decode("latin-1")
+    # Otherwise the nearest X-Forwarded-For hop that isn't one of our proxies;
+    # entries further left are client-controlled
+    forwarded = headers.get(b"x-forwarded-for")
+    if forwarded:
+        hops = [hop.strip().decode("latin-1") for hop in forwarded.split(b",") if hop.strip()]
+        for hop in reversed(hops):
+            if not _is_trusted_proxy(hop):
+                return hop
+    return peer
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        limiter = self.limiter
+        limiter.maybe_refresh_config()
+        if not limiter.config.get("enabled", True):
+            return await self.app(scope, receive, send)
+        matched = limiter.match_route(scope["path"])
+        if matched is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        user_id = None
+        if headers.get(b"authorization", b"").startswith(b"Bearer "):
+            user_id = _jwt_subject(headers[b"authorization"])
+
+        if user_id:
+            identity = f"user:{user_id}"
+            tier = peek_user_tier(user_id)
+        else:
+            identity = f"ip:{_client_ip(scope, headers)}"
+            tier = 0
+
+        prefix, rule = matched
+        allowed, retry_after = await limiter.check(prefix, rule, identity, tier or 0)
+        if not allowed:
+            return await _send_429(send, retry_after)
+
+        if user_id and tier is None:
+            # Warm the tier cache off the request path; later requests get their plan's limits.
+            # Only verified ids get here, so the lookups are bounded by real accounts.
+            warm_user_tier(user_id)
+        await self.app(scope, receive, send)
+
+
+async def _send_429(send, retry_after: float):
+    body = b'{"detail":"Too many requests. Please slow down."}'
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(int(retry_after + 0.999), 1)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,178 @@
+"""
+Prompt Refinement Cache
+Caches /chat/refine results so repeated or near-identical prompts (e.g. gallery prompts)
+are answered from memory instead of another LLM round-trip.
+
+Lookup order:
+1. Exact match on the raw prompt
+2. Normalized text (case, whitespace and punctuation insensitive)
+3. Optional character-trigram similarity index (Jaccard >= threshold) for near-duplicates
+Entries are bounded by size (LRU eviction) and TTL.
+"""
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, str]  # (model, normalized prompt)
+
+
+def normalize_prompt(prompt: str) -> str:
+    text = _PUNCTUATION.sub(" ", prompt.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RefineCacheEntry:
+    __slots__ = ("refined", "created_at", "raw_prompts", "grams")
+
+    def __init__(self, refined: str, created_at: float, grams: Set[str]):
+        self.refined = refined
+        self.created_at = created_at
+        self.raw_prompts: Set[str] = set()
+        self.grams = grams
+
+
+class RefineCache:
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        ttl_seconds: int = 86400,
+        similarity_threshold: float = 0.9,
+        enable_similarity: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.enable_similarity = enable_similarity
+
+        self.entries: "OrderedDict[CacheKey, RefineCacheEntry]" = OrderedDict()
+        self.exact: Dict[Tuple[str, str], CacheKey] = {}  # (model, raw prompt) -> key
+        self.gram_index: Dict[Tuple[str, str], Set[CacheKey]] = {}  # (model, trigram) -> keys
+
+        self.hits = {"exact": 0, "normalized": 0, "similar": 0}
+        self.misses = 0
+
+    def _is_fresh(self, entry: RefineCacheEntry, now: float) -> bool:
+        return now - entry.created_at < self.ttl_seconds
+
+    def _remove(self, key: CacheKey):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        model = key[0]
+        for raw in entry.raw_prompts:
+            self.exact.pop((model, raw), None)
+        for gram in entry.grams:
+            postings = self.gram_index.get((model, gram))
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self.gram_index[(model, gram)]
+
+    def _hit(self, key: CacheKey, kind: str) -> str:
+        self.entries.move_to_end(key)
+        self.hits[kind] += 1
+        return self.entries[key].refined
+
+    def _find_similar(self, model: str, normalized: str, now: float) -> Optional[CacheKey]:
+        grams = trigrams(normalized)
+        if not grams:
+            return None
+
+        # Prefix filter: any entry with Jaccard >= threshold must share at least one of
+        # the query's rarest (|A| - ceil(t * |A|) + 1) trigrams, so only those postings are scanned.
+        prefix_size = len(grams) - math.ceil(self.similarity_threshold * len(grams)) + 1
+        ranked = sorted(grams, key=lambda g: len(self.gram_index.get((model, g), ())))
+        candidates: Set[CacheKey] = set()
+        for gram in ranked[:prefix_size]:
+            candidates.update(self.gram_index.get((model, gram), ()))
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            entry = self.entries.get(key)
+            if not entry or not self._is_fresh(entry, now):
+                continue
+            overlap = len(grams & entry.grams)
+            score = overlap / (len(grams) + len(entry.grams) - overlap)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key and best_score >= self.similarity_threshold:
+            return best_key
+        return None
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        now = time.time()
+
+        # 1. Exact raw prompt
+        key = self.exact.get((model, prompt))
+        if key:
+            entry = self.entries.get(key)
+            if entry and self._is_fresh(entry, now):
+                return self._hit(key, "exact")
+            self._remove(key)
+
+        # 2. Normalized text
+        normalized = normalize_prompt(prompt)
+        key = (model, normalized)
+        entry = self.entries.get(key)
+        if entry:
+            if self._is_fresh(entry, now):
+                return self._hit(key, "normalized")
+            self._remove(key)
+
+        # 3. Near-duplicate via trigram index
+        if self.enable_similarity:
+            key = self._find_similar(model, normalized, now)
+            if key:
+                return self._hit(key, "similar")
+
+        self.misses += 1
+        return None
+
+    def set(self, model: str, prompt: str, refined: str):
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return
+        key = (model, normalized)
+        now = time.time()
+
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = RefineCacheEntry(refined, now, trigrams(normalized) if self.enable_similarity else set())
+            self.entries[key] = entry
+            for gram in entry.grams:
+                self.gram_index.setdefault((model, gram), set()).add(key)
+        else:
+            entry.refined = refined
+            entry.created_at = now
+            self.entries.move_to_end(key)
+
+        entry.raw_prompts.add(prompt)
+        self.exact[(model, prompt)] = key
+
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "misses": self.misses, **{f"hits_{k}": v for k, v in self.hits.items()}}
+
+
+# Global instance
+refine_cache = RefineCache(
+    max_entries=int(os.getenv("REFINE_CACHE_MAX_ENTRIES", "5000")),
+    ttl_seconds=int(os.getenv("REFINE_CACHE_TTL", "86400")),
+    similarity_threshold=float(os.getenv("REFINE_CACHE_SIMILARITY", "0.9")),
+    enable_similarity=os.getenv("REFINE_CACHE_SIMILARITY_ENABLED", "true").lower() == "true",
+)
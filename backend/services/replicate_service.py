@@ -1,13 +1,11 @@
-import replicate
 import os
 from fastapi import HTTPException
+from services.clients import clients
 
 # Ensure REPLICATE_API_TOKEN is set
 if not os.getenv("REPLICATE_API_TOKEN"):
     print("Warning: REPLICATE_API_TOKEN not set in environment variables")
 
-# Initialize Replicate client
-replicate_client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
 
 def generate_with_replicate(
     model_path: str,
@@ -56,7 +54,7 @@ def generate_with_replicate(
         print(f"Input parameters: {input_params}")
         
         # Run the model
-        output = replicate_client.run(
+        output = clients.get("replicate").run(
             model_path,
             input=input_params
         )
@@ -91,7 +89,7 @@ def upscale_image(image_url: str, scale: int = 2) -> str:
     try:
         print(f"[Replicate] Upscaling image: {image_url}")
         
-        output = replicate_client.run(
+        output = clients.get("replicate").run(
             "nightmareai/real-esrgan:42fed1c4974146d4d2414e2be2c5277c7fcf05fcc3a73ab41b2ee43ad4095a1c",
             input={
                 "image": image_url,
@@ -114,7 +112,7 @@ def remove_background(image_url: str) -> str:
     try:
         print(f"[Replicate] Removing background: {image_url}")
         
-        output = replicate_client.run(
+        output = clients.get("replicate").run(
             "cjwbw/rembg:fb8af171cfa1616ddcf1242c093f9c46bcada5ad4cf6f2fbe8b81b330ec5c003",
             input={
                 "image": image_url
@@ -0,0 +1,468 @@
+"""
+Search Index
+In-process full-text search over curated_prompts (title, prompt, tags) and public
+generations (prompt), ranked with BM25.
+
+Layout (kept compact so ~1M documents fit in a few hundred MB):
+- postings: term -> array('I') of (internal doc id << 4 | min(tf, 15)), ascending by doc id
+- per-document arrays for length / kind and a packed 16-byte UUID store
+- a sorted vocabulary for prefix lookups (autocomplete and search-as-you-type)
+Updates append a new internal doc and tombstone the old one; document frequencies
+include tombstones until the next periodic rebuild, which compacts everything.
+
+Query evaluation is term-at-a-time, rarest term first. Frequent terms are not scanned
+in full: they contribute candidates from a cached champion list (their highest-impact
+postings) and are applied to candidates via binary search. If the resulting upper bound
+for unseen documents can't rule them out of the top-k, the query is rescored exhaustively.
+"""
+import asyncio
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.supabase_client import supabase
+from utils.logger import logger
+
+SEARCH_SYNC_INTERVAL = int(os.getenv("SEARCH_SYNC_INTERVAL", "60"))
+SEARCH_REBUILD_INTERVAL = int(os.getenv("SEARCH_REBUILD_INTERVAL", "21600"))
+SEARCH_SYNC_LOOKBACK = int(os.getenv("SEARCH_SYNC_LOOKBACK", "3600"))
+LOAD_PAGE_SIZE = 1000
+
+KIND_PROMPT = 0
+KIND_GENERATION = 1
+KIND_DELETED = 255
+KIND_NAMES = {KIND_PROMPT: "prompt", KIND_GENERATION: "generation"}
+
+TF_BITS = 4
+TF_MASK = (1 << TF_BITS) - 1
+PREFIX_EXPANSIONS = 8
+SUGGEST_SCAN_LIMIT = 5000
+CHAMPION_MIN_DF = 5000  # terms at least this frequent are not scanned in full when avoidable
+CHAMPION_SIZE = 512
+
+_CJK = "㐀-䶿一-鿿"
+_TOKEN = re.compile(rf"[{_CJK}]+|[^\W{_CJK}_]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "the", "to", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words (minus stopwords); CJK runs become overlapping character bigrams."""
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        word = match.group()
+        if "㐀" <= word[0] <= "鿿":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif word not in _STOPWORDS and len(word) <= 40:
+            tokens.append(word)
+    return tokens
+
+
+class InvertedIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, array] = {}
+        self.vocab: List[str] = []
+        self.vocab_sorted = True
+        self.vocab_lock = threading.Lock()
+
+        self.doc_len = array("H")
+        self.doc_kind = bytearray()
+        self.doc_uuid = bytearray()  # 16 bytes per internal doc id
+        self.doc_ids: Dict[bytes, int] = {}  # kind byte + uuid bytes -> internal doc id
+
+        self.total_len = 0
+        self.live_docs = 0
+        self.max_len = 0
+        self._norm_avgdl = 0.0
+        self._norm: List[float] = []
+        self._norm_version = 0
+        self._champion_cache: Dict[str, list] = {}
+        self._champion_lock = threading.Lock()
+
+    # --- Mutation ---
+
+    @staticmethod
+    def _key(kind: int, doc_id: str) -> Optional[bytes]:
+        try:
+            return bytes((kind,)) + uuid.UUID(str(doc_id)).bytes
+        except ValueError:
+            return None
+
+    def add(self, kind: int, doc_id: str, text: str):
+        """Index (or re-index) a document."""
+        key = self._key(kind, doc_id)
+        if key is None:
+            return
+        if key in self.doc_ids:
+            self.remove(kind, doc_id)
+        tokens = tokenize(text)
+        if not tokens:
+            return
+
+        internal_id = len(self.doc_len)
+        for term, tf in Counter(tokens).items():
+            plist = self.postings.get(term)
+            if plist is None:
+                plist = self.postings[term] = array("I")
+                with self.vocab_lock:
+                    self.vocab.append(term)
+                    self.vocab_sorted = False
+            plist.append(internal_id << TF_BITS | min(tf, TF_MASK))
+
+        length = min(len(tokens), 65535)
+        self.doc_len.append(length)
+        self.doc_kind.append(kind)
+        self.doc_uuid += key[1:]
+        self.doc_ids[key] = internal_id
+        self.total_len += length
+        self.live_docs += 1
+        self.max_len = max(self.max_len, length)
+
+    def remove(self, kind: int, doc_id: str):
+        key = self._key(kind, doc_id)
+        internal_id = self.doc_ids.pop(key, None) if key else None
+        if internal_id is None:
+            return
+        self.doc_kind[internal_id] = KIND_DELETED
+        self.total_len -= self.doc_len[internal_id]
+        self.live_docs -= 1
+
+    def __contains__(self, item: Tuple[int, str]) -> bool:
+        key = self._key(*item)
+        return key is not None and key in self.doc_ids
+
+    # --- Vocabulary / prefixes ---
+
+    def _sorted_vocab(self) -> List[str]:
+        with self.vocab_lock:
+            if not self.vocab_sorted:
+                self.vocab.sort()  # Nearly sorted after incremental appends, so this is ~linear
+                self.vocab_sorted = True
+            return self.vocab
+
+    def prefix_terms(self, prefix: str, limit: int) -> List[str]:
+        """Most frequent indexed terms starting with prefix."""
+        vocab = self._sorted_vocab()
+        start = bisect.bisect_left(vocab, prefix)
+        candidates = []
+        for term in vocab[start:start + SUGGEST_SCAN_LIMIT]:
+            if not term.startswith(prefix):
+                break
+            candidates.append(term)
+        return heapq.nlargest(limit, candidates, key=lambda t: len(self.postings[t]))
+
+    # --- Query ---
+
+    def _norms(self) -> List[float]:
+        """k1 * (1 - b + b * len / avgdl) for every possible doc length, rebuilt when avgdl drifts."""
+        avgdl = self.total_len / self.live_docs if self.live_docs else 1.0
+        if len(self._norm) <= self.max_len or abs(avgdl - self._norm_avgdl) > 0.01 * self._norm_avgdl:
+            k1, b = self.k1, self.b
+            self._norm = [k1 * (1 - b + b * length / avgdl) for length in range(max(self.max_len, 1024) + 1)]
+            self._norm_avgdl = avgdl
+            self._norm_version += 1
+        return self._norm
+
+    def _champions(self, term: str, plist: array, norm: List[float]) -> Tuple[Dict[int, float], float]:
+        """
+        Champion list of a frequent term: its CHAMPION_SIZE highest-impact postings as
+        {doc: tf / (tf + norm)} plus an upper bound of the impact of every other posting.
+        Cached per term; postings appended since the last call are promoted if they beat the bound.
+        """
+        with self._champion_lock:
+            entry = self._champion_cache.get(term)
+            if entry is None or entry[0] != self._norm_version:
+                doc_len = self.doc_len
+                best = heapq.nlargest(CHAMPION_SIZE, (
+                    ((p & TF_MASK) / ((p & TF_MASK) + norm[doc_len[p >> TF_BITS]]), p >> TF_BITS) for p in plist
+                ))
+                entry = [self._norm_version, len(plist), {d: impact for impact, d in best}, best[-1][0]]
+                self._champion_cache[term] = entry
+            elif entry[1] < len(plist):
+                doc_len, champions, bound = self.doc_len, entry[2], entry[3]
+                for p in plist[entry[1]:]:
+                    tf = p & TF_MASK
+                    impact = tf / (tf + norm[doc_len[p >> TF_BITS]])
+                    if impact > bound:
+                        champions[p >> TF_BITS] = impact
+                entry[1] = len(plist)
+            return dict(entry[2]), entry[3]
+
+    def _top(self, scores: Dict[int, float], limit: int, kinds: bytes) -> List[Tuple[float, int]]:
+        doc_kind = self.doc_kind
+        return heapq.nlargest(limit, ((s, d) for d, s in scores.items() if doc_kind[d] in kinds))
+
+    def _score(self, weighted: list, limit: int, kinds: bytes, shortcuts: bool) -> Tuple[Dict[int, float], float]:
+        """
+        Accumulate BM25 scores term-at-a-time, rarest term first. Returns the scores and an
+        upper bound of the score of any document missing from them.
+        With shortcuts, frequent terms are not scanned in full: once no unseen document can
+        reach the current top-k they only rescore candidates, otherwise their champion list
+        supplies the new candidates. Either way they are applied via binary search at the end.
+        """
+        norm = self._norms()
+        doc_len = self.doc_len
+        scores: Dict[int, float] = {}
+        deferred = []  # (weight, postings, known impacts)
+        unseen_bound = 0.0
+        remaining_bound = sum(w for _, w, _, _ in weighted)
+
+        for size, w, plist, term in weighted:
+            if shortcuts and scores and size > 3 * len(scores) and remaining_bound < (
+                (self._top(scores, limit, kinds) or [(0.0, 0)])[-1][0]
+            ):
+                deferred.append((w, plist, {}))
+                unseen_bound += w
+            elif shortcuts and size >= CHAMPION_MIN_DF:
+                champions, bound = self._champions(term, plist, norm)
+                for d in champions:
+                    scores.setdefault(d, 0.0)
+                deferred.append((w, plist, champions))
+                unseen_bound += w * bound
+            else:
+                get = scores.get
+                for posting in plist:
+                    d = posting >> TF_BITS
+                    tf = posting & TF_MASK
+                    scores[d] = get(d, 0.0) + w * tf / (tf + norm[doc_len[d]])
+            remaining_bound -= w
+
+        for w, plist, known in deferred:
+            size = len(plist)
+            for d in scores:
+                impact = known.get(d)
+                if impact is None:
+                    at = bisect.bisect_left(plist, d << TF_BITS)
+                    if at == size or plist[at] >> TF_BITS != d:
+                        continue
+                    tf = plist[at] & TF_MASK
+                    impact = tf / (tf + norm[doc_len[d]])
+                scores[d] += w * impact
+        return scores, unseen_bound
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        kinds: Iterable[int] = (KIND_PROMPT, KIND_GENERATION),
+        prefix: bool = True,
+    ) -> List[Tuple[int, str, float]]:
+        """Return [(kind, doc_id, score)] best first. With prefix=True the last word also matches as a prefix."""
+        kinds = bytes(kinds)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.live_docs:
+            return []
+        if prefix and not ("㐀" <= terms[-1][0] <= "鿿"):
+            terms = list(dict.fromkeys(terms + self.prefix_terms(terms[-1], PREFIX_EXPANSIONS)))
+
+        n = self.live_docs
+        k1p1 = self.k1 + 1
+        weighted = []
+        for term in terms:
+            plist = self.postings.get(term)
+            if plist:
+                df = len(plist)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                weighted.append((df, idf * k1p1, plist, term))
+        if not weighted:
+            return []
+        weighted.sort(key=lambda item: item[0])
+
+        scores, unseen_bound = self._score(weighted, limit, kinds, shortcuts=True)
+        top = self._top(scores, limit, kinds)
+        if unseen_bound and (len(top) < limit or top[-1][0] < unseen_bound):
+            # The shortcuts could have missed a better document: score exhaustively
+            scores, _ = self._score(weighted, limit, kinds, shortcuts=False)
+            top = self._top(scores, limit, kinds)
+
+        doc_kind, doc_uuid = self.doc_kind, self.doc_uuid
+        return [
+            (doc_kind[d], str(uuid.UUID(bytes=bytes(doc_uuid[d * 16:d * 16 + 16]))), s)
+            for s, d in top
+        ]
+
+    def stats(self) -> dict:
+        postings = sum(len(p) for p in self.postings.values())
+        return {
+            "documents": self.live_docs,
+            "tombstones": len(self.doc_len) - self.live_docs,
+            "terms": len(self.postings),
+            "postings": postings,
+            "postings_bytes": postings * 4,
+        }
+
+
+class SearchService:
+    """Owns the live index: initial load, incremental hooks, periodic sync and rebuild."""
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.ready = False
+        self.replay: Optional[List[tuple]] = None  # mutations received while a rebuild is running
+        self.rebuilt_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    # --- Document text ---
+
+    @staticmethod
+    def prompt_text(row: dict) -> str:
+        return " ".join([row.get("title") or "", row.get("prompt") or "", " ".join(row.get("tags") or [])])
+
+    # --- Incremental hooks ---
+
+    def _apply(self, op: tuple):
+        if op[0] == "add":
+            self.index.add(op[1], op[2], op[3])
+        else:
+            self.index.remove(op[1], op[2])
+        if self.replay is not None:
+            self.replay.append(op)
+
+    def upsert_prompt(self, row: dict):
+        if row.get("is_active", True):
+            self._apply(("add", KIND_PROMPT, str(row["id"]), self.prompt_text(row)))
+        else:
+            self.remove_prompt(str(row["id"]))
+
+    def remove_prompt(self, prompt_id: str):
+        self._apply(("remove", KIND_PROMPT, prompt_id))
+
+    def add_generation(self, generation_id: str, prompt: str):
+        self._apply(("add", KIND_GENERATION, generation_id, prompt or ""))
+
+    def remove_generation(self, generation_id: str):
+        self._apply(("remove", KIND_GENERATION, generation_id))
+
+    def _public_generation_sync(self, generation_id: str) -> Optional[dict]:
+        query = self._public_generations(supabase.table("generations").select("id, prompt"))
+        rows = query.eq("id", generation_id).limit(1).execute().data
+        return rows[0] if rows else None
+
+    async def refresh_generation(self, generation_id: str):
+        """(Re)index a generation if the rebuild would include it (completed, not deleted or NSFW), else drop it."""
+        row = await run_in_threadpool(self._public_generation_sync, generation_id)
+        if row:
+            self.add_generation(generation_id, row.get("prompt") or "")
+        else:
+            self.remove_generation(generation_id)
+
+    # --- Loading ---
+
+    @staticmethod
+    def _keyset_pages(table: str, columns: str, apply_filters, since: Optional[str] = None):
+        last = None
+        while True:
+            query = apply_filters(supabase.table(table).select(columns))
+            if since:
+                query = query.gte("created_at", since)
+            if last:
+                query = query.or_(f'created_at.gt."{last[0]}",and(created_at.eq."{last[0]}",id.gt.{last[1]})')
+            page = query.order("created_at").order("id").limit(LOAD_PAGE_SIZE).execute().data
+            if page:
+                yield page
+            if len(page) < LOAD_PAGE_SIZE:
+                return
+            last = (page[-1]["created_at"], page[-1]["id"])
+
+    @staticmethod
+    def _public_generations(query):
+        return query.eq("status", "COMPLETED").eq("is_deleted", False).eq("is_nsfw", False).not_.is_("slug", "null")
+
+    def _build_sync(self) -> InvertedIndex:
+        index = InvertedIndex()
+        for page in self._keyset_pages(
+            "curated_prompts", "id, created_at, title, prompt, tags", lambda q: q.eq("is_active", True)
+        ):
+            for row in page:
+                index.add(KIND_PROMPT, row["id"], self.prompt_text(row))
+        for page in self._keyset_pages("generations", "id, created_at, prompt", self._public_generations):
+            for row in page:
+                index.add(KIND_GENERATION, row["id"], row.get("prompt") or "")
+        index._sorted_vocab()
+        return index
+
+    async def rebuild(self):
+        start = time.time()
+        self.replay = []
+        try:
+            index = await run_in_threadpool(self._build_sync)
+        except Exception as e:
+            logger.error(f"Search index rebuild failed: {e}")
+            return
+        finally:
+            replay, self.replay = self.replay, None
+        for op in replay:
+            if op[0] == "add":
+                index.add(op[1], op[2], op[3])
+            else:
+                index.remove(op[1], op[2])
+        self.index = index
+        self.ready = True
+        self.rebuilt_at = time.time()
+        logger.info(f"Search index rebuilt in {time.time() - start:.1f}s: {index.stats()}")
+
+    def _recent_generations_sync(self) -> List[dict]:
+        since = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() - SEARCH_SYNC_LOOKBACK))
+        rows = []
+        for page in self._keyset_pages("generations", "id, created_at, prompt", self._public_generations, since):
+            rows.extend(page)
+        return rows
+
+    async def sync_recent(self):
+        """Pick up generations completed by other workers since the last sync."""
+        rows = await run_in_threadpool(self._recent_generations_sync)
+        for row in rows:
+            if (KIND_GENERATION, row["id"]) not in self.index:
+                self.add_generation(row["id"], row.get("prompt") or "")
+
+    async def _run(self):
+        await self.rebuild()
+        while True:
+            await asyncio.sleep(SEARCH_SYNC_INTERVAL)
+            try:
+                if time.time() - self.rebuilt_at > SEARCH_REBUILD_INTERVAL:
+                    await self.rebuild()
+                else:
+                    await self.sync_recent()
+            except Exception as e:
+                logger.error(f"Search index sync failed: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    # --- Queries ---
+
+    async def search(self, query: str, limit: int, kinds: Iterable[int]) -> List[Tuple[int, str, float]]:
+        return await run_in_threadpool(self.index.search, query, limit, tuple(kinds))
+
+    async def suggest(self, prefix: str, limit: int) -> List[str]:
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return await run_in_threadpool(self.index.prefix_terms, tokens[-1], limit)
+
+
+# Global instance
+search_service = SearchService()
@@ -0,0 +1,300 @@
+"""
+Sitemap Service
+Sitemap index plus XML shards of up to SITEMAP_SHARD_SIZE explore pages (the protocol
+limit is 50,000 URLs per file), oldest generations first.
+- shards are streamed to the client page by page from keyset queries, so the first byte is
+  sent before the shard is complete; the finished shard is then written to the disk cache
+  (in the threadpool)
+- shard boundaries are persisted, so new generations only ever change the newest shard:
+  it is regenerated after a generation completes (at most every SITEMAP_MIN_REFRESH
+  seconds), while full shards are served from cache for SITEMAP_FULL_TTL
+- the most recently served shards are also kept in memory
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+
+from services.supabase_client import supabase
+from utils.logger import logger
+
+SITE_URL = os.getenv("SITE_URL", "https://11flow.ai").rstrip("/")
+# The frontend rewrites /sitemap.xml and /sitemaps/* to this router (mounted under /api)
+SITEMAP_BASE_URL = os.getenv("SITEMAP_BASE_URL", SITE_URL).rstrip("/")
+# backend/var (/app/var in the container) is declared as a volume; see docker-compose.yml
+VAR_DIR = os.getenv("BACKEND_VAR_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var"))
+SITEMAP_CACHE_DIR = os.getenv("SITEMAP_CACHE_DIR", os.path.join(VAR_DIR, "sitemap_cache"))
+SITEMAP_SHARD_SIZE = min(int(os.getenv("SITEMAP_SHARD_SIZE", "50000")), 50000)
+SITEMAP_MIN_REFRESH = int(os.getenv("SITEMAP_MIN_REFRESH", "60"))
+SITEMAP_NEWEST_TTL = int(os.getenv("SITEMAP_NEWEST_TTL", "900"))
+SITEMAP_FULL_TTL = int(os.getenv("SITEMAP_FULL_TTL", "86400"))
+SITEMAP_MEMORY_SHARDS = int(os.getenv("SITEMAP_MEMORY_SHARDS", "4"))
+PAGE_SIZE = 1000
+FILE_CHUNK_SIZE = 256 * 1024
+
+XML_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = b"</urlset>\n"
+XML_MEDIA_TYPE = "application/xml"
+
+STATIC_PAGES = [("/", "daily", "1.0"), ("/explore", "daily", "0.9")]
+
+SortKey = Tuple[str, str]  # (created_at, id)
+
+
+def _public_generations(query):
+    return query.eq("status", "COMPLETED").eq("is_deleted", False).eq("is_nsfw", False).not_.is_("slug", "null")
+
+
+def _url_entry(row: dict) -> str:
+    loc = escape(f"{SITE_URL}/explore/{quote(row['slug'])}")
+    return f"<url><loc>{loc}</loc><lastmod>{str(row['created_at'])[:10]}</lastmod></url>\n"
+
+
+class SitemapService:
+    def __init__(self, cache_dir: str, shard_size: int):
+        self.cache_dir = cache_dir
+        self.shard_size = shard_size
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.manifest: Optional[dict] = None  # {"boundaries": {k: start key}, "shards": {k: meta}}
+        self.memory: "OrderedDict[int, bytes]" = OrderedDict()
+        self.locks: Dict[int, asyncio.Lock] = {}
+        self.total: Optional[int] = None
+        self.counted_at = 0.0
+        self.changed_at = 0.0  # last time a public generation was added
+
+    # --- Manifest ---
+
+    def _load_manifest(self) -> dict:
+        if self.manifest is None:
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+                # Shards written with a different size don't line up with the current boundaries
+                if self.manifest.get("shard_size") != self.shard_size:
+                    raise ValueError("shard size changed")
+            except (OSError, ValueError):
+                self.manifest = {"shard_size": self.shard_size, "boundaries": {}, "shards": {}}
+        return self.manifest
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.cache_dir, f"generations-{shard}.xml")
+
+    # --- Invalidation ---
+
+    def mark_changed(self):
+        """Called when a generation completes: the newest shard (and the shard count) are stale."""
+        self.changed_at = time.time()
+
+    # --- Queries ---
+
+    def _count_sync(self) -> int:
+        return _public_generations(supabase.table("generations").select("id", count="exact")).limit(1).execute().count or 0
+
+    async def shard_count(self) -> int:
+        age = time.time() - self.counted_at
+        if self.total is None or age > SITEMAP_NEWEST_TTL or (self.changed_at > self.counted_at and age > SITEMAP_MIN_REFRESH):
+            self.total = await run_in_threadpool(self._count_sync)
+            self.counted_at = time.time()
+        # Pinned boundaries count too: moderation can shrink the total below what the shards cover
+        pinned = max((int(k) for k in self._load_manifest()["boundaries"]), default=0)
+        return max(math.ceil(self.total / self.shard_size), pinned + 1, 1)
+
+    def _end_key(self, shard: int) -> Optional[SortKey]:
+        """Last sort key of a shard, if the next shard's start is pinned (None for the newest shard)."""
+        boundary = self._load_manifest()["boundaries"].get(str(shard + 1))
+        return (boundary[0], boundary[1]) if boundary else None
+
+    def _start_key_sync(self, shard: int) -> Optional[SortKey]:
+        """Sort key of the last URL of the previous shard (None for the first shard)."""
+        if shard == 0:
+            return None
+        boundaries = self._load_manifest()["boundaries"]
+        if str(shard) not in boundaries:
+            offset = shard * self.shard_size - 1
+            rows = _public_generations(supabase.table("generations").select("created_at, id"))\
+                .order("created_at").order("id").range(offset, offset).execute().data
+            if not rows:
+                return None
+            boundaries[str(shard)] = [rows[0]["created_at"], rows[0]["id"]]
+        created_at, generation_id = boundaries[str(shard)]
+        return created_at, generation_id
+
+    def _page_sync(self, after: Optional[SortKey], limit: int, until: Optional[SortKey] = None) -> list:
+        """Up to `limit` rows after `after`, none past `until` (inclusive end key)."""
+        query = _public_generations(supabase.table("generations").select("slug, created_at, id"))
+        if after:
+            query = query.or_(f'created_at.gt."{after[0]}",and(created_at.eq."{after[0]}",id.gt.{after[1]})')
+        if until:
+            query = query.lte("created_at", until[0])
+        rows = query.order("created_at").order("id").limit(limit).execute().data
+        if until:
+            # Same created_at as the end key: only ids up to it belong to this shard
+            rows = [row for row in rows if (str(row["created_at"]), str(row["id"])) <= (str(until[0]), str(until[1]))]
+        return rows
+
+    # --- Shards ---
+
+    def _is_fresh(self, shard: int, shard_count: int) -> bool:
+        meta = self._load_manifest()["shards"].get(str(shard))
+        if not meta or not os.path.exists(self._shard_path(shard)):
+            return False
+        age = time.time() - meta["generated_at"]
+        if meta["urls"] < self.shard_size or shard == shard_count - 1:
+            # Newest shard: changes whenever a generation completes
+            if age < SITEMAP_MIN_REFRESH:
+                return True
+            return meta["generated_at"] >= self.changed_at and age < SITEMAP_NEWEST_TTL
+        return age < SITEMAP_FULL_TTL
+
+    def _remember(self, shard: int, body: bytes):
+        self.memory[shard] = body
+        self.memory.move_to_end(shard)
+        while len(self.memory) > SITEMAP_MEMORY_SHARDS:
+            self.memory.popitem(last=False)
+
+    def _cached_response(self, shard: int) -> Response:
+        body = self.memory.get(shard)
+        if body is not None:
+            self.memory.move_to_end(shard)
+            return Response(content=body, media_type=XML_MEDIA_TYPE)
+        return FileResponse(self._shard_path(shard), media_type=XML_MEDIA_TYPE)
+
+    def _write_shard_sync(self, shard: int, body: bytes):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._shard_path(shard)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _read_chunk_sync(self, f) -> bytes:
+        return f.read(FILE_CHUNK_SIZE)
+
+    async def _stream_file(self, shard: int) -> AsyncIterator[bytes]:
+        body = self.memory.get(shard)
+        if body is not None:
+            yield body
+            return
+        f = await run_in_threadpool(open, self._shard_path(shard), "rb")
+        try:
+            while True:
+                chunk = await run_in_threadpool(self._read_chunk_sync, f)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            f.close()
+
+    async def _stream_shard(self, shard: int) -> AsyncIterator[bytes]:
+        lock = self.locks.setdefault(shard, asyncio.Lock())
+        async with lock:
+            if self._is_fresh(shard, await self.shard_count()):
+                # Generated by a concurrent request that started after shard_response checked
+                async for chunk in self._stream_file(shard):
+                    yield chunk
+                return
+
+            started_at = time.time()
+            parts = [XML_HEADER, URLSET_OPEN]
+            urls, lastmod = 0, None
+            yield XML_HEADER + URLSET_OPEN
+
+            after = await run_in_threadpool(self._start_key_sync, shard)
+            # A pinned next-shard start ends this shard even if moderation removed rows
+            until = self._end_key(shard)
+            while urls < self.shard_size:
+                limit = min(PAGE_SIZE, self.shard_size - urls)
+                rows = await run_in_threadpool(self._page_sync, after, limit, until)
+                if not rows:
+                    break
+                chunk = "".join(_url_entry(row) for row in rows).encode("utf-8")
+                parts.append(chunk)
+                yield chunk
+                urls += len(rows)
+                after = (rows[-1]["created_at"], rows[-1]["id"])
+                lastmod = str(rows[-1]["created_at"])[:10]
+                if len(rows) < limit:
+                    break
+
+            # Cache before the last chunk, so a client hanging up at the end doesn't discard the shard
+            parts.append(URLSET_CLOSE)
+            body = b"".join(parts)
+            await run_in_threadpool(self._write_shard_sync, shard, body)
+
+            manifest = self._load_manifest()
+            if urls == self.shard_size and after:
+                # Pin where the next shard starts so later inserts never shift older shards
+                manifest["boundaries"].setdefault(str(shard + 1), list(after))
+            manifest["shards"][str(shard)] = {"generated_at": started_at, "urls": urls, "lastmod": lastmod}
+            await run_in_threadpool(self._save_manifest)
+            self._remember(shard, body)
+            logger.info(f"Sitemap shard {shard} generated: {urls} URLs in {time.time() - started_at:.1f}s")
+            yield URLSET_CLOSE
+
+    async def shard_response(self, shard: int) -> Optional[Response]:
+        """Response for generations-{shard}.xml, or None if the shard doesn't exist."""
+        shard_count = await self.shard_count()
+        if shard < 0 or shard >= shard_count:
+            return None
+        if self._is_fresh(shard, shard_count):
+            return self._cached_response(shard)
+        lock = self.locks.setdefault(shard, asyncio.Lock())
+        if lock.locked():
+            # Another request is generating this shard: wait for it, then serve its result
+            async with lock:
+                pass
+            if self._is_fresh(shard, await self.shard_count()):
+                return self._cached_response(shard)
+        return StreamingResponse(self._stream_shard(shard), media_type=XML_MEDIA_TYPE)
+
+    # --- Index / static pages ---
+
+    async def index_xml(self) -> bytes:
+        shard_count = await self.shard_count()
+        shards = self._load_manifest()["shards"]
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+            f"<sitemap><loc>{escape(SITEMAP_BASE_URL)}/sitemaps/pages.xml</loc></sitemap>",
+        ]
+        for shard in range(shard_count):
+            lastmod = (shards.get(str(shard)) or {}).get("lastmod")
+            lines.append(
+                f"<sitemap><loc>{escape(SITEMAP_BASE_URL)}/sitemaps/generations-{shard}.xml</loc>"
+                + (f"<lastmod>{lastmod}</lastmod>" if lastmod else "")
+                + "</sitemap>"
+            )
+        lines.append("</sitemapindex>")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def pages_xml(self) -> bytes:
+        entries = "".join(
+            f"<url><loc>{escape(SITE_URL + path)}</loc><changefreq>{freq}</changefreq><priority>{priority}</priority></url>\n"
+            for path, freq, priority in STATIC_PAGES
+        )
+        return XML_HEADER + URLSET_OPEN + entries.encode("utf-8") + URLSET_CLOSE
+
+
+# Global instance
+sitemap_service = SitemapService(SITEMAP_CACHE_DIR, SITEMAP_SHARD_SIZE)
@@ -0,0 +1,107 @@
+"""
+Slug Page Cache
+Bounded LRU of serialized /generations/slug/{slug} responses, which back the SEO/Explore
+pages that crawlers and social previews hit repeatedly.
+- completed generations rarely change, so their page (row + author profile) is serialized
+  once, with a strong ETag derived from the bytes; entries are populated as soon as
+  process_generation_task completes a generation
+- browsers/CDN may reuse a page for SLUG_PAGE_MAX_AGE (short) and then revalidate with
+  If-None-Match, which is a 304 from this cache while the page is unchanged
+- moderation drops the entry (POST /admin/generations/{id}/invalidate-cache, called by
+  the admin moderation page); deleted generations are 404s, NSFW ones are never cached
+- unknown slugs are cached as misses for SLUG_NEGATIVE_TTL seconds
+- pending/failed generations are never cached (their page still changes)
+- entries expire after SLUG_CACHE_TTL so edits made directly in Supabase (moderation,
+  profile changes) show up without an explicit invalidation
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from services.supabase_client import supabase
+from utils.logger import logger
+
+SLUG_CACHE_SIZE = int(os.getenv("SLUG_CACHE_SIZE", "10000"))
+SLUG_CACHE_TTL = int(os.getenv("SLUG_CACHE_TTL", "300"))
+SLUG_NEGATIVE_TTL = int(os.getenv("SLUG_NEGATIVE_TTL", "60"))
+SLUG_PAGE_MAX_AGE = int(os.getenv("SLUG_PAGE_MAX_AGE", "60"))
+
+PAGE_COLUMNS = "*, profiles(username, avatar_url)"
+
+# (body, etag): body None = not found; etag None = not cacheable
+SlugPage = Tuple[Optional[bytes], Optional[str]]
+
+
+class SlugPageCache:
+    def __init__(self, max_entries: int, ttl_seconds: int, negative_ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[SlugPage, float]]" = OrderedDict()  # slug -> (page, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, slug: str) -> Optional[SlugPage]:
+        with self.lock:
+            entry = self.entries.get(slug)
+            if entry is None or entry[1] < time.time():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(slug)
+            self.hits += 1
+            return entry[0]
+
+    def _store(self, slug: str, page: SlugPage, ttl: int):
+        with self.lock:
+            self.entries[slug] = (page, time.time() + ttl)
+            self.entries.move_to_end(slug)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _page(self, slug: str, row: Optional[dict]) -> SlugPage:
+        if row is None or row.get("is_deleted"):
+            self._store(slug, (None, None), self.negative_ttl_seconds)
+            return None, None
+        # Same encoding as FastAPI's JSONResponse
+        body = json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        if row.get("status") != "COMPLETED" or row.get("is_nsfw"):
+            return body, None
+        page = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        self._store(slug, page, self.ttl_seconds)
+        return page
+
+    def load(self, slug: str) -> SlugPage:
+        """Fetch a page from Supabase (sync, run in a threadpool) and cache it if possible."""
+        res = supabase.table("generations").select(PAGE_COLUMNS).eq("slug", slug).limit(1).execute()
+        return self._page(slug, res.data[0] if res.data else None)
+
+    def populate(self, generation_id: str):
+        """Cache the page of a just-completed generation (replaces a cached miss for its slug)."""
+        try:
+            res = supabase.table("generations").select(PAGE_COLUMNS).eq("id", generation_id).limit(1).execute()
+            if res.data and res.data[0].get("slug"):
+                self._page(res.data[0]["slug"], res.data[0])
+        except Exception as e:
+            logger.error(f"Failed to cache slug page for {generation_id}: {e}")
+
+    def invalidate(self, slug: str):
+        with self.lock:
+            self.entries.pop(slug, None)
+
+    def invalidate_generation(self, generation_id: str):
+        """Drop the cached page of a generation after moderation (sync, run in a threadpool)."""
+        res = supabase.table("generations").select("slug").eq("id", generation_id).limit(1).execute()
+        if res.data and res.data[0].get("slug"):
+            self.invalidate(res.data[0]["slug"])
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Global instance
+slug_page_cache = SlugPageCache(SLUG_CACHE_SIZE, SLUG_CACHE_TTL, SLUG_NEGATIVE_TTL)
@@ -1,10 +1,16 @@
-import boto3
 import os
 import requests
+import time
 import uuid
 from fastapi import HTTPException
 
-from botocore.config import Config
+from services.metrics import r2_upload_bytes, r2_upload_duration
+from services.tracing import traced, tracer
+from services.clients import clients
+from utils.data_uri import decode_data_uri
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # R2 Configuration
 R2_ACCESS_KEY_ID = os.getenv("R2_ACCESS_KEY_ID")
@@ -17,8 +23,8 @@ R2_PUBLIC_DOMAIN = os.getenv("R2_PUBLIC_DOMAIN")
 if not R2_ACCESS_KEY_ID or not R2_SECRET_ACCESS_KEY:
     print("Warning: R2 credentials not set in environment variables")
 
-def get_s3_client():
-    
+def _create_s3_client():
+    import boto3
     return boto3.client(
         's3',
         endpoint_url=R2_ENDPOINT_URL,
@@ -27,52 +33,65 @@ def get_s3_client():
         region_name='auto' # R2 uses 'auto'
     )
 
-def upload_to_r2(file_url: str, folder: str = "generations") -> str:
+clients.register("s3", _create_s3_client)
+
+def get_s3_client():
+    # One shared client: boto3 clients are thread-safe, but building one takes tens of ms
+    return clients.get("s3")
+
+def _extension(content_type: str) -> str:
+    if "video" in content_type:
+        return "mp4"
+    if "jpeg" in content_type or "jpg" in content_type:
+        return "jpg"
+    return "png"
+
+@traced("storage.upload_to_r2")
+def upload_to_r2(file_url: str, folder: str = "generations", fallback: bool = True) -> str:
     """
     Downloads a file from a URL (or data URI) and uploads it to Cloudflare R2.
-    Returns the public URL of the uploaded file.
+    Returns the public URL of the uploaded file. On failure the original URL is returned,
+    or, with fallback=False, the error is raised (for callers that persist the URL).
     """
-    import base64
-    
+    started_at = None
     try:
         if not file_url:
             print("Error: upload_to_r2 received empty or None file_url")
             raise ValueError("file_url cannot be empty")
 
-        # 1. Handle Data URI
+        # 1. Handle Data URI (decoded in chunks into a spooled file, never as one bytes copy)
         if file_url.startswith("data:"):
             try:
-                header, encoded = file_url.split(",", 1)
-                # header example: data:image/png;base64
-                content_type = header.split(":")[1].split(";")[0]
-                file_content = base64.b64decode(encoded)
-                return upload_bytes_to_r2(file_content, content_type, folder)
+                content_type, fileobj, size = decode_data_uri(file_url)
             except Exception as e:
                 print(f"Data URI parsing failed: {e}")
                 raise e
+            with fileobj:
+                return upload_fileobj_to_r2(fileobj, content_type, folder, size)
 
         # 2. Download the file (Standard URL)
-        response = requests.get(file_url, stream=True, timeout=30)
-        response.raise_for_status()
+        started_at = time.perf_counter()
+        with tracer.span("download headers", url=file_url.split("?", 1)[0][:200]):
+            response = requests.get(file_url, stream=True, timeout=30)
+            response.raise_for_status()
         
         content_type = response.headers.get('content-type', 'image/png')
-        extension = "png"
-        if "video" in content_type:
-            extension = "mp4"
-        elif "image/jpeg" in content_type:
-            extension = "jpg"
-            
-        filename = f"{uuid.uuid4()}.{extension}"
+        filename = f"{uuid.uuid4()}.{_extension(content_type)}"
         key = f"{folder}/{filename}"
 
         # 3. Upload to R2
         s3 = get_s3_client()
-        s3.upload_fileobj(
-            response.raw,
-            R2_BUCKET_NAME,
-            key,
-            ExtraArgs={'ContentType': content_type}
-        )
+        # The body is streamed from the source straight into the multipart upload
+        with tracer.span("r2 stream upload", key=key) as span:
+            s3.upload_fileobj(
+                response.raw,
+                R2_BUCKET_NAME,
+                key,
+                ExtraArgs={'ContentType': content_type}
+            )
+            span.set_attribute("bytes", response.raw.tell())
+        r2_upload_duration.observe(time.perf_counter() - started_at, source="url", status="ok")
+        r2_upload_bytes.inc(response.raw.tell(), folder=folder)
 
         # 4. Construct Public URL
         if R2_PUBLIC_DOMAIN:
@@ -82,31 +101,44 @@ def upload_to_r2(file_url: str, folder: str = "generations") -> str:
             return f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{key}"
 
     except Exception as e:
+        if started_at is not None:
+            r2_upload_duration.observe(time.perf_counter() - started_at, source="url", status="error")
+        tracer.current().record_exception(e)
         print(f"R2 Upload Error: {e}")
+        if not fallback:
+            raise
         print(f"Falling back to original URL: {file_url}")
         # Return the original URL (which expires) so the user still gets a result
         return file_url
 
-def upload_bytes_to_r2(file_content: bytes, content_type: str, folder: str = "masks") -> str:
+@traced("storage.upload_bytes_to_r2")
+def upload_bytes_to_r2(file_content: bytes, content_type: str, folder: str = "masks", filename: str | None = None) -> str:
     """
     Uploads bytes directly to Cloudflare R2.
+    Pass `filename` for a stable (content-addressed) key; otherwise a random one is used.
     Returns the public URL of the uploaded file.
     """
     try:
-        extension = "png"
-        if "jpeg" in content_type or "jpg" in content_type:
-            extension = "jpg"
-            
-        filename = f"{uuid.uuid4()}.{extension}"
+        if not filename:
+            filename = f"{uuid.uuid4()}.{_extension(content_type)}"
+
         key = f"{folder}/{filename}"
 
+        started_at = time.perf_counter()
         s3 = get_s3_client()
-        s3.put_object(
-            Bucket=R2_BUCKET_NAME,
-            Key=key,
-            Body=file_content,
-            ContentType=content_type
-        )
+        try:
+            with tracer.span("r2 put_object", key=key, bytes=len(file_content)):
+                s3.put_object(
+                    Bucket=R2_BUCKET_NAME,
+                    Key=key,
+                    Body=file_content,
+                    ContentType=content_type
+                )
+        except Exception:
+            r2_upload_duration.observe(time.perf_counter() - started_at, source="bytes", status="error")
+            raise
+        r2_upload_duration.observe(time.perf_counter() - started_at, source="bytes", status="ok")
+        r2_upload_bytes.inc(len(file_content), folder=folder)
 
         if R2_PUBLIC_DOMAIN:
             return f"{R2_PUBLIC_DOMAIN}/{key}"
@@ -116,3 +148,46 @@ def upload_bytes_to_r2(file_content: bytes, content_type: str, folder: str = "ma
     except Exception as e:
         print(f"R2 Bytes Upload Error: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@traced("storage.upload_fileobj_to_r2")
+def upload_fileobj_to_r2(fileobj, content_type: str, folder: str = "generations", size: int | None = None) -> str:
+    """
+    Uploads a readable binary file (e.g. a spooled, decoded data URI) to Cloudflare R2.
+    boto3 reads it in parts, so the whole file is never held in memory at once.
+    Returns the public URL of the uploaded file.
+    """
+    try:
+        key = f"{folder}/{uuid.uuid4()}.{_extension(content_type)}"
+
+        started_at = time.perf_counter()
+        s3 = get_s3_client()
+        try:
+            with tracer.span("r2 upload_fileobj", key=key, bytes=size):
+                s3.upload_fileobj(fileobj, R2_BUCKET_NAME, key, ExtraArgs={'ContentType': content_type})
+        except Exception:
+            r2_upload_duration.observe(time.perf_counter() - started_at, source="file", status="error")
+            raise
+        r2_upload_duration.observe(time.perf_counter() - started_at, source="file", status="ok")
+        r2_upload_bytes.inc(size if size is not None else fileobj.tell(), folder=folder)
+
+        if R2_PUBLIC_DOMAIN:
+            return f"{R2_PUBLIC_DOMAIN}/{key}"
+        else:
+            return f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{key}"
+
+    except Exception as e:
+        logger.error(f"R2 File Upload Error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+def upload_asset_to_r2(asset, folder: str = "generations") -> str:
+    """
+    Re-hosts one provider output (providers.base.GeneratedAsset) on R2.
+    URL assets go through upload_to_r2 (falling back to the provider URL); bytes and files
+    are uploaded directly, and the file is closed afterwards.
+    """
+    if asset.file is not None:
+        with asset.file:
+            return upload_fileobj_to_r2(asset.file, asset.content_type or "image/png", folder, asset.size)
+    if asset.data is not None:
+        return upload_bytes_to_r2(asset.data, asset.content_type or "image/png", folder)
+    return upload_to_r2(asset.url, folder)
@@ -0,0 +1,170 @@
+"""
+Stripe Event Queue
+The webhook only verifies the signature, stores the event in a local SQLite queue
+and returns 200, so Stripe never times out and retries. A background worker then
+applies each event through the apply_stripe_checkout RPC, which records the event id
+and adds the credits (via create_credit_transaction) in one database transaction -
+redeliveries and concurrent events are therefore applied exactly once.
+Failed events are retried with exponential backoff and kept in the queue file
+(status 'failed') after STRIPE_QUEUE_MAX_ATTEMPTS for manual inspection; that is logged
+at ERROR and counted in the stripe_events{status="failed"} gauge on /metrics.
+The queue file lives in backend/var/, a volume in docker-compose, so events already
+acknowledged to Stripe survive redeploys.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from data.default_plans import DEFAULT_PLANS
+from services.supabase_client import supabase
+from utils.logger import logger
+
+# backend/var (/app/var in the container) is declared as a volume; see docker-compose.yml
+VAR_DIR = os.getenv("BACKEND_VAR_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var"))
+QUEUE_PATH = os.getenv("STRIPE_QUEUE_PATH", os.path.join(VAR_DIR, "stripe_event_queue.db"))
+POLL_INTERVAL = float(os.getenv("STRIPE_QUEUE_POLL_INTERVAL", "5"))
+MAX_ATTEMPTS = int(os.getenv("STRIPE_QUEUE_MAX_ATTEMPTS", "10"))
+
+HANDLED_EVENT_TYPES = {"checkout.session.completed"}
+
+
+class StripeEventQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS events (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    received_at REAL NOT NULL
+                )"""
+            )
+        return self.conn
+
+    def enqueue(self, event) -> bool:
+        """Durably store a verified event (fsync'd by SQLite before the webhook returns)."""
+        now = time.time()
+        with self.lock:
+            cursor = self._db().execute(
+                "INSERT OR IGNORE INTO events (id, type, payload, next_attempt_at, received_at) VALUES (?, ?, ?, ?, ?)",
+                (event["id"], event["type"], json.dumps(event["data"]["object"]), now, now),
+            )
+        if self.wakeup:
+            self.wakeup.set()
+        return cursor.rowcount == 1
+
+    # --- Worker ---
+
+    def _due_events(self, limit: int = 20):
+        with self.lock:
+            return self._db().execute(
+                "SELECT id, type, payload, attempts FROM events WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY received_at LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+
+    def _mark_done(self, event_id: str):
+        with self.lock:
+            self._db().execute("UPDATE events SET status = 'done', last_error = NULL WHERE id = ?", (event_id,))
+            # Keep a week of history for debugging
+            self._db().execute("DELETE FROM events WHERE status = 'done' AND received_at < ?", (time.time() - 7 * 86400,))
+
+    def _mark_failed(self, event_id: str, attempts: int, error: str):
+        status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+        next_attempt_at = time.time() + min(2 ** attempts * 5, 3600)
+        with self.lock:
+            self._db().execute(
+                "UPDATE events SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts, next_attempt_at, error[:1000], event_id),
+            )
+        if status == "failed":
+            logger.error(
+                f"Stripe event {event_id} gave up after {attempts} attempts and needs manual handling "
+                f"(status 'failed' in {self.path}): {error}"
+            )
+
+    def counts(self) -> dict:
+        """Events per status (pending/done/failed) in the queue file."""
+        with self.lock:
+            return dict(self._db().execute("SELECT status, COUNT(*) FROM events GROUP BY status").fetchall())
+
+    def _apply_checkout_sync(self, event_id: str, session: dict) -> bool:
+        metadata = session.get("metadata") or {}
+        user_id = metadata.get("user_id")
+        credits = int(metadata.get("credits", 0) or 0)
+        if not user_id or credits <= 0:
+            logger.info(f"Stripe event {event_id} has no credits to apply")
+            return False
+
+        plan_id = metadata.get("plan_id")
+        default_plan = next((p for p in DEFAULT_PLANS if p["id"] == plan_id), None)
+        res = supabase.rpc("apply_stripe_checkout", {
+            "p_event_id": event_id,
+            "p_user_id": user_id,
+            "p_credits": credits,
+            "p_payment_intent_id": session.get("payment_intent"),
+            "p_reason": f"Stripe checkout {session.get('id')}",
+            "p_plan_id": plan_id,
+            "p_tier_level": default_plan["tier_level"] if default_plan else None,
+        }).execute()
+        applied = bool(res.data)
+        if applied:
+            logger.info(f"Credits added for user {user_id}: +{credits} (event {event_id})")
+        else:
+            logger.info(f"Stripe event {event_id} was already applied")
+        return applied
+
+    async def process_due(self):
+        for event_id, event_type, payload, attempts in await run_in_threadpool(self._due_events):
+            try:
+                if event_type == "checkout.session.completed":
+                    await run_in_threadpool(self._apply_checkout_sync, event_id, json.loads(payload))
+                await run_in_threadpool(self._mark_done, event_id)
+            except Exception as e:
+                logger.error(f"Stripe event {event_id} failed (attempt {attempts + 1}): {e}")
+                await run_in_threadpool(self._mark_failed, event_id, attempts + 1, str(e))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.process_due()
+            except Exception as e:
+                logger.error(f"Stripe event worker error: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+
+# Global instance
+stripe_event_queue = StripeEventQueue(QUEUE_PATH)
@@ -1,8 +1,11 @@
 import os
+import time
 from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
+from utils.logger import get_logger
 
 load_dotenv()
+logger = get_logger(__name__)
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_SERVICE_KEY")
@@ -26,3 +29,46 @@ supabase: Client = create_client(
         storage_client_timeout=10
     )
 )
+
+
+def _instrument_postgrest(client: Client):
+    """
+    Record PostgREST call latency (supabase_request_duration_seconds) and a "supabase" trace span
+    via httpx event hooks (requests that fail before a response leave no span).
+    """
+    from services.metrics import supabase_request_duration
+    from services.tracing import tracer
+
+    def resource_of(request) -> str:
+        # /rest/v1/<table> or /rest/v1/rpc/<function>
+        path = request.url.path.split("/rest/v1/", 1)[-1].strip("/")
+        return "/".join(path.split("/")[:2]) if path.startswith("rpc/") else path.split("/")[0]
+
+    def on_request(request):
+        request.extensions["metrics_started_at"] = time.perf_counter()
+        request.extensions["trace_span"] = tracer.span(f"supabase {request.method} {resource_of(request)}")
+
+    def on_response(response):
+        started_at = response.request.extensions.get("metrics_started_at")
+        if started_at is None:
+            return
+        supabase_request_duration.observe(
+            time.perf_counter() - started_at,
+            method=response.request.method,
+            resource=resource_of(response.request),
+            status=response.status_code
+        )
+        span = response.request.extensions.get("trace_span")
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            span.finish()
+
+    try:
+        hooks = client.postgrest.session.event_hooks
+        hooks["request"].append(on_request)
+        hooks["response"].append(on_response)
+    except AttributeError as e:
+        logger.warning(f"Supabase metrics disabled: {e}")
+
+
+_instrument_postgrest(supabase)
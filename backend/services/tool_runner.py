@@ -0,0 +1,69 @@
+"""
+Tool Runner
+Executes all tool calls of a chat turn concurrently, each under its own timeout,
+and yields every result as soon as it completes (fast client-side actions are not
+held back by slow generations such as generate_fabric).
+"""
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("CHAT_TOOL_TIMEOUT", "30"))
+
+# Per-tool timeouts in seconds; tools not listed use DEFAULT_TOOL_TIMEOUT
+TOOL_TIMEOUTS: Dict[str, float] = {
+    "generate_fabric": 120,
+    "web_search": 15,
+    "generate_palette": 5,
+    "create_ai_node": 5,
+    "update_node_settings": 5,
+    "generate_content": 5,
+}
+
+ToolCall = Tuple[str, Dict[str, Any]]
+
+
+async def _run_one(
+    name: str,
+    args: Dict[str, Any],
+    execute: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+    timeout: float,
+) -> str:
+    try:
+        result = await asyncio.wait_for(execute(name, args), timeout=timeout)
+        return str(result) if result else ""
+    except asyncio.TimeoutError:
+        logger.warning(f"Tool {name} timed out after {timeout}s")
+        return f"Sorry, the {name} tool timed out."
+    except Exception as e:
+        logger.error(f"Tool {name} failed: {e}", exc_info=True)
+        return f"Sorry, the {name} tool failed."
+
+
+async def run_tool_calls(
+    calls: List[ToolCall],
+    execute: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+    timeouts: Optional[Dict[str, float]] = None,
+) -> AsyncIterator[str]:
+    """
+    Run (name, args) tool calls concurrently and yield non-empty results in completion order.
+    Pending tools are cancelled if the consumer stops early (e.g. client disconnect).
+    """
+    timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+    tasks = [
+        asyncio.create_task(_run_one(name, args, execute, timeouts.get(name, DEFAULT_TOOL_TIMEOUT)))
+        for name, args in calls
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result:
+                yield result
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
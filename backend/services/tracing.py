@@ -0,0 +1,408 @@
+"""
+Tracing
+Lightweight span tracing for the generation pipeline (API -> credits -> Supabase -> provider
+queue -> provider -> R2), without an OpenTelemetry dependency.
+- the current span lives in a contextvar, so it follows asyncio tasks, BackgroundTasks and
+  run_in_threadpool calls; spans are only recorded inside a trace started by TracingMiddleware
+- incoming W3C traceparent headers are honoured and every response carries X-Trace-Id
+- the last TRACE_BUFFER_SIZE traces are kept in memory for GET /admin/traces
+- TRACE_EXPORTER=file appends finished spans to TRACE_FILE as JSON lines; TRACE_EXPORTER=otlp
+  posts OTLP/HTTP JSON batches to TRACE_OTLP_ENDPOINT (any OTLP collector, Jaeger, Tempo...)
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))  # per trace
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")  # none | file | otlp
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "lovart-flow-api")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, name: str, trace_id: int, parent_id: Optional[int], attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"[:500]
+
+    def finish(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            tracer._finished(self)
+
+    # `with tracer.span(...)` makes the span current for the block
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        _current_span.reset(self._token)
+        self.finish()
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned outside of a (sampled) trace so call sites never need to check."""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Exporter:
+    """Background thread writing finished spans in batches (file or OTLP/HTTP JSON)."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.queue: queue.Queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def put(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + 1.0
+            while len(batch) < 512:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                if self.kind == "otlp":
+                    self._post_otlp(batch)
+                else:
+                    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                        f.write("".join(json.dumps(s.to_dict(), default=str) + "\n" for s in batch))
+            except Exception as e:
+                logger.warning(f"Trace export failed ({len(batch)} spans dropped): {e}")
+
+    def _post_otlp(self, batch: List[Span]):
+        import requests
+
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for s in batch:
+            span = {
+                "traceId": f"{s.trace_id:032x}",
+                "spanId": f"{s.span_id:016x}",
+                "name": s.name,
+                "kind": 2 if s.parent_id is None else 1,  # SERVER for request roots, INTERNAL otherwise
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [attribute(k, v) for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                span["parentSpanId"] = f"{s.parent_id:016x}"
+            spans.append(span)
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}],
+        }]}
+        requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+
+
+class Tracer:
+    def __init__(self, enabled: bool, sample_rate: float, buffer_size: int, exporter: str):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.traces: "OrderedDict[int, List[Span]]" = OrderedDict()  # trace_id -> finished spans
+        self.lock = threading.Lock()
+        self.exporter = _Exporter(exporter) if enabled and exporter in ("file", "otlp") else None
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Start a root span (not made current; use it with `with`). Honours a W3C traceparent."""
+        if not self.enabled:
+            return NOOP_SPAN
+        trace_id, parent_id = None, None
+        if traceparent:
+            parts = traceparent.split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                try:
+                    trace_id, parent_id = int(parts[1], 16), int(parts[2], 16)
+                    if not int(parts[3], 16) & 1:
+                        return NOOP_SPAN  # the caller decided not to sample
+                except ValueError:
+                    trace_id, parent_id = None, None
+        if trace_id is None:
+            if random.random() >= self.sample_rate:
+                return NOOP_SPAN
+            trace_id = random.getrandbits(128)
+        return Span(name, trace_id, parent_id, attributes)
+
+    def span(self, name: str, **attributes):
+        """
+        Child of the current span; a no-op outside of a trace. Use `with tracer.span("x"):` to make
+        it current for a block, or call .finish() yourself (callback-style hooks).
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+
+    def current(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def _finished(self, span: Span):
+        with self.lock:
+            spans = self.traces.get(span.trace_id)
+            if spans is None:
+                spans = self.traces[span.trace_id] = []
+                while len(self.traces) > self.buffer_size:
+                    self.traces.popitem(last=False)
+            if len(spans) < TRACE_MAX_SPANS:
+                spans.append(span)
+        if self.exporter:
+            self.exporter.put(span)
+
+    # --- Admin views ---
+
+    def recent(self, limit: int = 50, generation_id: Optional[str] = None) -> List[dict]:
+        with self.lock:
+            traces = list(self.traces.items())
+        summaries = []
+        for trace_id, spans in reversed(traces):
+            spans = list(spans)
+            if generation_id and not any(s.attributes.get("generation_id") == generation_id for s in spans):
+                continue
+            root = min(spans, key=lambda s: s.start_ns)
+            start, end = root.start_ns, max(s.end_ns for s in spans)
+            summaries.append({
+                "trace_id": f"{trace_id:032x}",
+                "name": root.name,
+                "started_at": start / 1e9,
+                "duration_ms": round((end - start) / 1e6, 3),
+                "spans": len(spans),
+                "errors": sum(1 for s in spans if s.error),
+            })
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def breakdown(self, trace_id: str) -> Optional[dict]:
+        """Span tree of one trace with offsets and self time (flame-graph style)."""
+        try:
+            key = int(trace_id, 16)
+        except ValueError:
+            return None
+        with self.lock:
+            spans = list(self.traces.get(key) or [])
+        if not spans:
+            return None
+
+        ids = {s.span_id for s in spans}
+        children: Dict[Optional[int], List[Span]] = {}
+        for s in spans:
+            # Parents that are still open (or remote) are treated as roots
+            children.setdefault(s.parent_id if s.parent_id in ids else None, []).append(s)
+        start = min(s.start_ns for s in spans)
+        end = max(s.end_ns for s in spans)
+
+        def node(s: Span) -> dict:
+            kids = sorted(children.get(s.span_id, []), key=lambda c: c.start_ns)
+            duration = s.end_ns - s.start_ns
+            covered = _covered_ns([(max(c.start_ns, s.start_ns), min(c.end_ns, s.end_ns)) for c in kids])
+            return {
+                "name": s.name,
+                "span_id": f"{s.span_id:016x}",
+                "offset_ms": round((s.start_ns - start) / 1e6, 3),
+                "duration_ms": round(duration / 1e6, 3),
+                "self_ms": round(max(0, duration - covered) / 1e6, 3),
+                "attributes": s.attributes,
+                "error": s.error,
+                "children": [node(c) for c in kids],
+            }
+
+        roots = sorted(children.get(None, []), key=lambda s: s.start_ns)
+        return {
+            "trace_id": f"{key:032x}",
+            "duration_ms": round((end - start) / 1e6, 3),
+            "spans": [node(r) for r in roots],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "buffered_traces": len(self.traces),
+            "exporter": self.exporter.kind if self.exporter else None,
+            "export_dropped": self.exporter.dropped if self.exporter else 0,
+        }
+
+
+def _covered_ns(intervals) -> int:
+    """Total length of the union of [start, end) intervals (children may overlap)."""
+    total, last_end = 0, None
+    for s, e in sorted(i for i in intervals if i[1] > i[0]):
+        if last_end is None or s >= last_end:
+            total += e - s
+            last_end = e
+        elif e > last_end:
+            total += e - last_end
+            last_end = e
+    return total
+
+
+def render_flame(breakdown: dict, width: int = 60) -> str:
+    """Plain-text waterfall of a breakdown: one line per span, bar positioned on the trace timeline."""
+    total = breakdown["duration_ms"] or 1.0
+    lines = [f"trace {breakdown['trace_id']}  {breakdown['duration_ms']:.1f} ms"]
+
+    def walk(node: dict, depth: int):
+        begin = int(node["offset_ms"] / total * width)
+        length = max(1, int(node["duration_ms"] / total * width))
+        bar = " " * begin + "#" * min(length, width - begin)
+        label = ("  " * depth + node["name"])[:40]
+        flag = "  !" if node["error"] else ""
+        lines.append(f"{label:<40} |{bar:<{width}}| {node['duration_ms']:>9.1f} ms (self {node['self_ms']:.1f}){flag}")
+        for child in node["children"]:
+            walk(child, depth + 1)
+
+    for root in breakdown["spans"]:
+        walk(root, 0)
+    return "\n".join(lines) + "\n"
+
+
+def traced(name: str, **attributes):
+    """Decorator: run a sync or async function inside tracer.span(name)."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """Raw ASGI middleware: one root span per HTTP request, ended when the response body is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent")
+        root = tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent.decode("latin-1") if traceparent else None,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        if root is NOOP_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", f"{root.trace_id:032x}".encode())]
+            await send(message)
+            # BackgroundTasks run after the body is sent; they stay in this trace as later children
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                _finish_root(root, scope)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _finish_root(root, scope)
+
+
+def _finish_root(root: Span, scope):
+    if root.end_ns is None:
+        route = scope.get("route")
+        if route is not None:
+            # Name by route template, e.g. "GET /api/generations/slug/{slug}"
+            root.name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        root.finish()
+
+
+# Global instance
+tracer = Tracer(TRACING_ENABLED, TRACE_SAMPLE_RATE, TRACE_BUFFER_SIZE, TRACE_EXPORTER)
@@ -0,0 +1,78 @@
+import binascii
+import os
+import re
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+
+# Decoded bytes kept in memory before the spooled file rolls over to disk
+DATA_URI_SPOOL_MAX_BYTES = int(os.getenv("DATA_URI_SPOOL_MAX_BYTES", str(1024 * 1024)))
+# Base64 characters decoded per step (multiple of 4)
+DECODE_CHUNK_CHARS = 64 * 1024
+_MAX_HEADER_CHARS = 256
+_NON_BASE64 = re.compile(r"[^A-Za-z0-9+/=]")
+
+
+def find_data_uri(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Locate the first base64 data URI in `text` without copying it.
+    Returns (start, end) offsets of the whole URI, or None.
+    """
+    begin = text.find("data:", start)
+    while begin != -1:
+        comma = text.find(",", begin, begin + _MAX_HEADER_CHARS)
+        if comma != -1 and text[begin:comma].endswith(";base64"):
+            # Searching from an offset scans the payload in place (no slice)
+            stop = _NON_BASE64.search(text, comma + 1)
+            return begin, stop.start() if stop else len(text)
+        begin = text.find("data:", begin + 5)
+    return None
+
+
+def parse_data_uri(uri: str, start: int = 0, end: Optional[int] = None) -> Tuple[str, int, int]:
+    """
+    Split the data URI at uri[start:end] into (content_type, payload_start, payload_end)
+    offsets, without slicing out the payload. Raises ValueError for non-base64 URIs.
+    """
+    end = len(uri) if end is None else end
+    if not uri.startswith("data:", start):
+        raise ValueError("Not a data URI")
+    comma = uri.find(",", start, min(end, start + _MAX_HEADER_CHARS))
+    if comma == -1:
+        raise ValueError("Malformed data URI header")
+    # header example: data:image/png;base64
+    header = uri[start + 5:comma]
+    if not header.endswith(";base64"):
+        raise ValueError("Only base64 data URIs are supported")
+    return header.split(";")[0] or "application/octet-stream", comma + 1, end
+
+
+def decode_base64_to_file(text: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+    """
+    Decode text[start:end] (base64) into a SpooledTemporaryFile positioned at 0.
+    Works in DECODE_CHUNK_CHARS steps, so memory stays at one chunk plus the spooled
+    buffer (at most DATA_URI_SPOOL_MAX_BYTES before it rolls over to disk).
+    """
+    end = len(text) if end is None else end
+    if any(text.find(ws, start, end) != -1 for ws in ("\n", "\r", " ")):
+        # Rare (MIME-wrapped) payloads: whitespace would break the 4-character alignment
+        text = "".join(text[start:end].split())
+        start, end = 0, len(text)
+    out = tempfile.SpooledTemporaryFile(max_size=DATA_URI_SPOOL_MAX_BYTES)
+    try:
+        for offset in range(start, end, DECODE_CHUNK_CHARS):
+            out.write(binascii.a2b_base64(text[offset:min(offset + DECODE_CHUNK_CHARS, end)]))
+    except binascii.Error:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def decode_data_uri(uri: str, start: int = 0, end: Optional[int] = None) -> Tuple[str, BinaryIO, int]:
+    """Decode a base64 data URI into (content_type, spooled file, size in bytes)."""
+    content_type, payload_start, payload_end = parse_data_uri(uri, start, end)
+    fileobj = decode_base64_to_file(uri, payload_start, payload_end)
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return content_type, fileobj, size
@@ -0,0 +1,16 @@
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def not_modified(request: Request, response: Response, etag: str, cache_control: str = "no-cache") -> Optional[Response]:
+    """
+    Conditional GET helper. Returns a 304 response if the client's If-None-Match matches,
+    otherwise sets ETag/Cache-Control on the outgoing response and returns None.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
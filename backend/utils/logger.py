@@ -1,15 +1,152 @@
+"""
+Logging
+Non-blocking, structured logging for the whole backend.
+- callers only format the record and put it on a bounded queue (records are dropped
+  and counted if it is full); a listener thread does the console/file I/O, flushing
+  once per burst instead of once per record
+- backend.log is written as JSON lines; fields passed via extra={...} become keys
+- LOG_LEVELS sets levels per module, e.g. "routers.chat=DEBUG,services.openrouter_service=WARNING"
+- LOG_SAMPLING keeps a fraction of a module's records below WARNING, e.g. "routers.chat=0.1"
+Modules log through get_logger(__name__) so these settings can target them.
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+from datetime import datetime, timezone
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("backend.log")
-    ]
-)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "backend.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # console format: text | json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _parse_pairs(value: str) -> dict:
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING for the configured logger prefixes."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in rates.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition(".")[0]
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here (args/exc_info may not survive the thread hop)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DeferredFlush:
+    """Handler mixin: don't flush per record; the listener flushes once the queue is drained."""
+
+    def flush(self):
+        pass
+
+    def flush_pending(self):
+        super().flush()
+
+
+class BufferedStreamHandler(_DeferredFlush, logging.StreamHandler):
+    pass
+
+
+class BufferedFileHandler(_DeferredFlush, logging.FileHandler):
+    pass
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block: bool):
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush_pending()
+        return self.queue.get(block)
+
+
+def _setup():
+    console = BufferedStreamHandler(sys.stdout)
+    console.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if LOG_FILE:
+        file_handler = BufferedFileHandler(LOG_FILE, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(_parse_pairs(os.getenv("LOG_SAMPLING", ""))))
+    listener = BatchingQueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_pairs(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level.upper())
+    return queue_handler, listener
+
+
+queue_handler, queue_listener = _setup()
 
 
 def get_logger(name: str):
@@ -11,6 +11,15 @@ const nextConfig: NextConfig = {
         source: '/api/:path*',
         destination: 'http://127.0.0.1:8000/api/:path*',
       },
+      // Sharded sitemap index and shards are generated by the backend
+      {
+        source: '/sitemap.xml',
+        destination: 'http://127.0.0.1:8000/api/sitemap.xml',
+      },
+      {
+        source: '/sitemaps/:path*',
+        destination: 'http://127.0.0.1:8000/api/sitemaps/:path*',
+      },
     ]
   },
   images: {
@@ -104,6 +104,19 @@ export default function ModerationPage() {
         return true;
     });
 
+    // The backend caches public generation pages; drop the entry so the change shows right away
+    const invalidatePageCache = async (generationId: string) => {
+        try {
+            const { data: { user } } = await supabase.auth.getUser();
+            if (!user) return;
+            await fetch(`/api/admin/generations/${generationId}/invalidate-cache?admin_id=${user.id}`, {
+                method: "POST",
+            });
+        } catch (error) {
+            console.warn("Failed to invalidate generation page cache", error);
+        }
+    };
+
     const handleBlur = async (generationId: string, currentStatus: boolean) => {
         try {
             const { error } = await supabase
@@ -119,6 +132,7 @@ export default function ModerationPage() {
                 throw error;
             }
 
+            await invalidatePageCache(generationId);
             toast.success(currentStatus ? "Content unblurred" : "Content blurred");
             refetch();
         } catch (error: any) {
@@ -144,6 +158,7 @@ export default function ModerationPage() {
                 throw error;
             }
 
+            await invalidatePageCache(deleteId);
             toast.success("Content deleted");
             refetch();
             setDeleteId(null);
@@ -11,6 +11,7 @@ import { Textarea } from "@/components/ui/textarea";
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from "@/components/ui/dialog";
 import { Label } from "@/components/ui/label";
 import { useToast } from "@/hooks/use-toast";
+import { authFetch } from "@/utils/authFetch";
 // import Image from "next/image";
 
 // Types
@@ -146,7 +147,7 @@ export default function PromptsAdminPage() {
             const formData = new FormData();
             formData.append("file", file);
 
-            const response = await fetch("/api/upload/media", {
+            const response = await authFetch("/api/upload/media", {
                 method: "POST",
                 body: formData,
             });
@@ -15,6 +15,7 @@ import {
     PopoverContent,
     PopoverTrigger,
 } from "@/components/ui/popover";
+import { authFetch } from "@/utils/authFetch";
 
 const EXAMPLE_PROMPTS = [
     "A futuristic fashion concept featuring bioluminescent fabrics in a cyberpunk setting",
@@ -83,7 +84,7 @@ export default function ChatInput() {
         if (!input.trim()) return;
         setIsRefining(true);
         try {
-            const res = await fetch("/api/chat/refine", {
+            const res = await authFetch("/api/chat/refine", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ prompt: input })
@@ -114,7 +115,7 @@ export default function ChatInput() {
                 const blob = await res.blob();
                 formData.append("file", blob, "image.png");
 
-                const uploadRes = await fetch("/api/upload/image", {
+                const uploadRes = await authFetch("/api/upload/image", {
                     method: "POST",
                     body: formData,
                 });
@@ -0,0 +1,14 @@
+import { MetadataRoute } from "next";
+
+export default function robots(): MetadataRoute.Robots {
+    const baseUrl = "https://11flow.ai"; // Replace with actual domain
+
+    return {
+        rules: {
+            userAgent: "*",
+            allow: "/",
+        },
+        // Sitemap index served by the backend (see the rewrites in next.config.ts)
+        sitemap: `${baseUrl}/sitemap.xml`,
+    };
+}
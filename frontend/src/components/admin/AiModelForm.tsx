@@ -22,6 +22,7 @@ import { toast } from "sonner";
 import { validateParametersSchema } from "@/lib/validations/ai-model-schema";
 import { Upload, X } from "lucide-react";
 import { createClient } from "@/utils/supabase/client";
+import { authFetch } from "@/utils/authFetch";
 
 interface AiModelFormProps {
     record?: any;
@@ -216,7 +217,7 @@ export function AiModelForm({ record, onClose, onSuccess }: AiModelFormProps) {
             const uploadFormData = new FormData();
             uploadFormData.append("file", file);
 
-            const response = await fetch("/api/upload/avatar", {
+            const response = await authFetch("/api/upload/avatar", {
                 method: "POST",
                 body: uploadFormData,
             });
@@ -12,6 +12,7 @@ import { useTranslations } from "next-intl";
 import { createClient } from "@/utils/supabase/client";
 import { toast } from "sonner";
 import { useRouter } from "next/navigation";
+import { authFetch } from "@/utils/authFetch";
 
 interface AccountSettingsDialogProps {
     open: boolean;
@@ -119,7 +120,7 @@ export default function AccountSettingsDialog({ open, onOpenChange }: AccountSet
             const formData = new FormData();
             formData.append('file', file);
 
-            const response = await fetch(`/api/upload/avatar`, {
+            const response = await authFetch(`/api/upload/avatar`, {
                 method: 'POST',
                 body: formData,
             });
@@ -35,6 +35,7 @@ import { useState, useEffect, useRef } from "react";
 import { useTranslations } from "next-intl";
 import { createClient } from "@/utils/supabase/client";
 import { toast } from "sonner";
+import { authFetch } from "@/utils/authFetch";
 
 export function ImageToolbar() {
     const editor = useEditor();
@@ -125,7 +126,7 @@ export function ImageToolbar() {
                 return;
             }
 
-            const response = await fetch(`/api/generate/${endpoint}`, {
+            const response = await authFetch(`/api/generate/${endpoint}`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -254,7 +255,7 @@ export function ImageToolbar() {
             const formData = new FormData();
             formData.append("file", blob);
 
-            const uploadResponse = await fetch("/api/generate/upload/mask", {
+            const uploadResponse = await authFetch("/api/generate/upload/mask", {
                 method: "POST",
                 body: formData
             });
@@ -263,7 +264,7 @@ export function ImageToolbar() {
             const { url: maskUrl } = await uploadResponse.json();
 
             // 2. Call Inpaint API
-            const response = await fetch(`/api/generate/inpaint`, {
+            const response = await authFetch(`/api/generate/inpaint`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -319,7 +320,7 @@ export function ImageToolbar() {
                 return;
             }
 
-            const response = await fetch(`/api/generate/edit`, {
+            const response = await authFetch(`/api/generate/edit`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -375,7 +376,7 @@ export function ImageToolbar() {
                 return;
             }
 
-            const response = await fetch(`/api/generate/mockup`, {
+            const response = await authFetch(`/api/generate/mockup`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -430,7 +431,7 @@ export function ImageToolbar() {
                 return;
             }
 
-            const response = await fetch(`/api/generate/expand`, {
+            const response = await authFetch(`/api/generate/expand`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -19,6 +19,7 @@ import { useTranslations } from "next-intl";
 import { Skeleton } from "@/components/ui/skeleton";
 import { uploadImage } from "@/utils/upload";
 import { useCheckCredits } from "@/hooks/useCheckCredits";
+import { authFetch } from "@/utils/authFetch";
 
 const stopPropagation = (e: React.SyntheticEvent) => {
     e.stopPropagation();
@@ -173,7 +174,7 @@ export function ImageGeneratorNode({ id, selected, data, onGenerate, onUpdateRef
         if (!prompt || isRefining) return;
         setIsRefining(true);
         try {
-            const res = await fetch("/api/chat/refine", {
+            const res = await authFetch("/api/chat/refine", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ prompt }),
@@ -20,6 +20,7 @@ import { VideoSettingsPopover } from "./VideoSettingsPopover";
 import { DynamicForm } from "./DynamicForm";
 import { uploadImage } from "@/utils/upload";
 import { useCheckCredits } from "@/hooks/useCheckCredits";
+import { authFetch } from "@/utils/authFetch";
 
 const stopPropagation = (e: React.SyntheticEvent) => {
     e.stopPropagation();
@@ -65,7 +66,7 @@ export function VideoGeneratorNode({ id, selected, data, onGenerate, onUpdateRef
         if (!prompt || isRefining) return;
         setIsRefining(true);
         try {
-            const res = await fetch("/api/chat/refine", {
+            const res = await authFetch("/api/chat/refine", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ prompt }),
@@ -14,6 +14,7 @@ import { VideoGeneratorNode } from "@/components/canvas/nodes/VideoGeneratorNode
 import { useEffect, useRef } from "react";
 import { createClient } from "@/utils/supabase/client";
 import { useProject } from "@/contexts/ProjectContext";
+import { authFetch } from "@/utils/authFetch";
 
 export type ReferenceImage = {
     id: string;
@@ -346,7 +347,7 @@ const AiNodeContent = ({ shape }: { shape: IAiNodeShape }) => {
             console.log("[AiNodeShape] Sending generation payload:", payload);
             console.log("[AiNodeShape] About to send fetch request to /api/generate");
 
-            const response = await fetch("/api/generate", {
+            const response = await authFetch("/api/generate", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -16,6 +16,7 @@ import { ChatArea } from "./sidebar/ChatArea";
 import { InputIsland } from "./sidebar/InputIsland";
 import { ModelConfig } from "./sidebar/ModelConfig";
 import { useCheckCredits } from "@/hooks/useCheckCredits";
+import { authFetch } from "@/utils/authFetch";
 
 interface LovartSidebarProps {
     isOpen: boolean;
@@ -82,6 +83,7 @@ export default function LovartSidebar({ isOpen, onToggle, initialPrompt, initial
 
     const { messages, append, isLoading, setMessages, reload } = useChat({
         api: "/api/chat",
+        fetch: authFetch,
         body: {
             model: selectedChatModel,            // The Brain
             preferredImageModel: selectedImageModel, // The Hand (Image)
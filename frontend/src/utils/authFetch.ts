@@ -0,0 +1,17 @@
+import { createClient } from "@/utils/supabase/client";
+
+/**
+ * fetch() that sends the signed-in user's Supabase access token.
+ * The backend rate limits by account (and plan tier) when it can verify the token,
+ * and by IP otherwise - so calls to /api/generate, /api/chat and /api/upload go through here.
+ */
+export async function authFetch(input: RequestInfo | URL, init: RequestInit = {}): Promise<Response> {
+    const headers = new Headers(init.headers);
+    if (!headers.has("Authorization")) {
+        const { data: { session } } = await createClient().auth.getSession();
+        if (session?.access_token) {
+            headers.set("Authorization", `Bearer ${session.access_token}`);
+        }
+    }
+    return fetch(input, { ...init, headers });
+}
@@ -1,8 +1,10 @@
+import { authFetch } from './authFetch';
+
 export async function uploadImage(file: File): Promise<string> {
     const formData = new FormData();
     formData.append('file', file);
 
-    const response = await fetch('/api/upload/image', {
+    const response = await authFetch('/api/upload/image', {
         method: 'POST',
         body: formData,
     });
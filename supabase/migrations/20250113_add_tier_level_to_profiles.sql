@@ -0,0 +1,7 @@
+-- Add plan tier to profiles (0: Free, 1: Basic, 2: Pro, 3: Ultimate, ...)
+-- Used by the generation scheduler to weight fair queuing between users
+ALTER TABLE public.profiles 
+ADD COLUMN IF NOT EXISTS tier_level INTEGER DEFAULT 0;
+
+-- Existing pro users start at the first paid tier
+UPDATE public.profiles SET tier_level = 1 WHERE is_pro = true AND (tier_level IS NULL OR tier_level = 0);
@@ -0,0 +1,164 @@
+-- Migration: Credit reservations (reserve -> commit / release)
+-- Credits are held when a generation is submitted, written to credit_transactions
+-- as GENERATION when it completes, and returned automatically when it fails.
+
+-- ============================================
+-- 1. Credit Reservations Table
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.credit_reservations (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id UUID NOT NULL REFERENCES public.profiles(id) ON DELETE CASCADE,
+  amount INTEGER NOT NULL CHECK (amount >= 0),
+  status TEXT NOT NULL DEFAULT 'RESERVED' CHECK (status IN ('RESERVED', 'COMMITTED', 'RELEASED')),
+  reason TEXT,
+  release_reason TEXT,
+  generation_id UUID REFERENCES public.generations(id) ON DELETE SET NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+  settled_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_credit_reservations_user_id ON public.credit_reservations(user_id);
+CREATE INDEX IF NOT EXISTS idx_credit_reservations_reserved ON public.credit_reservations(created_at) WHERE status = 'RESERVED';
+
+ALTER TABLE public.credit_reservations ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own reservations" ON public.credit_reservations;
+CREATE POLICY "Users can view own reservations" ON public.credit_reservations
+  FOR SELECT USING (auth.uid() = user_id);
+
+-- ============================================
+-- 2. Reserve: atomically check balance and hold credits
+-- ============================================
+CREATE OR REPLACE FUNCTION public.reserve_user_credits(
+  p_user_id UUID,
+  p_amount INTEGER,
+  p_reason TEXT DEFAULT NULL,
+  p_generation_id UUID DEFAULT NULL
+)
+RETURNS UUID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_reservation_id UUID;
+BEGIN
+  -- Single conditional UPDATE, so concurrent requests cannot overdraw the balance
+  UPDATE public.profiles
+  SET credits = credits - p_amount
+  WHERE id = p_user_id AND credits >= p_amount;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Insufficient credits';
+  END IF;
+
+  INSERT INTO public.credit_reservations (user_id, amount, reason, generation_id)
+  VALUES (p_user_id, p_amount, p_reason, p_generation_id)
+  RETURNING id INTO v_reservation_id;
+
+  RETURN v_reservation_id;
+END;
+$$;
+
+-- ============================================
+-- 3. Commit: batch of reservations -> GENERATION transactions
+-- p_commits: [{"reservation_id": "...", "generation_id": "..." | null}, ...]
+-- ============================================
+CREATE OR REPLACE FUNCTION public.commit_credit_reservations(p_commits JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_item JSONB;
+  v_reservation RECORD;
+  v_balance INTEGER;
+  v_count INTEGER := 0;
+BEGIN
+  FOR v_item IN SELECT * FROM jsonb_array_elements(p_commits) LOOP
+    UPDATE public.credit_reservations
+    SET status = 'COMMITTED',
+        settled_at = NOW(),
+        generation_id = COALESCE((v_item->>'generation_id')::UUID, generation_id)
+    WHERE id = (v_item->>'reservation_id')::UUID AND status = 'RESERVED'
+    RETURNING * INTO v_reservation;
+
+    IF FOUND THEN
+      -- Credits were already taken at reserve time, so the balance is unchanged here
+      SELECT credits INTO v_balance FROM public.profiles WHERE id = v_reservation.user_id;
+
+      INSERT INTO public.credit_transactions (
+        user_id, type, amount, balance_after, reason, related_generation_id
+      ) VALUES (
+        v_reservation.user_id, 'GENERATION', -v_reservation.amount, v_balance,
+        v_reservation.reason, v_reservation.generation_id
+      );
+      v_count := v_count + 1;
+    END IF;
+  END LOOP;
+
+  RETURN v_count;
+END;
+$$;
+
+-- ============================================
+-- 4. Release: give held credits back (failed generation)
+-- ============================================
+CREATE OR REPLACE FUNCTION public.release_credit_reservation(
+  p_reservation_id UUID,
+  p_reason TEXT DEFAULT NULL
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_user_id UUID;
+  v_amount INTEGER;
+BEGIN
+  UPDATE public.credit_reservations
+  SET status = 'RELEASED', settled_at = NOW(), release_reason = p_reason
+  WHERE id = p_reservation_id AND status = 'RESERVED'
+  RETURNING user_id, amount INTO v_user_id, v_amount;
+
+  IF NOT FOUND THEN
+    RETURN FALSE;
+  END IF;
+
+  UPDATE public.profiles SET credits = credits + v_amount WHERE id = v_user_id;
+  RETURN TRUE;
+END;
+$$;
+
+-- ============================================
+-- 5. Release reservations that were never settled (e.g. worker crashed)
+-- ============================================
+CREATE OR REPLACE FUNCTION public.release_expired_credit_reservations(p_max_age_seconds INTEGER)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  WITH expired AS (
+    UPDATE public.credit_reservations
+    SET status = 'RELEASED', settled_at = NOW(), release_reason = 'Expired'
+    WHERE status = 'RESERVED' AND created_at < NOW() - make_interval(secs => p_max_age_seconds)
+    RETURNING user_id, amount
+  ), totals AS (
+    SELECT user_id, SUM(amount) AS amount FROM expired GROUP BY user_id
+  )
+  UPDATE public.profiles p
+  SET credits = p.credits + t.amount
+  FROM totals t
+  WHERE p.id = t.user_id;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.reserve_user_credits TO service_role;
+GRANT EXECUTE ON FUNCTION public.commit_credit_reservations TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_credit_reservation TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_expired_credit_reservations TO service_role;
@@ -0,0 +1,119 @@
+-- Migration: Idempotent Stripe webhook processing
+-- Every processed Stripe event id is recorded, and credits are applied in the same
+-- transaction, so retries and concurrent deliveries can never double-apply or lose credits.
+
+-- ============================================
+-- 1. Processed Stripe Events
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.stripe_events (
+  id TEXT PRIMARY KEY, -- Stripe event id (evt_...)
+  type TEXT NOT NULL,
+  user_id UUID REFERENCES public.profiles(id) ON DELETE SET NULL,
+  credits INTEGER,
+  transaction_id UUID REFERENCES public.credit_transactions(id) ON DELETE SET NULL,
+  processed_at TIMESTAMPTZ DEFAULT NOW() NOT NULL
+);
+
+ALTER TABLE public.stripe_events ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- 2. create_credit_transaction: update the balance atomically
+-- (same signature; the old version read the balance and wrote it back, which lost
+-- updates when two transactions for one user ran concurrently)
+-- ============================================
+CREATE OR REPLACE FUNCTION public.create_credit_transaction(
+  p_user_id UUID,
+  p_type TEXT,
+  p_amount INTEGER,
+  p_reason TEXT DEFAULT NULL,
+  p_generation_id UUID DEFAULT NULL,
+  p_admin_id UUID DEFAULT NULL,
+  p_stripe_payment_intent_id TEXT DEFAULT NULL
+)
+RETURNS UUID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_transaction_id UUID;
+  v_balance_after INTEGER;
+BEGIN
+  UPDATE public.profiles
+  SET credits = COALESCE(credits, 0) + p_amount
+  WHERE id = p_user_id
+  RETURNING credits INTO v_balance_after;
+
+  INSERT INTO public.credit_transactions (
+    user_id,
+    type,
+    amount,
+    balance_after,
+    reason,
+    related_generation_id,
+    admin_id,
+    stripe_payment_intent_id
+  ) VALUES (
+    p_user_id,
+    p_type,
+    p_amount,
+    v_balance_after,
+    p_reason,
+    p_generation_id,
+    p_admin_id,
+    p_stripe_payment_intent_id
+  )
+  RETURNING id INTO v_transaction_id;
+
+  RETURN v_transaction_id;
+END;
+$$;
+
+-- ============================================
+-- 3. Apply a checkout.session.completed event exactly once
+-- Returns FALSE if the event was already processed.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.apply_stripe_checkout(
+  p_event_id TEXT,
+  p_user_id UUID,
+  p_credits INTEGER,
+  p_payment_intent_id TEXT DEFAULT NULL,
+  p_reason TEXT DEFAULT NULL,
+  p_plan_id TEXT DEFAULT NULL,
+  p_tier_level INTEGER DEFAULT NULL
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_transaction_id UUID;
+  v_tier_level INTEGER;
+BEGIN
+  INSERT INTO public.stripe_events (id, type, user_id, credits)
+  VALUES (p_event_id, 'checkout.session.completed', p_user_id, p_credits)
+  ON CONFLICT (id) DO NOTHING;
+
+  IF NOT FOUND THEN
+    RETURN FALSE;
+  END IF;
+
+  v_transaction_id := public.create_credit_transaction(
+    p_user_id, 'PURCHASE', p_credits, p_reason, NULL, NULL, p_payment_intent_id
+  );
+
+  UPDATE public.stripe_events SET transaction_id = v_transaction_id WHERE id = p_event_id;
+
+  -- Record the purchased plan tier (used for fair scheduling and rate limits)
+  SELECT tier_level INTO v_tier_level FROM public.subscription_plans WHERE id::TEXT = p_plan_id;
+  v_tier_level := COALESCE(v_tier_level, p_tier_level);
+  IF v_tier_level IS NOT NULL THEN
+    UPDATE public.profiles
+    SET tier_level = GREATEST(COALESCE(tier_level, 0), v_tier_level)
+    WHERE id = p_user_id;
+  END IF;
+
+  RETURN TRUE;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.apply_stripe_checkout TO service_role;
@@ -0,0 +1,16 @@
+-- Migration: Structured generation results
+-- Providers now return every output of a call with its metadata (see providers/base.py).
+-- result_url keeps the first output for existing readers.
+--   outputs:         [{"url", "content_type", "width", "height", "seed", "nsfw", "duration"}, ...]
+--   result_metadata: {"provider", "model", "seed", "request_id", "timings": {"total", "inference", ...}}
+
+ALTER TABLE public.generations
+ADD COLUMN IF NOT EXISTS outputs JSONB DEFAULT '[]'::jsonb;
+
+ALTER TABLE public.generations
+ADD COLUMN IF NOT EXISTS result_metadata JSONB DEFAULT '{}'::jsonb;
+
+-- Look up earlier generations by seed (e.g. to reuse a result for the same prompt + seed)
+CREATE INDEX IF NOT EXISTS idx_generations_result_seed
+ON public.generations (((result_metadata->>'seed')))
+WHERE result_metadata ? 'seed';
@@ -0,0 +1,14 @@
+-- Migration: Per-model request adapters
+-- Declares how a model takes its inputs, compiled once per model version by
+-- backend/services/model_adapters.py (cached by id + updated_at).
+-- NULL keeps the preset picked from provider/type/api_path.
+--   preset:       fal_image | fal_image_multi_ref | fal_video | fal_kling_video
+--                 | replicate_image | replicate_video | passthrough
+--   aspect_ratio: fal_image_size | aspect_ratio | none
+--   duration:     passthrough | seconds | seconds_string | none
+--   references:   {"mode": "single" | "list" | "start_end", "key", "start_key", "end_key", "max", "required"}
+--   num_images, max_images, defaults, rename, endpoint, text_endpoint
+-- Example: {"preset": "fal_image_multi_ref", "references": {"mode": "list", "key": "image_urls", "max": 4}}
+
+ALTER TABLE public.ai_models
+ADD COLUMN IF NOT EXISTS adapter JSONB;
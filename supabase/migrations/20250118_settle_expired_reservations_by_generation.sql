@@ -0,0 +1,71 @@
+-- Migration: Settle expired credit reservations by generation status
+-- Commits are queued in memory and written in batches, so a crash can lose them after
+-- the generation was already marked COMPLETED. The sweep used to release every expired
+-- RESERVED row, refunding completed work. It now looks at the linked generation:
+--   COMPLETED                         -> COMMITTED (GENERATION transaction, like a normal commit)
+--   FAILED, still PENDING, or missing -> RELEASED (credits returned; stale PENDING is marked FAILED)
+-- /generate links each reservation to its generation right after the record is created.
+
+DROP FUNCTION IF EXISTS public.release_expired_credit_reservations(INTEGER);
+
+CREATE OR REPLACE FUNCTION public.release_expired_credit_reservations(p_max_age_seconds INTEGER)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_cutoff TIMESTAMPTZ := NOW() - make_interval(secs => p_max_age_seconds);
+  v_committed INTEGER;
+  v_released INTEGER;
+BEGIN
+  -- 1. Completed generations whose commit never reached the database
+  WITH completed AS (
+    UPDATE public.credit_reservations r
+    SET status = 'COMMITTED', settled_at = NOW()
+    FROM public.generations g
+    WHERE r.status = 'RESERVED'
+      AND r.created_at < v_cutoff
+      AND g.id = r.generation_id
+      AND g.status = 'COMPLETED'
+    RETURNING r.user_id, r.amount, r.reason, r.generation_id
+  )
+  INSERT INTO public.credit_transactions (
+    user_id, type, amount, balance_after, reason, related_generation_id
+  )
+  SELECT c.user_id, 'GENERATION', -c.amount, p.credits, c.reason, c.generation_id
+  FROM completed c
+  JOIN public.profiles p ON p.id = c.user_id;
+
+  GET DIAGNOSTICS v_committed = ROW_COUNT;
+
+  -- 2. Generations that never finished: the worker is gone, so they won't complete now
+  UPDATE public.generations g
+  SET status = 'FAILED'
+  FROM public.credit_reservations r
+  WHERE r.status = 'RESERVED'
+    AND r.created_at < v_cutoff
+    AND g.id = r.generation_id
+    AND g.status NOT IN ('COMPLETED', 'FAILED');
+
+  -- 3. Everything left (failed or missing generation) is returned to the user
+  WITH expired AS (
+    UPDATE public.credit_reservations
+    SET status = 'RELEASED', settled_at = NOW(), release_reason = 'Expired'
+    WHERE status = 'RESERVED' AND created_at < v_cutoff
+    RETURNING user_id, amount
+  ), totals AS (
+    SELECT user_id, SUM(amount) AS amount, COUNT(*) AS reservations FROM expired GROUP BY user_id
+  ), refunded AS (
+    UPDATE public.profiles p
+    SET credits = p.credits + t.amount
+    FROM totals t
+    WHERE p.id = t.user_id
+    RETURNING t.reservations
+  )
+  SELECT COALESCE(SUM(reservations), 0) INTO v_released FROM refunded;
+
+  RETURN jsonb_build_object('committed', v_committed, 'released', v_released);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.release_expired_credit_reservations TO service_role;
@@ -0,0 +1,43 @@
+-- Migration: Validate ai_models.adapter on write
+-- The admin panel writes ai_models directly through Supabase, so POST /admin/models is not
+-- the only writer. This check mirrors ModelAdapter._check_spec in
+-- backend/services/model_adapters.py: a bad spec is rejected when it is saved instead of
+-- failing the first /generate for that model. Keep both lists in sync.
+
+CREATE OR REPLACE FUNCTION public.ai_model_adapter_is_valid(p_adapter JSONB)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT COALESCE(
+    p_adapter IS NULL
+    OR jsonb_typeof(p_adapter) = 'null'
+    OR (
+      jsonb_typeof(p_adapter) = 'object'
+      -- Missing/empty preset: picked from provider/type/api_path
+      AND COALESCE(p_adapter->>'preset', '') IN (
+        '', 'fal_image', 'fal_image_multi_ref', 'fal_video', 'fal_kling_video',
+        'replicate_image', 'replicate_video', 'passthrough'
+      )
+      AND (NOT p_adapter ? 'aspect_ratio' OR p_adapter->>'aspect_ratio' IN ('fal_image_size', 'aspect_ratio', 'none'))
+      AND (NOT p_adapter ? 'resolution' OR p_adapter->>'resolution' IN ('image_size', 'none'))
+      AND (NOT p_adapter ? 'duration' OR p_adapter->>'duration' IN ('passthrough', 'seconds', 'seconds_string', 'none'))
+      AND (
+        NOT p_adapter ? 'references'
+        OR jsonb_typeof(p_adapter->'references') = 'null'
+        OR p_adapter->'references' = '{}'::jsonb
+        OR (
+          jsonb_typeof(p_adapter->'references') = 'object'
+          AND p_adapter->'references'->>'mode' IN ('single', 'list', 'start_end')
+        )
+      )
+    ),
+    FALSE
+  );
+$$;
+
+-- NOT VALID: only new writes are checked; existing rows are compiled (and reported) by the backend
+ALTER TABLE public.ai_models
+DROP CONSTRAINT IF EXISTS ai_models_adapter_valid;
+ALTER TABLE public.ai_models
+ADD CONSTRAINT ai_models_adapter_valid CHECK (public.ai_model_adapter_is_valid(adapter)) NOT VALID;